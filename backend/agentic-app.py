@@ -1,85 +1,285 @@
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
 from werkzeug.utils import secure_filename
-from langchain_openai import ChatOpenAI  # finetuned model for SQL generation
 from langchain_community.utilities import SQLDatabase
 from langgraph.graph import StateGraph, END
 import ast
+import csv
+import sqlite3
 from typing import TypedDict, List, Optional, Dict
 from sqlalchemy import text
 from dotenv import load_dotenv
 import logging
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functions.graph_registry import GraphRegistry
+from functions.schema_cache import SchemaCache
+from functions.asgi import create_asgi_app
+from functions.db_registry import DatabaseEntry, DatabaseRegistry
+from functions.sqlite_engine import QueryCancelled, QueryLimitExceeded, ReadOnlyEngine, pragmas_from_env
+from functions.metrics import InstrumentedStateGraph, LLMMetricsCallback, Metrics
+from functions.tracing import StateTracer, short_hash
+from functions.sql_repair import SqlRepairer
+from functions.index_advisor import IndexAdvisor
+from functions.rollups import ROLLUP_SCHEMA, RollupSet
+from functions.ingest import ingest_extensions, ingest_file
+from functions.upload_store import InvalidDatabase, UploadStore
+from functions.schema_linking import SchemaLinker
+from functions.value_index import ValueIndex
+from functions.example_store import ExampleStore, schema_signature
+from functions.candidates import race, race_async
+from functions.complexity import refinement_reason
+from functions.explanations import ExplanationJobs
+from functions.llm_provider import chat_model, embedder, llm_settings_from_env
+from functions.prompt_builder import PROMPT_VERSION, assemble, build_prefix, prefix_hash
+from functions.history import HistoryManager, as_message, count_tokens, drop_retry_errors
+from functions.result_format import ARROW_MIME_TYPE, encode_arrow, encode_result, negotiate_format
+from functions.result_stream import sse
+from urllib.parse import quote
 
 load_dotenv(override=True)
 
 app = Flask(__name__)
 CORS(app)
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['ALLOWED_EXTENSIONS'] = {'db'}
+# CSV/TSV (and Parquet, with pyarrow) uploads are loaded into a new SQLite database.
+app.config['ALLOWED_EXTENSIONS'] = {'db'} | ingest_extensions()
+app.config['DB_EXECUTOR_WORKERS'] = int(os.getenv('DB_EXECUTOR_WORKERS', 8))
+app.config['MAX_DATABASES'] = int(os.getenv('MAX_DATABASES', 16))
+app.config['DATABASE_MEMORY_BUDGET_MB'] = int(os.getenv('DATABASE_MEMORY_BUDGET_MB', 2048))
+app.config['SQLITE_POOL_SIZE'] = int(os.getenv('SQLITE_POOL_SIZE', 8))
+app.config['SQLITE_PRAGMAS'] = pragmas_from_env()
+# Server-side caps on what a single generated query may return.
+app.config['MAX_RESULT_ROWS'] = int(os.getenv('MAX_RESULT_ROWS', 10000))
+# Execution guardrails for generated SQL (0 disables a limit).
+app.config['QUERY_TIMEOUT_SECONDS'] = float(os.getenv('QUERY_TIMEOUT_SECONDS', 10))
+app.config['QUERY_MAX_VM_STEPS'] = int(os.getenv('QUERY_MAX_VM_STEPS', 500_000_000))
+app.config['QUERY_MAX_SCAN_ROWS'] = int(os.getenv('QUERY_MAX_SCAN_ROWS', 100_000_000))
+# Build indexes on a private copy of an upload once a filter pattern has full-scanned this often.
+app.config['INDEX_ADVISOR'] = os.getenv('INDEX_ADVISOR', '1') == '1'
+app.config['INDEX_ADVISOR_MIN_QUERIES'] = int(os.getenv('INDEX_ADVISOR_MIN_QUERIES', 3))
+# Answer matching aggregate queries from pre-aggregated Year/Month/State/Sector/Group summaries.
+app.config['ROLLUPS'] = os.getenv('ROLLUPS', '1') == '1'
+# Once the full schema prompt of an upload exceeds SCHEMA_LINKING_MIN_TOKENS, send only the
+# tables and columns linked to each question instead.
+app.config['SCHEMA_LINKING'] = os.getenv('SCHEMA_LINKING', '1') == '1'
+app.config['SCHEMA_LINKING_MIN_TOKENS'] = int(os.getenv('SCHEMA_LINKING_MIN_TOKENS', 1500))
+app.config['SCHEMA_LINKING_SEMANTIC'] = os.getenv('SCHEMA_LINKING_SEMANTIC', '0') == '1'
+# Resolve "tn", "andhra" or "karnatka" to stored State/Sector/Group values before generation.
+app.config['VALUE_INDEX'] = os.getenv('VALUE_INDEX', '1') == '1'
+# Show the EXAMPLES_K most similar vetted or learned question/SQL pairs with each question;
+# successful standalone questions are added to the store when EXAMPLES_LEARN is on.
+app.config['EXAMPLES'] = os.getenv('EXAMPLES', '1') == '1'
+app.config['EXAMPLES_K'] = int(os.getenv('EXAMPLES_K', 3))
+app.config['EXAMPLES_LEARN'] = os.getenv('EXAMPLES_LEARN', '1') == '1'
+app.config['EXAMPLES_PATH'] = os.getenv('EXAMPLES_PATH',
+                                        os.path.join(app.config['UPLOAD_FOLDER'], 'examples', 'examples.db'))
+# Generate CANDIDATES queries at once per attempt and answer with the result most of them
+# agree on (1 = one query at a time). Candidates after the first sample at CANDIDATE_TEMPERATURE.
+app.config['CANDIDATES'] = int(os.getenv('CANDIDATES', 1))
+app.config['CANDIDATE_TEMPERATURE'] = float(os.getenv('CANDIDATE_TEMPERATURE', 0.7))
+app.config['CANDIDATE_WORKERS'] = int(os.getenv('CANDIDATE_WORKERS', 16))
+# Refine a successful simple query with complexify_query: 'auto' only when the question asks
+# for more than the query does (functions/complexity.py), 'always' or 'never'.
+app.config['COMPLEXIFY'] = os.getenv('COMPLEXIFY', 'auto')
+# 'async' answers as soon as the SQL result is final and writes the explanation in the
+# background (GET /api/explanation/<id>); 'inline' waits for it in the graph; 'off' skips it.
+app.config['EXPLANATION'] = os.getenv('EXPLANATION', 'async')
+app.config['EXPLANATION_WORKERS'] = int(os.getenv('EXPLANATION_WORKERS', 4))
+# Rows sent with each `result` event of /api/ask/events while the graph is still running.
+app.config['STREAM_BATCH_SIZE'] = int(os.getenv('STREAM_BATCH_SIZE', 500))
+app.config['HISTORY_TOKEN_BUDGET'] = int(os.getenv('HISTORY_TOKEN_BUDGET', 2000))
+app.config['HISTORY_SUMMARY'] = os.getenv('HISTORY_SUMMARY', '1') == '1'
+# Fix fences, quoting and misspelled columns locally before spending an LLM retry on them.
+app.config['SQL_REPAIR'] = os.getenv('SQL_REPAIR', '1') == '1'
+# Fraction of graph state log records that include the full state (rows, history).
+app.config['LOG_STATE_SAMPLE_RATE'] = float(os.getenv('LOG_STATE_SAMPLE_RATE', 0))
+# Chat models come from LLM_PROVIDER: openai, local (an OpenAI-compatible server at LOCAL_LLM_URL),
+# google, or stub (recorded replies with simulated latency, for offline load and regression runs).
+app.config['LLM'] = llm_settings_from_env()
 HISTORY_WINDOW_SIZE = 10
+MAX_RETRIES = 5
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Uploads are stored under their SHA-256, so identical files are written once.
+uploads = UploadStore(app.config['UPLOAD_FOLDER'])
+
+# Few-shot examples with a BM25 index kept on disk; seeded with the vetted CPI examples.
+example_store = None
+if app.config['EXAMPLES']:
+    example_store = ExampleStore(app.config['EXAMPLES_PATH'])
+    example_store.seed()
+
+# Node timings, LLM usage, SQL timings and retries, served at /metrics
+metrics = Metrics()
+# Compact JSON summaries of graph state; nothing is formatted unless INFO is enabled.
+tracer = StateTracer(sample_rate=app.config['LOG_STATE_SAMPLE_RATE'])
 
 # Initialize your two ChatCompletion models:
 # One for generating SQL queries (agentic behavior)
-llm = ChatOpenAI(model="ft:gpt-4o-mini-2024-07-18:personal::AzAgjE7R", temperature=0)
+llm = chat_model(app.config['LLM'], "sql", "ft:gpt-4o-mini-2024-07-18:personal::AzAgjE7R",
+                 temperature=0, callbacks=[LLMMetricsCallback(metrics, "sql")])
+# Same model, sampled, for the extra candidates when CANDIDATES > 1
+candidate_llm = chat_model(app.config['LLM'], "sql_candidate", "ft:gpt-4o-mini-2024-07-18:personal::AzAgjE7R",
+                           temperature=app.config['CANDIDATE_TEMPERATURE'],
+                           callbacks=[LLMMetricsCallback(metrics, "sql_candidate")])
 # And a second one for explaining what the agent is doing
-explanation_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+explanation_llm = chat_model(app.config['LLM'], "explanation", "gpt-4o-mini",
+                             temperature=0, callbacks=[LLMMetricsCallback(metrics, "explanation")])
+
+schema_cache = SchemaCache()
+def summary_messages(previous_summary, messages):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n\n{transcript}"
+    return [
+        {"role": "system", "content": "Summarize this data-analysis conversation in a few sentences. Keep every column, filter value, year and grouping the user asked about."},
+        {"role": "user", "content": transcript}
+    ]
+
+def summarize_history(previous_summary, messages):
+    return explanation_llm.invoke(summary_messages(previous_summary, messages)).content.strip()
 
-db = None
-sample_data = None
+async def asummarize_history(previous_summary, messages):
+    response = await explanation_llm.ainvoke(summary_messages(previous_summary, messages))
+    return response.content.strip()
+
+# Keeps the last HISTORY_WINDOW_SIZE messages verbatim and the prompt within HISTORY_TOKEN_BUDGET.
+history_manager = HistoryManager(
+    token_budget=app.config['HISTORY_TOKEN_BUDGET'],
+    keep_recent=HISTORY_WINDOW_SIZE,
+    summarize=summarize_history if app.config['HISTORY_SUMMARY'] else None,
+    asummarize=asummarize_history if app.config['HISTORY_SUMMARY'] else None
+)
+# Bounded pool for SQLite work in the async serving mode.
+db_executor = ThreadPoolExecutor(max_workers=app.config['DB_EXECUTOR_WORKERS'], thread_name_prefix="sqlite")
+# Candidate queries wait on the LLM, so they get their own pool instead of starving SQLite work.
+candidate_executor = ThreadPoolExecutor(max_workers=app.config['CANDIDATE_WORKERS'], thread_name_prefix="candidate")
+# Explanations finish after their answer was sent and are collected by id.
+explanation_executor = ThreadPoolExecutor(max_workers=app.config['EXPLANATION_WORKERS'],
+                                          thread_name_prefix="explanation")
+explanations = ExplanationJobs(explanation_executor)
+MAX_EXPLANATION_WAIT_SECONDS = 30
+
+def release_database(entry):
+    # Background rollup and index builds attach under entry.lock only while the entry is
+    # registered, so whatever they attached before the eviction is released here.
+    with entry.lock:
+        entry.engine.close()
+        if entry.advisor is not None:
+            entry.advisor.discard()
+        if entry.rollups is not None and not databases.has_fingerprint(entry.fingerprint):
+            entry.rollups.discard()
+    # Uploads with identical content share a fingerprint; keep the schema while one is alive.
+    if not databases.has_fingerprint(entry.fingerprint):
+        schema_cache.invalidate(entry.fingerprint)
+
+# Every loaded database gets its own entry; re-uploads of the same content share it.
+databases = DatabaseRegistry(
+    max_entries=app.config['MAX_DATABASES'],
+    memory_budget_bytes=app.config['DATABASE_MEMORY_BUDGET_MB'] * 1024 * 1024,
+    on_evict=release_database
+)
 
 # Extend QueryState to include intermediate reasoning steps.
 class QueryState(TypedDict):
+    database_id: str
     question: str
+    row_limit: Optional[int]
     history: List[Dict[str, str]]  # [{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]
     sql_query: str
     result: Optional[dict]
     retries: int
     complexity_stage: str  # "simple" or "complex"
+    # Set by decide_complexify for a successful simple query; read by next_node_decision.
+    needs_complexify: bool
     explanation: Optional[str]
     # New field to store intermediate chain-of-thought messages.
     intermediate_reasoning: List[str]
+    history_tokens_saved: int
+    sql_repairs: List[str]
+
+def prompt_for(database, state):
+    if database.linker is None:
+        return database.prompt_prefix
+    # The previous question is linked too, so short follow-ups keep their tables.
+    previous = [m["content"] for m in map(as_message, state.get("history", [])) if m.get("role") == "user"][-1:]
+    linked = database.linker.link(" ".join(previous + [state["question"]]))
+    tracer.event("generate_query", "schema_linked", tables=linked["tables"],
+                 columns=sum(len(columns) for columns in linked["columns"].values()))
+    return build_prefix(linked)
 
-SYSTEM_PROMPT = """You are an extremely precise SQL expert analyzing economic data in a conversation. Your goal is to generate only valid, executable SQL queries. You MUST follow these instructions exactly. Pay very close attention to the conversation history and to error messages to refine your queries.
-
-When the question is vague or requires summarization:
-- Identify and select only the columns relevant to the question.
-- Use appropriate aggregations (e.g., SUM, AVG, COUNT) or grouping when the question asks for trends or summaries.
-- If the question asks about trends over time (e.g., monthly, quarterly), group by the Month or Year column as appropriate.
-- If the question asks about factors affecting inflation or trends, consider aggregating on Inflation (%) and selecting relevant columns such as State, Sector, or Group.
-
-Handling Follow-up Questions:
-When you receive a new question, consider the conversation history to understand the user's evolving information needs.
-- Identify Semantic Context: Focus on the overall meaning and topic of the conversation, not just keywords.  Understand the user's underlying intent.
-- Recognize Question Type: Determine if the new question is a refinement, specification, or related question to the previous turns. Is it asking for similar information but with different parameters, or a completely new topic?
-- Maintain Semantic Consistency: If the current question is semantically related to the previous ones, try to maintain consistency in the query structure (e.g., columns, aggregations) while adjusting filters or groupings as needed. For very short follow-up questions (like single words or years),  infer the implied intent from the semantic context of the conversation.  **However, be cautious not to over-infer context if the new question introduces a significantly different topic or data requirement.**
-- Independent Questions: If the new question appears to be unrelated to the conversation history, generate a new SQL query from scratch, disregarding prior context.
-
-Generate SQL queries for SQLite following these rules:
-1. Return a single SQL query per question.
-2. Select necessary columns to support user question.
-3. Check previous questions in the conversation history to provide context and maintain semantic consistency where appropriate.
-4. Use only existing columns from {table_info}.
-5. Escape reserved keywords with backticks (`).
-6. Return only the SQL query without Markdown (dont wrap with ```sql).
-7. Use `LIMIT {top_k}` when results need to be restricted.
-
-Available tables:
-{table_info}
-
-Here are some sample rows from the database to understand the structure:
-{sample_data}
-"""
+def value_hint(matches):
+    # Only the stored values the question refers to, never the full list of distinct values.
+    if not matches:
+        return None
+    tracer.event("generate_query", "values_resolved", count=len(matches),
+                 how=sorted({match["how"] for match in matches}))
+    return {"role": "system", "content": ValueIndex.describe(matches)}
+
+def example_scope(database):
+    return schema_signature(database.repairer.columns)
+
+def example_hint(database, question, matches):
+    if example_store is None:
+        return None
+    # "rural vs urban" should also find examples that talk about sectors.
+    columns = {match["column"] for match in matches}
+    examples = example_store.similar(example_scope(database), question, app.config['EXAMPLES_K'], sorted(columns),
+                                     owner=database.fingerprint)
+    if not examples:
+        return None
+    tracer.event("generate_query", "examples", count=len(examples),
+                 learned=sum(example["source"] == "learned" for example in examples))
+    return {"role": "system", "content": ExampleStore.describe(examples)}
+
+def learn_example(database, question, history, result_state):
+    # Follow-ups depend on earlier turns that a stored example would not carry.
+    if example_store is None or not app.config['EXAMPLES_LEARN'] or history or database is None:
+        return
+    result = result_state['result']
+    if not result or "error" in result or not result.get("data"):
+        return
+    # Learned pairs quote the question and its filter values, so they stay with this database.
+    if example_store.learn(example_scope(database), database.fingerprint, question, result_state['sql_query']):
+        metrics.inc("examples_learned_total")
+
+def open_engine(path, rollups=None):
+    return ReadOnlyEngine(
+        path,
+        pragmas=app.config['SQLITE_PRAGMAS'],
+        pool_size=app.config['SQLITE_POOL_SIZE'],
+        timeout_seconds=app.config['QUERY_TIMEOUT_SECONDS'],
+        max_vm_steps=app.config['QUERY_MAX_VM_STEPS'],
+        max_scan_rows=app.config['QUERY_MAX_SCAN_ROWS'],
+        attach={ROLLUP_SCHEMA: rollups.path} if rollups is not None else None
+    )
+
+def build_rollups(database):
+    # Runs on db_executor after upload; until it finishes, queries use the raw table.
+    rollups = RollupSet(os.path.join(app.config['UPLOAD_FOLDER'], "rollups", f"{database.fingerprint}.db"))
+    try:
+        if not rollups.load_or_build(database.path, database.fingerprint):
+            return
+    except Exception:
+        logging.exception("rollups: building for %s failed", database.database_id)
+        return
+    with database.lock:
+        if not databases.is_registered(database):
+            # Evicted while building: nothing will close an engine opened now.
+            if not databases.has_fingerprint(database.fingerprint):
+                rollups.discard()
+            return
+        database.rollups = rollups
+        database.replace_engine(open_engine(database.engine.path, rollups))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    global db, sample_data
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
 
@@ -89,57 +289,350 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        extension = filename.rsplit('.', 1)[1].lower()
+        try:
+            stored = uploads.save(file.stream, extension)
+        except InvalidDatabase as e:
+            return jsonify({'error': f'Invalid database {filename}: {e}'}), 400
+        filepath = stored['path']
+
+        ingest_report = None
+        if extension != 'db':
+            # Tabular files are loaded once per content into a database stored next to them.
+            source, filepath = filepath, filepath + ".db"
+            tmp_path = f"{filepath}.{databases.new_id()}.tmp"
+            try:
+                if not os.path.exists(filepath):
+                    ingest_report = ingest_file(source, tmp_path)
+                    os.replace(tmp_path, filepath)
+            except (ValueError, UnicodeDecodeError, csv.Error, sqlite3.Error) as e:
+                return jsonify({'error': f'Could not load {filename}: {e}'}), 400
+            finally:
+                for path in (tmp_path, source):
+                    if os.path.exists(path):
+                        os.remove(path)
 
+        # Same content as a database still loaded: reuse its engine, schema, indexes and rollups.
+        database = databases.get_by_path(filepath)
+        if database is not None:
+            return jsonify({'message': 'File uploaded successfully', 'database_id': database.database_id,
+                            'deduplicated': True}), 200
+
+        database_id = databases.new_id()
         db = SQLDatabase.from_uri(f"sqlite:///{filepath}")
-        query = "SELECT * FROM data LIMIT 5;"
-        sample_data = db.run(query, fetch="cursor")
-        
-        return jsonify({'message': 'File uploaded successfully'}), 200
+        schema = schema_cache.get_or_build(filepath, db)
+        # Generated SQL runs on its own read-only connections, never through `db`.
+        engine = open_engine(filepath)
+        advisor = None
+        if app.config['INDEX_ADVISOR']:
+            advisor = IndexAdvisor(filepath, min_observations=app.config['INDEX_ADVISOR_MIN_QUERIES'])
+        values = ValueIndex.from_database(filepath) if app.config['VALUE_INDEX'] else None
+        prompt_prefix = build_prefix(schema)
+        linker = None
+        if app.config['SCHEMA_LINKING'] and count_tokens(prompt_prefix) > app.config['SCHEMA_LINKING_MIN_TOKENS']:
+            embed = embedder(app.config['LLM']) if app.config['SCHEMA_LINKING_SEMANTIC'] else None
+            linker = SchemaLinker.from_database(filepath, value_index=values, embed=embed)
+        database = databases.register(DatabaseEntry(database_id, filepath, db, schema, prompt_prefix, engine=engine,
+                                                    repairer=SqlRepairer(engine), advisor=advisor, linker=linker,
+                                                    values=values))
+        if app.config['ROLLUPS']:
+            db_executor.submit(build_rollups, database)
+
+        body = {'message': 'File uploaded successfully', 'database_id': database_id}
+        if ingest_report is not None:
+            body['ingest'] = ingest_report
+        return jsonify(body), 200
 
     return jsonify({'error': 'Invalid file type'}), 400
 
+def format_response(body, fmt):
+    result = body['result']
+    if fmt == "arrow" and result and "error" not in result:
+        response = Response(encode_arrow(result), mimetype=ARROW_MIME_TYPE)
+        response.headers['X-SQL-Query'] = quote(body['sql_query'])
+        return response
+    return jsonify({**body, 'result': encode_result(result, "records" if fmt == "arrow" else fmt)})
+
 @app.route('/api/ask', methods=['POST'])
 def ask_question():
-    global db
-    if not db:
+    data = request.json
+    database = databases.get(data.get('database_id'))
+    if database is None:
         return jsonify({'error': 'Database not uploaded yet'}), 400
 
+    question = data.get('question')
+    history = data.get('history', [])
+
+    if not question:
+        return jsonify({'error': 'No question provided'}), 400
+
+    fmt = negotiate_format(data.get('format'), request.headers.get('Accept'))
+    graph = get_graph()
+    try:
+        result_state = graph.invoke(new_query_state(database, question, history))
+        return format_response(graph_response(history, result_state), fmt)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ask/events', methods=['POST'])
+def ask_question_events():
+    """Like /api/ask, but progress is pushed as server-sent events while the graph runs.
+
+    Events, in order: `start`; for every graph step a `node` event (node name,
+    retries, new reasoning lines), `sql` whenever the query changes and `result`
+    with the first STREAM_BATCH_SIZE rows of each execution; then `answer` (the
+    /api/ask body), `explanation` events with the explanation's tokens unless
+    EXPLANATION=off, and `done`. A failure ends the stream with `error`.
+    """
     data = request.json
+    database = databases.get(data.get('database_id'))
+    if database is None:
+        return jsonify({'error': 'Database not uploaded yet'}), 400
+
     question = data.get('question')
     history = data.get('history', [])
 
     if not question:
         return jsonify({'error': 'No question provided'}), 400
 
-    state: QueryState = {
+    fmt = negotiate_format(data.get('format'), None)
+    graph = get_graph(streaming=True)
+
+    def generate():
+        # Sent before any LLM call, so the client hears back right away.
+        yield sse('start', {'question': question})
+        try:
+            result_state = None
+            for event, payload in graph_events(graph, new_query_state(database, question, history)):
+                if event == 'final':
+                    result_state = payload
+                else:
+                    yield sse(event, payload)
+            body = graph_response(history, result_state, explain_in_background=False)
+            yield sse('answer', {**body, 'result': encode_result(body['result'], fmt)})
+            explanation = None
+            if app.config['EXPLANATION'] != 'off':
+                parts = []
+                for chunk in explanation_llm.stream(build_explanation_messages(result_state)):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield sse('explanation', {'delta': chunk.content})
+                explanation = "".join(parts).strip()
+            yield sse('done', {'explanation': explanation})
+        except Exception as e:
+            yield sse('error', {'error': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def graph_events(graph, state):
+    """(event, data) pairs for the steps of one graph run, then ('final', final state)."""
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    final = dict(state)
+    sent_reasoning = 0
+    sent_sql = ""
+    for step in graph.stream(state, stream_mode="updates"):
+        for node, update in step.items():
+            update = update or {}
+            final.update(update)
+            reasoning = final.get("intermediate_reasoning", [])
+            yield "node", {"node": node, "retries": final.get("retries", 0), "reasoning": reasoning[sent_reasoning:]}
+            sent_reasoning = len(reasoning)
+            if final.get("sql_query") and final["sql_query"] != sent_sql:
+                sent_sql = final["sql_query"]
+                yield "sql", {"node": node, "sql_query": sent_sql}
+            result = update.get("result")
+            if result and (node in ("execute_query", "generate_candidates")
+                           or (node == "validate_query" and "error" in result)):
+                yield "result", result_preview(node, result, batch_size)
+    yield "final", final
+
+def result_preview(node, result, batch_size):
+    if "error" in result:
+        return {"node": node, "error": result["error"]}
+    rows = result.get("data", [])
+    return {
+        "node": node,
+        "columns": result.get("columns", []),
+        "rows": rows[:batch_size],
+        "row_count": len(rows),
+        "truncated": bool(result.get("truncated")) or len(rows) > batch_size
+    }
+
+async def ask_question_async(data):
+    """/api/ask for the ASGI server: LLM calls are awaited and SQL runs on `db_executor`."""
+    database = databases.get(data.get('database_id'))
+    if database is None:
+        return {'error': 'Database not uploaded yet'}, 400
+
+    question = data.get('question')
+    history = data.get('history', [])
+
+    if not question:
+        return {'error': 'No question provided'}, 400
+
+    # The ASGI front only speaks JSON, so Arrow is not offered here.
+    fmt = negotiate_format(data.get('format'), None)
+    graph = get_graph(async_mode=True)
+    try:
+        result_state = await graph.ainvoke(new_query_state(database, question, history))
+        body = graph_response(history, result_state)
+        return {**body, 'result': encode_result(body['result'], fmt)}, 200
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+def create_asgi():
+    return create_asgi_app({("POST", "/api/ask"): ask_question_async}, app)
+
+def new_query_state(database, question, history) -> QueryState:
+    return {
+        "database_id": database.database_id,
         "question": question,
+        "row_limit": None,
         "history": history,
         "sql_query": "",
         "result": None,
         "retries": 0,
+        "sql_repairs": [],
         "complexity_stage": "simple",  # start with a simple query
+        "needs_complexify": False,
         "explanation": None,
         "intermediate_reasoning": []  # start with an empty list of reasoning messages
     }
 
-    graph = create_graph()
+def build_explanation_messages(state: QueryState):
+    tracer.state("explain_action", "input", state)
+    # Gather context information for explanation.
+    explanation_prompt = (
+        f"Explain step-by-step what actions you took to answer the following question:\n\n"
+        f"Question: {state['question']}\n\n"
+        f"Final SQL Query: {state['sql_query']}\n\n"
+        f"Result: {state.get('result')}\n\n"
+        f"Retries: {state['retries']}\n\n"
+        f"Complexity Stage: {state['complexity_stage']}\n\n"
+        f"Provide a clear explanation of how you generated and refined the query."
+    )
+    messages = [
+        {"role": "system", "content": "You are an expert that explains the reasoning behind SQL query generation."},
+        {"role": "user", "content": explanation_prompt}
+    ]
+    return messages
+
+def explain_answer(state: QueryState) -> str:
+    # Runs on explanation_executor; the answer has already been returned.
+    response = explanation_llm.invoke(build_explanation_messages(state))
+    explanation_text = response.content.strip() if hasattr(response, "content") else response.strip()
+    tracer.event("explain_action", "background", explanation_chars=len(explanation_text))
+    return explanation_text
+
+def graph_response(history, result_state, explain_in_background=True):
+    metrics.observe("retries", result_state['retries'])
+    learn_example(databases.get(result_state['database_id']), result_state['question'], history, result_state)
+    # Once a query succeeds, the failed attempts and their error messages are just noise.
+    final_history = result_state['history']
+    if "error" not in (result_state['result'] or {}):
+        final_history = drop_retry_errors(final_history, since=len(history))
+    explanation_id = None
+    if explain_in_background and app.config['EXPLANATION'] == 'async':
+        explanation_id = explanations.submit(lambda: explain_answer(result_state))
+    return {
+        'sql_query': result_state['sql_query'],
+        'result': result_state['result'],
+        'history': final_history,
+        'history_tokens_saved': result_state.get('history_tokens_saved', 0),
+        'sql_repairs': result_state.get('sql_repairs', []),
+        'explanation': result_state.get('explanation', ''),
+        'explanation_id': explanation_id,
+        'reasoning': result_state.get('intermediate_reasoning', [])
+    }
+
+# Compiled workflows are cached here; nodes look up their database by id at call time,
+# so a graph compiled once stays valid across uploads.
+graph_registry = GraphRegistry()
+
+def get_graph(async_mode=False, streaming=False):
+    # The streaming endpoint sends the explanation token by token itself, after the graph.
+    name = "agentic_events" if streaming else "agentic_async" if async_mode else "agentic"
+    return graph_registry.get(name, create_graph, max_retries=MAX_RETRIES, async_mode=async_mode,
+                              candidates=app.config['CANDIDATES'], complexify=app.config['COMPLEXIFY'],
+                              explain=app.config['EXPLANATION'] == 'inline' and not streaming)
+
+def database_for(state: QueryState) -> DatabaseEntry:
+    database = databases.get(state["database_id"])
+    if database is None:
+        raise LookupError(f"Database {state['database_id']} is no longer loaded; upload it again")
+    return database
+
+def rollup_sql(database, engine, query):
+    """`query` rewritten onto a rollup table attached to `engine`, or None to use the raw table."""
+    if database.rollups is None or ROLLUP_SCHEMA not in engine.attach:
+        return None
+    return database.rollups.rewrite(query)
+
+def run_sql(database, query, max_rows, cancel=None):
+    engine = database.engine
+    rewritten = rollup_sql(database, engine, query)
+    start = time.perf_counter()
     try:
-        result_state = graph.invoke(state)
-        return jsonify({
-            'sql_query': result_state['sql_query'],
-            'result': result_state['result'],
-            'history': result_state['history'],
-            'explanation': result_state.get('explanation', ''),
-            'reasoning': result_state.get('intermediate_reasoning', [])
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        columns, rows, truncated = engine.execute(rewritten or query, max_rows=max_rows, cancel=cancel)
+    except QueryCancelled:
+        raise
+    except QueryLimitExceeded as e:
+        metrics.inc("sql_limit_exceeded_total", labels={"limit": e.limit})
+        raise
+    except Exception:
+        metrics.inc("sql_errors_total")
+        raise
+    elapsed = time.perf_counter() - start
+    metrics.observe("sql_seconds", elapsed)
+    metrics.observe("sql_rows", len(rows))
+    tracer.event("execute_query", "sql", query_hash=short_hash(query), rows=len(rows),
+                 truncated=truncated, sql_ms=round(elapsed * 1000, 3), rollup=rewritten is not None)
+    if rewritten is not None:
+        metrics.inc("rollup_rewrites_total")
+    elif database.advisor is not None:
+        db_executor.submit(advise_indexes, database, query)
+    return columns, rows, truncated
 
-def create_graph():
-    def generate_query(state: QueryState) -> QueryState:
-        logging.info(f"generate_query: Input State: {state}")
+def advise_indexes(database, query):
+    # Runs on db_executor, off the request path.
+    index = database.advisor.observe(database.engine, query)
+    if index is None:
+        return
+    try:
+        path = database.advisor.build([index])
+    except Exception:
+        logging.exception("index advisor: building %s failed", index)
+        return
+    with database.lock:
+        if not databases.is_registered(database):
+            database.advisor.remove_copy(path)
+            return
+        previous = database.engine.path
+        database.replace_engine(open_engine(path, database.rollups))
+    database.advisor.remove_copy(previous)
+    metrics.inc("indexes_built_total")
+    tracer.event("index_advisor", "built", table=index[0], columns=list(index[1]))
+
+@app.route('/api/explanation/<explanation_id>', methods=['GET'])
+def get_explanation(explanation_id):
+    """Explanation of an earlier answer; ?wait=<seconds> holds the request until it is ready."""
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_EXPLANATION_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    job = explanations.get(explanation_id, wait)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired explanation'}), 404
+    return jsonify(job), 202 if job['status'] == 'pending' else 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def create_graph(max_retries=MAX_RETRIES, async_mode=False, candidates=1, complexify="always", explain=True):
+    def question_text(state: QueryState) -> str:
+        """The question as sent for the current complexity stage (and stored in the history)."""
         complexity_stage = state.get("complexity_stage", "simple")
         additional_instruction = ""
         if complexity_stage == "simple":
@@ -148,31 +641,43 @@ def create_graph():
             additional_instruction = "\nPlease generate a more complex query that builds upon your previous simple query by adding appropriate aggregations, filters, or analysis. Ensure that the final query adheres strictly to the original input prompt."
         else:
             additional_instruction = ""
+        return state["question"] + additional_instruction
 
-        messages = []
-        messages.append({
-            "role": "system",
-            "content": SYSTEM_PROMPT.format(
-                table_info=db.get_table_info(),
-                sample_data=sample_data,
-                top_k=5
-            )
-        })
+    def prepare_history(state: QueryState):
+        return history_manager.prepare(state.get("history", []), question_text(state))
 
-        table_info = db.get_table_info()
-        sample_data_str = str(sample_data)
-        messages.append({
-            "role": "system",
-            "content": f"Table Information:\n{table_info}\nSample Data:\n{sample_data_str}"
-        })
+    async def prepare_history_async(state: QueryState):
+        # Summarizing old turns is an LLM call of its own; it must not block the event loop.
+        return await history_manager.aprepare(state.get("history", []), question_text(state))
 
-        if state.get("history"):
-            messages.extend(state["history"])
+    def build_query_messages(state: QueryState, prepared_history):
+        """The generate_query prompt; `prepared_history` is history_manager.(a)prepare's result."""
+        tracer.state("generate_query", "input", state)
 
-        question_text = state["question"] + additional_instruction
-        messages.append({"role": "user", "content": question_text})
-        
+        # The schema/sample prefix is built once per upload, unless the schema is large
+        # enough to be linked per question.
+        database = database_for(state)
+        prefix = prompt_for(database, state)
+        tracer.event("generate_query", "prompt", version=PROMPT_VERSION, prefix=prefix_hash(prefix))
+
+        history, history_report = prepared_history
+        tracer.event("generate_query", "history", **history_report)
+        matches = database.values.resolve(state["question"]) if database.values else []
+        hints = (example_hint(database, state["question"], matches), value_hint(matches))
+        return assemble(prefix, history, hints, question_text(state)), history_report
+
+    def generate_query(state: QueryState) -> QueryState:
+        messages, history_report = build_query_messages(state, prepare_history(state))
         response = llm.invoke(messages)
+        return query_generated(state, messages[-1]["content"], response, history_report)
+
+    async def generate_query_async(state: QueryState) -> QueryState:
+        messages, history_report = build_query_messages(state, await prepare_history_async(state))
+        response = await llm.ainvoke(messages)
+        return query_generated(state, messages[-1]["content"], response, history_report)
+
+    def query_generated(state: QueryState, question_text, response, history_report) -> QueryState:
+        complexity_stage = state.get("complexity_stage", "simple")
         sql_query = response.content.strip() if hasattr(response, "content") else response.strip()
 
         # Append the generated query as an intermediate reasoning step.
@@ -191,23 +696,58 @@ def create_graph():
             "result": None,
             "complexity_stage": complexity_stage,
             "explanation": state.get("explanation"),
+            "intermediate_reasoning": state["intermediate_reasoning"],
+            "history_tokens_saved": history_report["tokens_saved"]
+        }
+        tracer.state("generate_query", "output", output_state)
+        return output_state
+
+    def validate_query(state: QueryState) -> QueryState:
+        # Compile the SQL locally and fix what can be fixed deterministically, so only
+        # queries that really need rethinking go back to the LLM.
+        if not app.config['SQL_REPAIR']:
+            return {}
+        try:
+            repair = database_for(state).repairer.repair(state["sql_query"])
+        except LookupError:
+            return {}  # execute_query reports the missing database
+        for fix in repair["fixes"]:
+            metrics.inc("sql_repairs_total", labels={"fix": fix.split()[0]})
+        if repair["avoided_retry"]:
+            metrics.inc("llm_retries_avoided_total")
+        tracer.event("validate_query", "repair", query_hash=short_hash(state["sql_query"]),
+                     fixes=repair["fixes"], error=repair["error"])
+        if repair["fixes"]:
+            state["intermediate_reasoning"].append(f"[Repaired Query] {', '.join(repair['fixes'])}")
+        output_state = {
+            "sql_query": repair["sql"],
+            "sql_repairs": state.get("sql_repairs", []) + repair["fixes"],
             "intermediate_reasoning": state["intermediate_reasoning"]
         }
-        logging.info(f"generate_query: Output State: {output_state}")
+        if repair["sql"] != state["sql_query"]:
+            # Keep the repaired query in the conversation so follow-ups build on it.
+            output_state["history"] = state["history"][:-1] + [{"role": "assistant", "content": repair["sql"]}]
+        if repair["error"] is not None:
+            output_state["result"] = {"error": repair["error"]}
         return output_state
 
-    def execute_query(state: QueryState) -> QueryState:
-        logging.info(f"execute_query: Input State: {state}")
+    async def validate_query_async(state: QueryState) -> QueryState:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, validate_query, state)
+
+    def execute_query(state: QueryState, cancel=None) -> QueryState:
+        tracer.state("execute_query", "input", state)
         try:
             query = state["sql_query"]
             result = {"columns": [], "data": []}
 
-            raw_query_result = db.run(query, fetch="cursor")
-            query_result = list(raw_query_result.mappings())
+            row_limit = state.get("row_limit") or app.config['MAX_RESULT_ROWS']
+            columns, rows, truncated = run_sql(database_for(state), query, row_limit, cancel)
 
-            if query_result:
-                result["columns"] = list(query_result[0].keys())
-                result["data"] = [dict(row) for row in query_result]
+            if rows:
+                result["columns"] = columns
+                result["data"] = [dict(zip(columns, row)) for row in rows]
+                result["truncated"] = truncated
             
             # Append execution result to the reasoning log.
             state["intermediate_reasoning"].append(f"[Executed Query] Returned {len(result.get('data', []))} rows.")
@@ -222,10 +762,12 @@ def create_graph():
                 "explanation": state.get("explanation"),
                 "intermediate_reasoning": state["intermediate_reasoning"]
             }
-            logging.info(f"execute_query: Output State: {output_state}")
+            tracer.state("execute_query", "output", output_state)
             return output_state
         except Exception as e:
             error_result = {"error": str(e)}
+            if isinstance(e, QueryLimitExceeded):
+                error_result["limit"] = e.limit
             state["intermediate_reasoning"].append(f"[Execution Error] {str(e)}")
             output_state = {
                 "result": error_result,
@@ -237,11 +779,67 @@ def create_graph():
                 "explanation": state.get("explanation"),
                 "intermediate_reasoning": state["intermediate_reasoning"]
             }
-            logging.info(f"execute_query: Error Output State: {output_state}")
+            tracer.state("execute_query", "error", output_state)
             return output_state
 
+    async def execute_query_async(state: QueryState) -> QueryState:
+        # SQLite calls block, so they run on a bounded pool instead of the event loop.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, execute_query, state)
+
+    def llm_for_candidate(index):
+        # The first candidate is the greedy query the serial path would have produced.
+        return llm if index == 0 else candidate_llm
+
+    def candidate_query(state: QueryState, question_text, response, history_report, cancel) -> QueryState:
+        # validate_query and execute_query for one candidate, outside the graph; each
+        # candidate keeps its own reasoning so only the winner's steps are reported.
+        candidate = {**state, "intermediate_reasoning": list(state["intermediate_reasoning"])}
+        candidate.update(query_generated(candidate, question_text, response, history_report))
+        candidate.update(validate_query(candidate))
+        if "error" not in (candidate.get("result") or {}) and not cancel.is_set():
+            candidate.update(execute_query(candidate, cancel))
+        return candidate
+
+    def candidate_failed(state: QueryState, error: Exception) -> QueryState:
+        # Shaped like a candidate that ran, so routing and prepare_retry work even if every one raised.
+        return {**state, "intermediate_reasoning": list(state["intermediate_reasoning"]),
+                "sql_query": "", "result": {"error": str(error)}}
+
+    def candidates_voted(candidate: QueryState, vote, done) -> QueryState:
+        metrics.observe("candidate_votes", vote["votes"])
+        if vote["cancelled"]:
+            metrics.inc("candidates_cancelled_total", vote["cancelled"])
+        tracer.event("generate_candidates", "vote", candidates=len(done),
+                     distinct_sql=len({other.get("sql_query") for other in done.values()}), **vote)
+        candidate["intermediate_reasoning"].append(
+            f"[Candidates Voted] {vote['votes']} of {len(done)} agreed ({vote['reason']})")
+        return candidate
+
+    def generate_candidates(state: QueryState) -> QueryState:
+        messages, history_report = build_query_messages(state, prepare_history(state))
+
+        def run(index, cancel):
+            response = llm_for_candidate(index).invoke(messages)
+            return candidate_query(state, messages[-1]["content"], response, history_report, cancel)
+
+        return candidates_voted(*race(run, candidates, candidate_executor, lambda candidate: candidate.get("result"),
+                                      lambda error: candidate_failed(state, error)))
+
+    async def generate_candidates_async(state: QueryState) -> QueryState:
+        messages, history_report = build_query_messages(state, await prepare_history_async(state))
+        loop = asyncio.get_running_loop()
+
+        async def run(index, cancel):
+            response = await llm_for_candidate(index).ainvoke(messages)
+            return await loop.run_in_executor(db_executor, candidate_query, state, messages[-1]["content"],
+                                              response, history_report, cancel)
+
+        return candidates_voted(*await race_async(run, candidates, lambda candidate: candidate.get("result"),
+                                                  lambda error: candidate_failed(state, error)))
+
     def prepare_retry(state: QueryState) -> QueryState:
-        logging.info(f"prepare_retry: Input State: {state}")
+        tracer.state("prepare_retry", "input", state)
         new_retries = state["retries"] + 1
         result = state.get("result", {})
 
@@ -263,11 +861,11 @@ def create_graph():
             "history": new_history,
             "intermediate_reasoning": state["intermediate_reasoning"]
         }
-        logging.info(f"prepare_retry: Output State: {output_state}")
+        tracer.state("prepare_retry", "output", output_state)
         return output_state
 
-    def complexify_query(state: QueryState) -> QueryState:
-        logging.info(f"complexify_query: Input State: {state}")
+    def build_complexify_messages(state: QueryState):
+        tracer.state("complexify_query", "input", state)
         messages = []
         messages.append({
             "role": "system",
@@ -285,7 +883,17 @@ def create_graph():
             "role": "user",
             "content": "Please provide a more complex version of the above SQL query, ensuring it adheres to the original prompt."
         })
-        response = llm.invoke(messages)
+        return messages
+
+    def complexify_query(state: QueryState) -> QueryState:
+        response = llm.invoke(build_complexify_messages(state))
+        return query_complexified(state, response)
+
+    async def complexify_query_async(state: QueryState) -> QueryState:
+        response = await llm.ainvoke(build_complexify_messages(state))
+        return query_complexified(state, response)
+
+    def query_complexified(state: QueryState, response) -> QueryState:
         complex_sql_query = response.content.strip() if hasattr(response, "content") else response.strip()
 
         # Append the complex query generation to reasoning.
@@ -306,26 +914,18 @@ def create_graph():
             "explanation": state.get("explanation"),
             "intermediate_reasoning": state["intermediate_reasoning"]
         }
-        logging.info(f"complexify_query: Output State: {output_state}")
+        tracer.state("complexify_query", "output", output_state)
         return output_state
 
     def explain_action(state: QueryState) -> QueryState:
-        logging.info(f"explain_action: Input State: {state}")
-        # Gather context information for explanation.
-        explanation_prompt = (
-            f"Explain step-by-step what actions you took to answer the following question:\n\n"
-            f"Question: {state['question']}\n\n"
-            f"Final SQL Query: {state['sql_query']}\n\n"
-            f"Result: {state.get('result')}\n\n"
-            f"Retries: {state['retries']}\n\n"
-            f"Complexity Stage: {state['complexity_stage']}\n\n"
-            f"Provide a clear explanation of how you generated and refined the query."
-        )
-        messages = [
-            {"role": "system", "content": "You are an expert that explains the reasoning behind SQL query generation."},
-            {"role": "user", "content": explanation_prompt}
-        ]
-        response = explanation_llm.invoke(messages)
+        response = explanation_llm.invoke(build_explanation_messages(state))
+        return action_explained(state, response)
+
+    async def explain_action_async(state: QueryState) -> QueryState:
+        response = await explanation_llm.ainvoke(build_explanation_messages(state))
+        return action_explained(state, response)
+
+    def action_explained(state: QueryState, response) -> QueryState:
         explanation_text = response.content.strip() if hasattr(response, "content") else response.strip()
 
         state["intermediate_reasoning"].append(f"[Final Explanation Provided] {explanation_text}")
@@ -339,49 +939,98 @@ def create_graph():
             "history": new_history,
             "intermediate_reasoning": state["intermediate_reasoning"]
         }
-        logging.info(f"explain_action: Output State: {output_state}")
+        tracer.state("explain_action", "output", output_state)
         return output_state
 
     def next_node_decision(state: QueryState) -> str:
-        logging.info(f"next_node_decision: Evaluating state: {state}")
+        tracer.state("next_node_decision", "input", state)
         result = state.get("result", {})
         has_error = "error" in result
         is_empty = (result.get("columns") == [] and result.get("data") == [])
-        # If there's an error or empty result and retries are under 5, retry.
-        if (has_error or is_empty) and state["retries"] < 5:
+        # If there's an error or empty result and retries are under the limit, retry.
+        if (has_error or is_empty) and state["retries"] < max_retries:
             return "prepare_retry"
-        # If we're in the simple stage and got a valid result, move to complexify.
+        # If we're in the simple stage and got a valid result, move to complexify if it needs it.
         if state.get("complexity_stage", "simple") == "simple" and not has_error and not is_empty:
-            return "complexify_query"
-        # Otherwise, end the cycle by providing an explanation.
+            if state.get("needs_complexify"):
+                return "complexify_query"
+        # Otherwise, end the cycle by providing an explanation (or just end, see `explain`).
         return "explain_action"
 
-    graph = StateGraph(QueryState)
-    graph.add_node("generate_query", generate_query)
-    graph.add_node("execute_query", execute_query)
+    def decide_complexify(state: QueryState) -> QueryState:
+        # A node rather than part of next_node_decision: routers must not write state, and
+        # as a node update the "[Complexify Skipped]" line reaches stream clients right away.
+        result = state.get("result") or {}
+        succeeded = "error" not in result and not (result.get("columns") == [] and result.get("data") == [])
+        if state.get("complexity_stage", "simple") != "simple" or not succeeded:
+            return {"needs_complexify": False}
+        if complexify == "always":
+            return {"needs_complexify": True}
+        reason = refinement_reason(state["question"], state["sql_query"]) if complexify == "auto" else None
+        metrics.inc("complexify_decisions_total", labels={"decision": "refine" if reason else "skip"})
+        tracer.event("decide_complexify", "complexify", reason=reason)
+        output_state = {"needs_complexify": reason is not None}
+        if reason is None and complexify == "auto":
+            output_state["intermediate_reasoning"] = state["intermediate_reasoning"] + [
+                "[Complexify Skipped] The simple query already answers the question"]
+        return output_state
+
+    def after_validation(state: QueryState) -> str:
+        if "error" in (state.get("result") or {}):
+            return next_node_decision(state)
+        return "execute_query"
+
+    # Every node added to this graph is timed under nl2sql_node_seconds{node=...}.
+    graph = InstrumentedStateGraph(QueryState, metrics)
+    if candidates > 1:
+        # The first query of each attempt comes from generate_candidates, which also
+        # validates and executes it; complexified queries still take the serial path.
+        graph.add_node("generate_candidates", generate_candidates_async if async_mode else generate_candidates)
+    else:
+        graph.add_node("generate_query", generate_query_async if async_mode else generate_query)
+    graph.add_node("validate_query", validate_query_async if async_mode else validate_query)
+    graph.add_node("execute_query", execute_query_async if async_mode else execute_query)
     graph.add_node("prepare_retry", prepare_retry)
-    graph.add_node("complexify_query", complexify_query)
-    graph.add_node("explain_action", explain_action)
+    graph.add_node("complexify_query", complexify_query_async if async_mode else complexify_query)
+    graph.add_node("decide_complexify", decide_complexify)
+    if explain:
+        graph.add_node("explain_action", explain_action_async if async_mode else explain_action)
+    # Without `explain`, the answer is final here and graph_response explains it in the background.
+    finished = "explain_action" if explain else END
 
-    graph.set_entry_point("generate_query")
-    graph.add_edge("generate_query", "execute_query")
+    after_execution = {
+        "prepare_retry": "prepare_retry",
+        "complexify_query": "complexify_query",
+        "explain_action": finished
+    }
+    if candidates > 1:
+        graph.set_entry_point("generate_candidates")
+        graph.add_edge("generate_candidates", "decide_complexify")
+    else:
+        graph.set_entry_point("generate_query")
+        graph.add_edge("generate_query", "validate_query")
     graph.add_conditional_edges(
-        "execute_query",
-        next_node_decision,
+        "validate_query",
+        after_validation,
         {
+            "execute_query": "execute_query",
             "prepare_retry": "prepare_retry",
             "complexify_query": "complexify_query",
-            "explain_action": "explain_action"
+            "explain_action": finished
         }
     )
-    # After complexifying the query, execute it.
-    graph.add_edge("complexify_query", "execute_query")
+    graph.add_edge("execute_query", "decide_complexify")
+    graph.add_conditional_edges("decide_complexify", next_node_decision, after_execution)
+    # After complexifying the query, validate and execute it.
+    graph.add_edge("complexify_query", "validate_query")
     # After a retry, generate a new query.
-    graph.add_edge("prepare_retry", "generate_query")
+    graph.add_edge("prepare_retry", "generate_candidates" if candidates > 1 else "generate_query")
     # After explanation, end the graph.
-    graph.add_edge("explain_action", END)
+    if explain:
+        graph.add_edge("explain_action", END)
     return graph.compile()
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)  # Enable logging
+    get_graph()  # compile the workflow once before serving requests
     app.run(debug=True)
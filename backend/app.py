@@ -1,78 +1,282 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
 from werkzeug.utils import secure_filename
-from langchain_openai import ChatOpenAI  # finetuned model
 from langchain_community.utilities import SQLDatabase
 from langgraph.graph import StateGraph, END
 import ast
+import csv
+import sqlite3
 from typing import TypedDict, List, Optional, Dict
 from sqlalchemy import text
 from dotenv import load_dotenv
 import logging
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functions.graph_registry import GraphRegistry
+from functions.schema_cache import SchemaCache
+from functions.result_cache import ResultCache
+from functions.asgi import create_asgi_app
+from functions.db_registry import DatabaseEntry, DatabaseRegistry
+from functions.sqlite_engine import QueryCancelled, QueryLimitExceeded, ReadOnlyEngine, pragmas_from_env
+from functions.metrics import InstrumentedStateGraph, LLMMetricsCallback, Metrics
+from functions.tracing import StateTracer, short_hash
+from functions.sql_repair import SqlRepairer
+from functions.index_advisor import IndexAdvisor
+from functions.rollups import ROLLUP_SCHEMA, RollupSet
+from functions.ingest import ingest_extensions, ingest_file
+from functions.upload_store import InvalidDatabase, UploadStore
+from functions.schema_linking import SchemaLinker
+from functions.value_index import ValueIndex
+from functions.example_store import ExampleStore, schema_signature
+from functions.candidates import race, race_async
+from functions.llm_provider import chat_model, embedder, llm_settings_from_env
+from functions.prompt_builder import PROMPT_VERSION, assemble, build_prefix, prefix_hash
+from functions.history import HistoryManager, as_message, count_tokens, drop_retry_errors
+from functions.result_format import ARROW_MIME_TYPE, encode_arrow, encode_result, negotiate_format
+from urllib.parse import quote
+from functions.result_stream import ndjson, stream_rows
 
 load_dotenv(override=True)
 
 app = Flask(__name__)
 CORS(app)
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['ALLOWED_EXTENSIONS'] = {'db'}
+# CSV/TSV (and Parquet, with pyarrow) uploads are loaded into a new SQLite database.
+app.config['ALLOWED_EXTENSIONS'] = {'db'} | ingest_extensions()
+app.config['RESULT_CACHE_SIZE'] = int(os.getenv('RESULT_CACHE_SIZE', 256))
+app.config['RESULT_CACHE_TTL'] = float(os.getenv('RESULT_CACHE_TTL', 3600))
+app.config['RESULT_CACHE_SEMANTIC'] = os.getenv('RESULT_CACHE_SEMANTIC', '0') == '1'
+app.config['DB_EXECUTOR_WORKERS'] = int(os.getenv('DB_EXECUTOR_WORKERS', 8))
+app.config['MAX_DATABASES'] = int(os.getenv('MAX_DATABASES', 16))
+app.config['DATABASE_MEMORY_BUDGET_MB'] = int(os.getenv('DATABASE_MEMORY_BUDGET_MB', 2048))
+app.config['SQLITE_POOL_SIZE'] = int(os.getenv('SQLITE_POOL_SIZE', 8))
+app.config['SQLITE_PRAGMAS'] = pragmas_from_env()
+# Server-side caps on what a single generated query may return.
+app.config['MAX_RESULT_ROWS'] = int(os.getenv('MAX_RESULT_ROWS', 10000))
+app.config['MAX_RESULT_BYTES'] = int(os.getenv('MAX_RESULT_BYTES', 8 * 1024 * 1024))
+app.config['STREAM_BATCH_SIZE'] = int(os.getenv('STREAM_BATCH_SIZE', 500))
+# Execution guardrails for generated SQL (0 disables a limit).
+app.config['QUERY_TIMEOUT_SECONDS'] = float(os.getenv('QUERY_TIMEOUT_SECONDS', 10))
+app.config['QUERY_MAX_VM_STEPS'] = int(os.getenv('QUERY_MAX_VM_STEPS', 500_000_000))
+app.config['QUERY_MAX_SCAN_ROWS'] = int(os.getenv('QUERY_MAX_SCAN_ROWS', 100_000_000))
+# Build indexes on a private copy of an upload once a filter pattern has full-scanned this often.
+app.config['INDEX_ADVISOR'] = os.getenv('INDEX_ADVISOR', '1') == '1'
+app.config['INDEX_ADVISOR_MIN_QUERIES'] = int(os.getenv('INDEX_ADVISOR_MIN_QUERIES', 3))
+# Answer matching aggregate queries from pre-aggregated Year/Month/State/Sector/Group summaries.
+app.config['ROLLUPS'] = os.getenv('ROLLUPS', '1') == '1'
+# Once the full schema prompt of an upload exceeds SCHEMA_LINKING_MIN_TOKENS, send only the
+# tables and columns linked to each question instead.
+app.config['SCHEMA_LINKING'] = os.getenv('SCHEMA_LINKING', '1') == '1'
+app.config['SCHEMA_LINKING_MIN_TOKENS'] = int(os.getenv('SCHEMA_LINKING_MIN_TOKENS', 1500))
+app.config['SCHEMA_LINKING_SEMANTIC'] = os.getenv('SCHEMA_LINKING_SEMANTIC', '0') == '1'
+# Resolve "tn", "andhra" or "karnatka" to stored State/Sector/Group values before generation.
+app.config['VALUE_INDEX'] = os.getenv('VALUE_INDEX', '1') == '1'
+# Show the EXAMPLES_K most similar vetted or learned question/SQL pairs with each question;
+# successful standalone questions are added to the store when EXAMPLES_LEARN is on.
+app.config['EXAMPLES'] = os.getenv('EXAMPLES', '1') == '1'
+app.config['EXAMPLES_K'] = int(os.getenv('EXAMPLES_K', 3))
+app.config['EXAMPLES_LEARN'] = os.getenv('EXAMPLES_LEARN', '1') == '1'
+app.config['EXAMPLES_PATH'] = os.getenv('EXAMPLES_PATH',
+                                        os.path.join(app.config['UPLOAD_FOLDER'], 'examples', 'examples.db'))
+# Generate CANDIDATES queries at once per attempt and answer with the result most of them
+# agree on (1 = one query at a time). Candidates after the first sample at CANDIDATE_TEMPERATURE.
+app.config['CANDIDATES'] = int(os.getenv('CANDIDATES', 1))
+app.config['CANDIDATE_TEMPERATURE'] = float(os.getenv('CANDIDATE_TEMPERATURE', 0.7))
+app.config['CANDIDATE_WORKERS'] = int(os.getenv('CANDIDATE_WORKERS', 16))
+app.config['HISTORY_TOKEN_BUDGET'] = int(os.getenv('HISTORY_TOKEN_BUDGET', 2000))
+app.config['HISTORY_SUMMARY'] = os.getenv('HISTORY_SUMMARY', '1') == '1'
+# Fix fences, quoting and misspelled columns locally before spending an LLM retry on them.
+app.config['SQL_REPAIR'] = os.getenv('SQL_REPAIR', '1') == '1'
+# Fraction of graph state log records that include the full state (rows, history).
+app.config['LOG_STATE_SAMPLE_RATE'] = float(os.getenv('LOG_STATE_SAMPLE_RATE', 0))
+# Chat models come from LLM_PROVIDER: openai, local (an OpenAI-compatible server at LOCAL_LLM_URL),
+# google, or stub (recorded replies with simulated latency, for offline load and regression runs).
+app.config['LLM'] = llm_settings_from_env()
 HISTORY_WINDOW_SIZE = 10
+MAX_RETRIES = 3
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Uploads are stored under their SHA-256, so identical files are written once.
+uploads = UploadStore(app.config['UPLOAD_FOLDER'])
 
-# Initialize your finetuned model (using the OpenAI ChatCompletion API behind the scenes)
-llm = ChatOpenAI(model="ft:gpt-4o-mini-2024-07-18:personal::AzAgjE7R", temperature=0)
+# Few-shot examples with a BM25 index kept on disk; seeded with the vetted CPI examples.
+example_store = None
+if app.config['EXAMPLES']:
+    example_store = ExampleStore(app.config['EXAMPLES_PATH'])
+    example_store.seed()
+
+# Node timings, LLM usage, SQL timings and retries, served at /metrics
+metrics = Metrics()
+# Compact JSON summaries of graph state; nothing is formatted unless INFO is enabled.
+tracer = StateTracer(sample_rate=app.config['LOG_STATE_SAMPLE_RATE'])
 
-db = None
-sample_data = None
+# Initialize your finetuned model (using the OpenAI ChatCompletion API behind the scenes)
+llm = chat_model(app.config['LLM'], "sql", "ft:gpt-4o-mini-2024-07-18:personal::AzAgjE7R",
+                 temperature=0, callbacks=[LLMMetricsCallback(metrics, "sql")])
+# Same model, sampled, for the extra candidates when CANDIDATES > 1
+candidate_llm = chat_model(app.config['LLM'], "sql_candidate", "ft:gpt-4o-mini-2024-07-18:personal::AzAgjE7R",
+                           temperature=app.config['CANDIDATE_TEMPERATURE'],
+                           callbacks=[LLMMetricsCallback(metrics, "sql_candidate")])
+# General model used to compress old conversation turns into a rolling summary
+summary_llm = chat_model(app.config['LLM'], "summary", "gpt-4o-mini",
+                         temperature=0, callbacks=[LLMMetricsCallback(metrics, "summary")])
+
+schema_cache = SchemaCache()
+# Answers to repeated questions, keyed by database content, question and recent history.
+result_cache = ResultCache(
+    max_entries=app.config['RESULT_CACHE_SIZE'],
+    ttl_seconds=app.config['RESULT_CACHE_TTL'],
+    history_window=HISTORY_WINDOW_SIZE,
+    embed=embedder(app.config['LLM']) if app.config['RESULT_CACHE_SEMANTIC'] else None
+)
+def summary_messages(previous_summary, messages):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n\n{transcript}"
+    return [
+        {"role": "system", "content": "Summarize this data-analysis conversation in a few sentences. Keep every column, filter value, year and grouping the user asked about."},
+        {"role": "user", "content": transcript}
+    ]
+
+def summarize_history(previous_summary, messages):
+    return summary_llm.invoke(summary_messages(previous_summary, messages)).content.strip()
+
+async def asummarize_history(previous_summary, messages):
+    response = await summary_llm.ainvoke(summary_messages(previous_summary, messages))
+    return response.content.strip()
+
+# Keeps the last HISTORY_WINDOW_SIZE messages verbatim and the prompt within HISTORY_TOKEN_BUDGET.
+history_manager = HistoryManager(
+    token_budget=app.config['HISTORY_TOKEN_BUDGET'],
+    keep_recent=HISTORY_WINDOW_SIZE,
+    summarize=summarize_history if app.config['HISTORY_SUMMARY'] else None,
+    asummarize=asummarize_history if app.config['HISTORY_SUMMARY'] else None
+)
+
+def cache_gauges():
+    stats = result_cache.stats()
+    for name in ("hits", "semantic_hits", "misses", "evictions", "size", "hit_rate"):
+        yield f"result_cache_{name}", {}, stats[name]
+
+metrics.register_collector(cache_gauges)
+
+# Bounded pool for SQLite work in the async serving mode.
+db_executor = ThreadPoolExecutor(max_workers=app.config['DB_EXECUTOR_WORKERS'], thread_name_prefix="sqlite")
+# Candidate queries wait on the LLM, so they get their own pool instead of starving SQLite work.
+candidate_executor = ThreadPoolExecutor(max_workers=app.config['CANDIDATE_WORKERS'], thread_name_prefix="candidate")
+
+def release_database(entry):
+    # Background rollup and index builds attach under entry.lock only while the entry is
+    # registered, so whatever they attached before the eviction is released here.
+    with entry.lock:
+        entry.engine.close()
+        if entry.advisor is not None:
+            entry.advisor.discard()
+        if entry.rollups is not None and not databases.has_fingerprint(entry.fingerprint):
+            entry.rollups.discard()
+    # Uploads with identical content share a fingerprint; keep their caches while one is alive.
+    if not databases.has_fingerprint(entry.fingerprint):
+        schema_cache.invalidate(entry.fingerprint)
+        result_cache.invalidate(entry.fingerprint)
+
+# Every loaded database gets its own entry; re-uploads of the same content share it.
+databases = DatabaseRegistry(
+    max_entries=app.config['MAX_DATABASES'],
+    memory_budget_bytes=app.config['DATABASE_MEMORY_BUDGET_MB'] * 1024 * 1024,
+    on_evict=release_database
+)
 
 class QueryState(TypedDict):
+    database_id: str
     question: str
+    row_limit: Optional[int]
     history: List[Dict[str, str]] #[{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]
     sql_query: str
     result: Optional[dict]
     retries: int
+    history_tokens_saved: int
+    sql_repairs: List[str]
+
+def prompt_for(database, state):
+    if database.linker is None:
+        return database.prompt_prefix
+    # The previous question is linked too, so short follow-ups keep their tables.
+    previous = [m["content"] for m in map(as_message, state.get("history", [])) if m.get("role") == "user"][-1:]
+    linked = database.linker.link(" ".join(previous + [state["question"]]))
+    tracer.event("generate_query", "schema_linked", tables=linked["tables"],
+                 columns=sum(len(columns) for columns in linked["columns"].values()))
+    return build_prefix(linked)
+
+def value_hint(matches):
+    # Only the stored values the question refers to, never the full list of distinct values.
+    if not matches:
+        return None
+    tracer.event("generate_query", "values_resolved", count=len(matches),
+                 how=sorted({match["how"] for match in matches}))
+    return {"role": "system", "content": ValueIndex.describe(matches)}
+
+def example_scope(database):
+    return schema_signature(database.repairer.columns)
+
+def example_hint(database, question, matches):
+    if example_store is None:
+        return None
+    # "rural vs urban" should also find examples that talk about sectors.
+    columns = {match["column"] for match in matches}
+    examples = example_store.similar(example_scope(database), question, app.config['EXAMPLES_K'], sorted(columns),
+                                     owner=database.fingerprint)
+    if not examples:
+        return None
+    tracer.event("generate_query", "examples", count=len(examples),
+                 learned=sum(example["source"] == "learned" for example in examples))
+    return {"role": "system", "content": ExampleStore.describe(examples)}
+
+def learn_example(database, question, history, result_state):
+    # Follow-ups depend on earlier turns that a stored example would not carry.
+    if example_store is None or not app.config['EXAMPLES_LEARN'] or history or database is None:
+        return
+    result = result_state['result']
+    if not result or "error" in result or not result.get("data"):
+        return
+    # Learned pairs quote the question and its filter values, so they stay with this database.
+    if example_store.learn(example_scope(database), database.fingerprint, question, result_state['sql_query']):
+        metrics.inc("examples_learned_total")
+
+def open_engine(path, rollups=None):
+    return ReadOnlyEngine(
+        path,
+        pragmas=app.config['SQLITE_PRAGMAS'],
+        pool_size=app.config['SQLITE_POOL_SIZE'],
+        timeout_seconds=app.config['QUERY_TIMEOUT_SECONDS'],
+        max_vm_steps=app.config['QUERY_MAX_VM_STEPS'],
+        max_scan_rows=app.config['QUERY_MAX_SCAN_ROWS'],
+        attach={ROLLUP_SCHEMA: rollups.path} if rollups is not None else None
+    )
 
-SYSTEM_PROMPT = """You are an extremely precise SQL expert analyzing economic data in a conversation. Your goal is to generate only valid, executable SQL queries. You MUST follow these instructions exactly. Pay very close attention to the conversation history and to error messages to refine your queries.
-
-When the question is vague or requires summarization:
-- Identify and select only the columns relevant to the question.
-- Use appropriate aggregations (e.g., SUM, AVG, COUNT) or grouping when the question asks for trends or summaries.
-- If the question asks about trends over time (e.g., monthly, quarterly), group by the Month or Year column as appropriate.
-- If the question asks about factors affecting inflation or trends, consider aggregating on Inflation (%) and selecting relevant columns such as State, Sector, or Group.
-
-Handling Follow-up Questions:
-When you receive a new question, consider the conversation history to understand the user's evolving information needs.
-- Identify Semantic Context: Focus on the overall meaning and topic of the conversation, not just keywords.  Understand the user's underlying intent.
-- Recognize Question Type: Determine if the new question is a refinement, specification, or related question to the previous turns. Is it asking for similar information but with different parameters, or a completely new topic?
-- Maintain Semantic Consistency: If the current question is semantically related to the previous ones, try to maintain consistency in the query structure (e.g., columns, aggregations) while adjusting filters or groupings as needed. For very short follow-up questions (like single words or years),  infer the implied intent from the semantic context of the conversation.  **However, be cautious not to over-infer context if the new question introduces a significantly different topic or data requirement.**
-- Independent Questions: If the new question appears to be unrelated to the conversation history, generate a new SQL query from scratch, disregarding prior context.
-
-Generate SQL queries for SQLite following these rules:
-1. Return a single SQL query per question.
-2. Select necessary columns to support user question.
-3. Check previous questions in the conversation history to provide context and maintain semantic consistency where appropriate.
-4. Use only existing columns from {table_info}.
-5. Escape reserved keywords with backticks (`).
-6. Return only the SQL query without Markdown (dont wrap with ```sql).
-7. Use `LIMIT {top_k}` when results need to be restricted.
-
-Available tables:
-{table_info}
-
-Here are some sample rows from the database to understand the structure:
-{sample_data}
-
-"""
-
+def build_rollups(database):
+    # Runs on db_executor after upload; until it finishes, queries use the raw table.
+    rollups = RollupSet(os.path.join(app.config['UPLOAD_FOLDER'], "rollups", f"{database.fingerprint}.db"))
+    try:
+        if not rollups.load_or_build(database.path, database.fingerprint):
+            return
+    except Exception:
+        logging.exception("rollups: building for %s failed", database.database_id)
+        return
+    with database.lock:
+        if not databases.is_registered(database):
+            # Evicted while building: nothing will close an engine opened now.
+            if not databases.has_fingerprint(database.fingerprint):
+                rollups.discard()
+            return
+        database.rollups = rollups
+        database.replace_engine(open_engine(database.engine.path, rollups))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    global db, sample_data
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
 
@@ -82,69 +286,347 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
+        extension = filename.rsplit('.', 1)[1].lower()
+        try:
+            stored = uploads.save(file.stream, extension)
+        except InvalidDatabase as e:
+            return jsonify({'error': f'Invalid database {filename}: {e}'}), 400
+        filepath = stored['path']
+
+        ingest_report = None
+        if extension != 'db':
+            # Tabular files are loaded once per content into a database stored next to them.
+            source, filepath = filepath, filepath + ".db"
+            tmp_path = f"{filepath}.{databases.new_id()}.tmp"
+            try:
+                if not os.path.exists(filepath):
+                    ingest_report = ingest_file(source, tmp_path)
+                    os.replace(tmp_path, filepath)
+            except (ValueError, UnicodeDecodeError, csv.Error, sqlite3.Error) as e:
+                return jsonify({'error': f'Could not load {filename}: {e}'}), 400
+            finally:
+                for path in (tmp_path, source):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        # Same content as a database still loaded: reuse its engine, schema, indexes and rollups.
+        database = databases.get_by_path(filepath)
+        if database is not None:
+            return jsonify({'message': 'File uploaded successfully', 'database_id': database.database_id,
+                            'deduplicated': True}), 200
+
+        database_id = databases.new_id()
         db = SQLDatabase.from_uri(f"sqlite:///{filepath}")
-        query = "SELECT * FROM data LIMIT 5;"
-        sample_data = db.run(query, fetch="cursor")
-        
-        return jsonify({'message': 'File uploaded successfully'}), 200
+        schema = schema_cache.get_or_build(filepath, db)
+        # Generated SQL runs on its own read-only connections, never through `db`.
+        engine = open_engine(filepath)
+        advisor = None
+        if app.config['INDEX_ADVISOR']:
+            advisor = IndexAdvisor(filepath, min_observations=app.config['INDEX_ADVISOR_MIN_QUERIES'])
+        values = ValueIndex.from_database(filepath) if app.config['VALUE_INDEX'] else None
+        prompt_prefix = build_prefix(schema)
+        linker = None
+        if app.config['SCHEMA_LINKING'] and count_tokens(prompt_prefix) > app.config['SCHEMA_LINKING_MIN_TOKENS']:
+            embed = embedder(app.config['LLM']) if app.config['SCHEMA_LINKING_SEMANTIC'] else None
+            linker = SchemaLinker.from_database(filepath, value_index=values, embed=embed)
+        database = databases.register(DatabaseEntry(database_id, filepath, db, schema, prompt_prefix, engine=engine,
+                                                    repairer=SqlRepairer(engine), advisor=advisor, linker=linker,
+                                                    values=values))
+        if app.config['ROLLUPS']:
+            db_executor.submit(build_rollups, database)
+
+        body = {'message': 'File uploaded successfully', 'database_id': database_id}
+        if ingest_report is not None:
+            body['ingest'] = ingest_report
+        return jsonify(body), 200
 
     return jsonify({'error': 'Invalid file type'}), 400
 
+def new_query_state(database, question, history, row_limit=None) -> QueryState:
+    return {
+        "database_id": database.database_id,
+        "question": question,
+        "row_limit": row_limit,
+        "history": history,
+        "sql_query": "",
+        "result": None,
+        "retries": 0,
+        "sql_repairs": []
+    }
+
+def cached_response(database, question, history):
+    cached = result_cache.get(database.fingerprint, question, history)
+    if cached is None:
+        return None
+    return {
+        'sql_query': cached['sql_query'],
+        'result': cached['result'],
+        'history': history + [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": cached['sql_query']}
+        ],
+        'cached': True
+    }
+
+def graph_response(database, question, history, result_state, cache=True):
+    metrics.observe("retries", result_state['retries'])
+    learn_example(database, question, history, result_state)
+    if cache and is_cacheable(result_state['result']):
+        result_cache.put(database.fingerprint, question, history, {
+            'sql_query': result_state['sql_query'],
+            'result': result_state['result']
+        })
+    return {
+        'sql_query': result_state['sql_query'],
+        'result': result_state['result'],
+        'history': final_history(history, result_state),
+        'history_tokens_saved': result_state.get('history_tokens_saved', 0),
+        'sql_repairs': result_state.get('sql_repairs', []),
+        'cached': False
+    }
+
+def final_history(history, result_state):
+    # Once a query succeeds, the failed attempts and their error messages are just noise.
+    if "error" in (result_state['result'] or {}):
+        return result_state['history']
+    return drop_retry_errors(result_state['history'], since=len(history))
+
+def format_response(body, fmt):
+    result = body['result']
+    if fmt == "arrow" and result and "error" not in result:
+        response = Response(encode_arrow(result), mimetype=ARROW_MIME_TYPE)
+        response.headers['X-SQL-Query'] = quote(body['sql_query'])
+        return response
+    return jsonify({**body, 'result': encode_result(result, "records" if fmt == "arrow" else fmt)})
+
 @app.route('/api/ask', methods=['POST'])
 def ask_question():
-    global db
-    if not db:
+    data = request.json
+    database = databases.get(data.get('database_id'))
+    if database is None:
         return jsonify({'error': 'Database not uploaded yet'}), 400
 
-    data = request.json
     question = data.get('question')
     history = data.get('history', [])
 
     if not question:
         return jsonify({'error': 'No question provided'}), 400
 
-    state: QueryState = {
-        "question": question,
-        "history": history,
-        "sql_query": "",
-        "result": None,
-        "retries": 0
-    }
+    fmt = negotiate_format(data.get('format'), request.headers.get('Accept'))
+    cached = cached_response(database, question, history)
+    if cached is not None:
+        return format_response(cached, fmt)
 
-    graph = create_graph()
+    graph = get_graph()
     try:
-        result_state = graph.invoke(state)
-        return jsonify({
-            'sql_query': result_state['sql_query'],
-            'result': result_state['result'],
-            'history': result_state['history']
-        })
+        result_state = graph.invoke(new_query_state(database, question, history))
+        return format_response(graph_response(database, question, history, result_state), fmt)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-def create_graph():
-    def generate_query(state: QueryState) -> QueryState:
-        logging.info(f"generate_query: Input State: {state}")
-        
-        messages = []
-        messages.append({"role": "system", "content": SYSTEM_PROMPT.format(table_info=db.get_table_info(), sample_data=sample_data, top_k=5)
-})
-
-        table_info = db.get_table_info()
-        sample_data_str = str(sample_data)
-        messages.append({
-            "role": "system",
-            "content": f"Table Information:\n{table_info}\nSample Data:\n{sample_data_str}"
+
+@app.route('/api/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """Like /api/ask, but the rows of the final query are streamed as NDJSON.
+
+    Cache hits skip the graph. Otherwise the graph only fetches one batch per
+    attempt (enough to decide on retries) and its outcome is recorded as for
+    /api/ask. Either way the final query is then re-run and its rows are sent
+    batch by batch, up to MAX_RESULT_ROWS rows / MAX_RESULT_BYTES bytes. Lines,
+    in order: one `meta` line (sql_query, columns, history, cached), `rows`
+    lines, then `end` (row_count, truncated) or `error`.
+    """
+    data = request.json
+    database = databases.get(data.get('database_id'))
+    if database is None:
+        return jsonify({'error': 'Database not uploaded yet'}), 400
+
+    question = data.get('question')
+    history = data.get('history', [])
+
+    if not question:
+        return jsonify({'error': 'No question provided'}), 400
+
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    body = cached_response(database, question, history)
+    if body is None:
+        try:
+            result_state = get_graph().invoke(new_query_state(database, question, history, row_limit=batch_size))
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        # The graph only fetched the first batch; a truncated one is not the whole answer /api/ask would cache.
+        body = graph_response(database, question, history, result_state,
+                              cache=not result_state['result'].get('truncated'))
+
+    result = body['result']
+
+    def generate():
+        yield ndjson({
+            'type': 'meta',
+            'sql_query': body['sql_query'],
+            'columns': result.get('columns', []),
+            'history': body['history'],
+            'cached': body['cached']
         })
+        if 'error' in result:
+            yield ndjson({'type': 'error', 'error': result['error']})
+            return
+        engine = database.engine
+        query = body['sql_query']
+        yield from stream_rows(
+            engine,
+            rollup_sql(database, engine, query) or query,
+            batch_size=batch_size,
+            max_rows=app.config['MAX_RESULT_ROWS'],
+            max_bytes=app.config['MAX_RESULT_BYTES']
+        )
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+async def ask_question_async(data):
+    """/api/ask for the ASGI server: LLM calls are awaited and SQL runs on `db_executor`."""
+    database = databases.get(data.get('database_id'))
+    if database is None:
+        return {'error': 'Database not uploaded yet'}, 400
 
-        if state.get("history"):
-            messages.extend(state["history"])
+    question = data.get('question')
+    history = data.get('history', [])
 
-        messages.append({"role": "user", "content": state["question"]})
-        
+    if not question:
+        return {'error': 'No question provided'}, 400
+
+    # The ASGI front only speaks JSON, so Arrow is not offered here.
+    fmt = negotiate_format(data.get('format'), None)
+    loop = asyncio.get_running_loop()
+    # With RESULT_CACHE_SEMANTIC, cache lookups and stores embed the question (a blocking
+    # API call), so both run on the default executor rather than on the event loop.
+    cached = await loop.run_in_executor(None, cached_response, database, question, history)
+    if cached is not None:
+        return {**cached, 'result': encode_result(cached['result'], fmt)}, 200
+
+    graph = get_graph(async_mode=True)
+    try:
+        result_state = await graph.ainvoke(new_query_state(database, question, history))
+        body = await loop.run_in_executor(None, graph_response, database, question, history, result_state)
+        return {**body, 'result': encode_result(body['result'], fmt)}, 200
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+def create_asgi():
+    return create_asgi_app({("POST", "/api/ask"): ask_question_async}, app)
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+def is_cacheable(result):
+    # Errors and empty results are retried by the graph, so they are never served from cache.
+    return bool(result) and "error" not in result and bool(result.get("data"))
+
+# Compiled workflows are cached here; nodes look up their database by id at call time,
+# so a graph compiled once stays valid across uploads.
+graph_registry = GraphRegistry()
+
+def get_graph(async_mode=False):
+    name = "nl2sql_async" if async_mode else "nl2sql"
+    return graph_registry.get(name, create_graph, max_retries=MAX_RETRIES, async_mode=async_mode,
+                              candidates=app.config['CANDIDATES'])
+
+def database_for(state: QueryState) -> DatabaseEntry:
+    database = databases.get(state["database_id"])
+    if database is None:
+        raise LookupError(f"Database {state['database_id']} is no longer loaded; upload it again")
+    return database
+
+def rollup_sql(database, engine, query):
+    """`query` rewritten onto a rollup table attached to `engine`, or None to use the raw table."""
+    if database.rollups is None or ROLLUP_SCHEMA not in engine.attach:
+        return None
+    return database.rollups.rewrite(query)
+
+def run_sql(database, query, max_rows, cancel=None):
+    engine = database.engine
+    rewritten = rollup_sql(database, engine, query)
+    start = time.perf_counter()
+    try:
+        columns, rows, truncated = engine.execute(rewritten or query, max_rows=max_rows, cancel=cancel)
+    except QueryCancelled:
+        raise
+    except QueryLimitExceeded as e:
+        metrics.inc("sql_limit_exceeded_total", labels={"limit": e.limit})
+        raise
+    except Exception:
+        metrics.inc("sql_errors_total")
+        raise
+    elapsed = time.perf_counter() - start
+    metrics.observe("sql_seconds", elapsed)
+    metrics.observe("sql_rows", len(rows))
+    tracer.event("execute_query", "sql", query_hash=short_hash(query), rows=len(rows),
+                 truncated=truncated, sql_ms=round(elapsed * 1000, 3), rollup=rewritten is not None)
+    if rewritten is not None:
+        metrics.inc("rollup_rewrites_total")
+    elif database.advisor is not None:
+        db_executor.submit(advise_indexes, database, query)
+    return columns, rows, truncated
+
+def advise_indexes(database, query):
+    # Runs on db_executor, off the request path.
+    index = database.advisor.observe(database.engine, query)
+    if index is None:
+        return
+    try:
+        path = database.advisor.build([index])
+    except Exception:
+        logging.exception("index advisor: building %s failed", index)
+        return
+    with database.lock:
+        if not databases.is_registered(database):
+            database.advisor.remove_copy(path)
+            return
+        previous = database.engine.path
+        database.replace_engine(open_engine(path, database.rollups))
+    database.advisor.remove_copy(previous)
+    metrics.inc("indexes_built_total")
+    tracer.event("index_advisor", "built", table=index[0], columns=list(index[1]))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def create_graph(max_retries=MAX_RETRIES, async_mode=False, candidates=1):
+    def build_messages(state: QueryState, prepared_history):
+        """The generate_query prompt; `prepared_history` is history_manager.(a)prepare's result."""
+        tracer.state("generate_query", "input", state)
+
+        # The schema/sample prefix is built once per upload, unless the schema is large
+        # enough to be linked per question.
+        database = database_for(state)
+        prefix = prompt_for(database, state)
+        tracer.event("generate_query", "prompt", version=PROMPT_VERSION, prefix=prefix_hash(prefix))
+
+        history, history_report = prepared_history
+        tracer.event("generate_query", "history", **history_report)
+        matches = database.values.resolve(state["question"]) if database.values else []
+        hints = (example_hint(database, state["question"], matches), value_hint(matches))
+        return assemble(prefix, history, hints, state["question"]), history_report
+
+    def prepare_history(state: QueryState):
+        return history_manager.prepare(state.get("history", []), state["question"])
+
+    async def prepare_history_async(state: QueryState):
+        # Summarizing old turns is an LLM call of its own; it must not block the event loop.
+        return await history_manager.aprepare(state.get("history", []), state["question"])
+
+    def generate_query(state: QueryState) -> QueryState:
+        messages, history_report = build_messages(state, prepare_history(state))
         response = llm.invoke(messages)
+        return query_generated(state, response, history_report)
+
+    async def generate_query_async(state: QueryState) -> QueryState:
+        messages, history_report = build_messages(state, await prepare_history_async(state))
+        response = await llm.ainvoke(messages)
+        return query_generated(state, response, history_report)
+
+    def query_generated(state: QueryState, response, history_report) -> QueryState:
         sql_query = response.content.strip() if hasattr(response, "content") else response.strip()
         
         new_history = state.get("history", []) + [
@@ -157,23 +639,55 @@ def create_graph():
             "history": new_history,
             "question": state["question"],
             "retries": state.get("retries", 0),
-            "result": None
+            "result": None,
+            "history_tokens_saved": history_report["tokens_saved"]
         }
-        logging.info(f"generate_query: Output State: {output_state}")
+        tracer.state("generate_query", "output", output_state)
         return output_state
 
-    def execute_query(state: QueryState) -> QueryState:
-        logging.info(f"execute_query: Input State: {state}")
+    def validate_query(state: QueryState) -> QueryState:
+        # Compile the SQL locally and fix what can be fixed deterministically, so only
+        # queries that really need rethinking go back to the LLM.
+        if not app.config['SQL_REPAIR']:
+            return {}
+        try:
+            repair = database_for(state).repairer.repair(state["sql_query"])
+        except LookupError:
+            return {}  # execute_query reports the missing database
+        for fix in repair["fixes"]:
+            metrics.inc("sql_repairs_total", labels={"fix": fix.split()[0]})
+        if repair["avoided_retry"]:
+            metrics.inc("llm_retries_avoided_total")
+        tracer.event("validate_query", "repair", query_hash=short_hash(state["sql_query"]),
+                     fixes=repair["fixes"], error=repair["error"])
+        output_state = {
+            "sql_query": repair["sql"],
+            "sql_repairs": state.get("sql_repairs", []) + repair["fixes"]
+        }
+        if repair["sql"] != state["sql_query"]:
+            # Keep the repaired query in the conversation so follow-ups build on it.
+            output_state["history"] = state["history"][:-1] + [{"role": "assistant", "content": repair["sql"]}]
+        if repair["error"] is not None:
+            output_state["result"] = {"error": repair["error"]}
+        return output_state
+
+    async def validate_query_async(state: QueryState) -> QueryState:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, validate_query, state)
+
+    def execute_query(state: QueryState, cancel=None) -> QueryState:
+        tracer.state("execute_query", "input", state)
         try:
             query = state["sql_query"]
             result = {"columns": [], "data": []}
 
-            raw_query_result = db.run(query, fetch="cursor")
-            query_result = list(raw_query_result.mappings())
+            row_limit = state.get("row_limit") or app.config['MAX_RESULT_ROWS']
+            columns, rows, truncated = run_sql(database_for(state), query, row_limit, cancel)
 
-            if query_result:
-                result["columns"] = list(query_result[0].keys())
-                result["data"] = [dict(row) for row in query_result]
+            if rows:
+                result["columns"] = columns
+                result["data"] = [dict(zip(columns, row)) for row in rows]
+                result["truncated"] = truncated
             
             output_state = {
                 "result": result,
@@ -182,10 +696,12 @@ def create_graph():
                 "question": state["question"],
                 "retries": state["retries"]
             }
-            logging.info(f"execute_query: Output State: {output_state}")
+            tracer.state("execute_query", "output", output_state)
             return output_state
         except Exception as e:
             error_result = {"error": str(e)}
+            if isinstance(e, QueryLimitExceeded):
+                error_result["limit"] = e.limit
             output_state = {
                 "result": error_result,
                 "history": state["history"],
@@ -193,11 +709,61 @@ def create_graph():
                 "question": state["question"],
                 "retries": state["retries"]
             }
-            logging.info(f"execute_query: Error Output State: {output_state}")
+            tracer.state("execute_query", "error", output_state)
             return output_state
 
+    async def execute_query_async(state: QueryState) -> QueryState:
+        # SQLite calls block, so they run on a bounded pool instead of the event loop.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, execute_query, state)
+
+    def llm_for_candidate(index):
+        # The first candidate is the greedy query the serial path would have produced.
+        return llm if index == 0 else candidate_llm
+
+    def candidate_query(state: QueryState, response, history_report, cancel) -> QueryState:
+        # validate_query and execute_query for one candidate, outside the graph.
+        candidate = {**state, **query_generated(state, response, history_report)}
+        candidate.update(validate_query(candidate))
+        if "error" not in (candidate.get("result") or {}) and not cancel.is_set():
+            candidate.update(execute_query(candidate, cancel))
+        return candidate
+
+    def candidate_failed(state: QueryState, error: Exception) -> QueryState:
+        # Shaped like a candidate that ran, so routing and prepare_retry work even if every one raised.
+        return {**state, "sql_query": "", "result": {"error": str(error)}}
+
+    def candidates_voted(candidate: QueryState, vote, done) -> QueryState:
+        metrics.observe("candidate_votes", vote["votes"])
+        if vote["cancelled"]:
+            metrics.inc("candidates_cancelled_total", vote["cancelled"])
+        tracer.event("generate_candidates", "vote", candidates=len(done),
+                     distinct_sql=len({other.get("sql_query") for other in done.values()}), **vote)
+        return candidate
+
+    def generate_candidates(state: QueryState) -> QueryState:
+        messages, history_report = build_messages(state, prepare_history(state))
+
+        def run(index, cancel):
+            response = llm_for_candidate(index).invoke(messages)
+            return candidate_query(state, response, history_report, cancel)
+
+        return candidates_voted(*race(run, candidates, candidate_executor, lambda candidate: candidate.get("result"),
+                                      lambda error: candidate_failed(state, error)))
+
+    async def generate_candidates_async(state: QueryState) -> QueryState:
+        messages, history_report = build_messages(state, await prepare_history_async(state))
+        loop = asyncio.get_running_loop()
+
+        async def run(index, cancel):
+            response = await llm_for_candidate(index).ainvoke(messages)
+            return await loop.run_in_executor(db_executor, candidate_query, state, response, history_report, cancel)
+
+        return candidates_voted(*await race_async(run, candidates, lambda candidate: candidate.get("result"),
+                                                  lambda error: candidate_failed(state, error)))
+
     def prepare_retry(state: QueryState) -> QueryState:
-        logging.info(f"prepare_retry: Input State: {state}")
+        tracer.state("prepare_retry", "input", state)
         new_retries = state["retries"] + 1
         result = state.get("result", {})
 
@@ -216,28 +782,53 @@ def create_graph():
             "retries": new_retries,
             "history": new_history
         }
-        logging.info(f"prepare_retry: Output State: {output_state}")
+        tracer.state("prepare_retry", "output", output_state)
         return output_state
 
     def should_retry(state: QueryState) -> bool:
-        logging.info(f"should_retry: Input State: {state}")
         result = state.get("result", {})
 
         has_error = "error" in result
         is_empty = (result.get("columns") == [] and result.get("data") == [])
 
         retries = state.get("retries", 0)
-        should_retry_val = (has_error or is_empty) and retries < 3
+        should_retry_val = (has_error or is_empty) and retries < max_retries
 
-        logging.info(f"should_retry: has_error={has_error}, retries={retries}, should_retry_val={should_retry_val}")
+        tracer.event("should_retry", "decision", has_error=has_error, is_empty=is_empty,
+                     retries=retries, retry=should_retry_val)
         return should_retry_val
 
-    graph = StateGraph(QueryState)
-    graph.add_node("generate_query", generate_query)
-    graph.add_node("execute_query", execute_query)
+    def after_validation(state: QueryState) -> str:
+        if "error" in (state.get("result") or {}):
+            return "prepare_retry" if should_retry(state) else END
+        return "execute_query"
+
+    # Every node added to this graph is timed under nl2sql_node_seconds{node=...}.
+    graph = InstrumentedStateGraph(QueryState, metrics)
+    if candidates > 1:
+        # Generation, validation and execution happen inside the node, once per candidate.
+        graph.add_node("generate_candidates", generate_candidates_async if async_mode else generate_candidates)
+        graph.add_node("prepare_retry", prepare_retry)
+        graph.set_entry_point("generate_candidates")
+        graph.add_conditional_edges("generate_candidates", should_retry, {True: "prepare_retry", False: END})
+        graph.add_edge("prepare_retry", "generate_candidates")
+        return graph.compile()
+
+    graph.add_node("generate_query", generate_query_async if async_mode else generate_query)
+    graph.add_node("validate_query", validate_query_async if async_mode else validate_query)
+    graph.add_node("execute_query", execute_query_async if async_mode else execute_query)
     graph.add_node("prepare_retry", prepare_retry)
     graph.set_entry_point("generate_query")
-    graph.add_edge("generate_query", "execute_query")
+    graph.add_edge("generate_query", "validate_query")
+    graph.add_conditional_edges(
+        "validate_query",
+        after_validation,
+        {
+            "execute_query": "execute_query",
+            "prepare_retry": "prepare_retry",
+            END: END
+        }
+    )
     graph.add_conditional_edges(
         "execute_query",
         should_retry,
@@ -251,4 +842,5 @@ def create_graph():
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)  # Enable logging
+    get_graph()  # compile the workflow once before serving requests
     app.run(debug=True)
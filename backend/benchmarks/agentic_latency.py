@@ -0,0 +1,71 @@
+"""Agentic pipeline latency: always complexify + inline explanation vs. the classifier + background explanation.
+
+Runs each question through agentic-app's graph both ways with stub LLMs
+(~300ms per call), so the difference is the LLM round trips (and SQL runs)
+taken off the response path; the `calls` columns count them. Questions the
+classifier still complexifies ("why", "highest") only lose the explanation
+call, so they save about half of what plain lookups save. Run from the
+backend directory:
+    python -m benchmarks.agentic_latency [iterations]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import StubLLM, load_app, make_cpi_db, upload_db
+from functions.complexity import refinement_reason
+
+QUESTIONS = [
+    "show data for andhra, tn, up in october 2024",
+    "what was the inflation in Kerala in March 2024",
+    "show rows for tn in december 2024",
+    "inflation summary for year 2024 by months",
+    "compare sector-wise inflation",
+    "which state had the highest inflation in 2023",
+    "why did food prices rise in 2024",
+]
+
+
+def main(iterations=3):
+    module = load_app("agentic-app.py")
+    module.llm = StubLLM()
+    module.explanation_llm = StubLLM(sql="Explanation.")
+    before = module.create_graph(complexify="always", explain=True)
+    after = module.create_graph(complexify="auto", explain=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        database = module.databases.get(upload_db(module, path)["database_id"])
+
+        def answer(graph, question, background):
+            """(seconds until the answer, LLM calls made before it)."""
+            sql_calls = module.llm.calls
+            start = time.perf_counter()
+            state = graph.invoke(module.new_query_state(database, question, []))
+            calls = module.llm.calls - sql_calls
+            if background:
+                # What the response waits for: the explanation job is only submitted.
+                module.explanations.submit(lambda: module.explain_answer(state))
+            else:
+                calls += 1  # explain_action ran inline
+            return time.perf_counter() - start, calls
+
+        saved = []
+        print(f"{'question':<48} {'before':>8} {'after':>8} {'saved':>8}  calls  complexify")
+        for question in QUESTIONS:
+            old_runs = [answer(before, question, False) for _ in range(iterations)]
+            new_runs = [answer(after, question, True) for _ in range(iterations)]
+            old = statistics.median(seconds for seconds, _ in old_runs)
+            new = statistics.median(seconds for seconds, _ in new_runs)
+            saved.append(old - new)
+            reason = refinement_reason(question, module.llm.sql) or "skipped"
+            print(f"{question:<48} {old * 1000:7.0f}ms {new * 1000:7.0f}ms {(old - new) * 1000:7.0f}ms  "
+                  f"{old_runs[0][1]} -> {new_runs[0][1]}  {reason}")
+        print(f"\nsaved per question: mean {statistics.mean(saved) * 1000:.0f}ms, "
+              f"min {min(saved) * 1000:.0f}ms, max {max(saved) * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,88 @@
+"""Load test of /api/ask: thread-per-request WSGI vs. the asyncio (ASGI) serving mode.
+
+Both modes talk to a local stub LLM, so no network or API key is needed.
+Run from the backend directory:
+    python -m benchmarks.async_load [requests] [concurrency]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import StubLLM, load_app, make_cpi_db, percentile, upload_db
+
+WSGI_WORKERS = 8
+
+
+def report(label, latencies, elapsed):
+    print(f"{label:<28} throughput={len(latencies) / elapsed:8.1f} req/s  "
+          f"p50={percentile(latencies, 50) * 1000:7.1f}ms  "
+          f"p95={percentile(latencies, 95) * 1000:7.1f}ms  "
+          f"p99={percentile(latencies, 99) * 1000:7.1f}ms")
+
+
+def run_wsgi(module, database_id, requests):
+    client = module.app.test_client()
+
+    def ask(i):
+        start = time.perf_counter()
+        response = client.post("/api/ask", json={"database_id": database_id, "question": f"inflation by year #{i}", "history": []})
+        assert response.status_code == 200, response.get_json()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WSGI_WORKERS) as pool:
+        latencies = list(pool.map(ask, range(requests)))
+    report(f"wsgi ({WSGI_WORKERS} workers)", latencies, time.perf_counter() - start)
+
+
+async def run_asgi(module, database_id, requests, concurrency):
+    asgi_app = module.create_asgi()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def ask(i):
+        body = json.dumps({"database_id": database_id, "question": f"inflation by year #{i}", "history": []}).encode()
+        scope = {"type": "http", "method": "POST", "path": "/api/ask", "headers": []}
+        status = {}
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        async with limit:
+            start = time.perf_counter()
+            await asgi_app(scope, receive, send)
+            assert status["code"] == 200, status
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(ask(i) for i in range(requests)))
+    report(f"asgi ({concurrency} in flight)", latencies, time.perf_counter() - start)
+
+
+def main(requests=400, concurrency=200):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cpi.db")
+        rows = make_cpi_db(db_path, years=range(2020, 2025))
+        print(f"synthetic CPI rows: {rows}, stub LLM latency ~300ms")
+
+        for filename in ("app.py", "agentic-app.py"):
+            module = load_app(filename)
+            module.llm = StubLLM()
+            if hasattr(module, "explanation_llm"):
+                module.explanation_llm = StubLLM(sql="Explanation.")
+            database_id = upload_db(module, db_path)["database_id"]
+            print(f"\n{filename}")
+            run_wsgi(module, database_id, requests // 4)
+            asyncio.run(run_asgi(module, database_id, requests, concurrency))
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
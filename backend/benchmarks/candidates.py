@@ -0,0 +1,125 @@
+"""One query per attempt (retrying on errors) vs. racing N candidates and voting on results.
+
+A simulated model answers after a gaussian delay with a slow tail and is
+wrong part of the time: invalid SQL, or a runaway self-join that returns a
+wrong count after a second or two. The serial path retries invalid SQL like the
+graph does; the candidate path uses functions.candidates.race on a thread
+pool against a real ReadOnlyEngine, so candidates abandoned after a quorum are
+stopped through the progress handler. Run from the backend directory:
+    python -m benchmarks.candidates [questions] [candidates]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import make_cpi_db, summarize, time_calls
+from functions.candidates import race
+from functions.sqlite_engine import QueryCancelled, ReadOnlyEngine
+
+MAX_RETRIES = 3
+CORRECT = [
+    'SELECT Year, AVG("Inflation (%)") FROM data GROUP BY Year',
+    'SELECT Year AS y, AVG("Inflation (%)") AS avg_inflation FROM data GROUP BY Year ORDER BY Year DESC',
+]
+INVALID = 'SELECT Yr, AVG(Inflation) FROM data GROUP BY Yr'
+RUNAWAY = 'SELECT COUNT(*) FROM data a, data b WHERE a.Year >= 2023 AND b.Year = 2024 AND a."Index" < b."Index"'
+EXPECTED_ROWS = 12
+
+
+class SimulatedModel:
+    def __init__(self, latency_ms=800.0, jitter_ms=200.0, slow_rate=0.1, invalid_rate=0.3,
+                 runaway_rate=0.05, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_rate = slow_rate
+        self.invalid_rate = invalid_rate
+        self.runaway_rate = runaway_rate
+        self._rng = random.Random(seed)
+
+    def sample(self):
+        """(delay in seconds, SQL) for one call."""
+        roll = self._rng.random()
+        delay = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        if self._rng.random() < self.slow_rate:
+            delay *= 3
+        if roll < self.invalid_rate:
+            return delay, INVALID
+        if roll < self.invalid_rate + self.runaway_rate:
+            return delay, RUNAWAY
+        return delay, self._rng.choice(CORRECT)
+
+
+def run_query(engine, sql, cancel=None):
+    try:
+        columns, rows, _ = engine.execute(sql, max_rows=1000, cancel=cancel)
+    except QueryCancelled:
+        raise
+    except sqlite3.Error as e:
+        return {"error": str(e)}
+    return {"columns": columns, "data": [dict(zip(columns, row)) for row in rows]}
+
+
+def serial(model, engine, sleep):
+    for _ in range(MAX_RETRIES + 1):
+        delay, sql = model.sample()
+        sleep(delay)
+        result = run_query(engine, sql)
+        if "error" not in result and result["data"]:
+            return result
+    return result
+
+
+def candidates(model, engine, executor, n, sleep):
+    samples = [model.sample() for _ in range(n)]
+
+    def run(index, cancel):
+        delay, sql = samples[index]
+        # The model call itself is not interruptible; only the SQL is.
+        sleep(delay)
+        if cancel.is_set():
+            return {"result": None}
+        try:
+            return {"result": run_query(engine, sql, cancel)}
+        except QueryCancelled as e:
+            return {"result": {"error": str(e)}}
+
+    for _ in range(MAX_RETRIES + 1):
+        winner, _, _ = race(run, n, executor, lambda candidate: candidate["result"])
+        result = winner["result"]
+        if "error" not in result and result["data"]:
+            return result
+    return result
+
+
+def main(questions=40, n=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        # The apps' default QUERY_TIMEOUT_SECONDS.
+        engine = ReadOnlyEngine(path, pool_size=16, timeout_seconds=5)
+        executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="candidate")
+        outcomes = {}
+
+        def timed(label, fn):
+            correct = []
+            timings = time_calls(lambda: correct.append(len(fn().get("data") or []) == EXPECTED_ROWS), questions)
+            outcomes[label] = sum(correct)
+            summarize(label, timings)
+
+        model = SimulatedModel(seed=1)
+        timed("serial with retries", lambda: serial(model, engine, time.sleep))
+        model = SimulatedModel(seed=1)
+        timed(f"{n} candidates, early quorum", lambda: candidates(model, engine, executor, n, time.sleep))
+        print()
+        for label, correct in outcomes.items():
+            print(f"{label:<40} correct answers: {correct}/{questions}")
+        executor.shutdown(wait=True)
+        engine.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,148 @@
+import asyncio
+import importlib.util
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(filename="app.py"):
+    """Import one of the Flask apps by file name (agentic-app.py is not a valid module name)."""
+    # ChatOpenAI refuses to start without a key; benchmarks never hit the network.
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    module_name = os.path.splitext(filename)[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(BACKEND_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_calls(fn, iterations):
+    """Run `fn` `iterations` times and return per-call wall times in seconds."""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(label, timings):
+    mean_ms = statistics.mean(timings) * 1000
+    p50_ms = percentile(timings, 50) * 1000
+    p95_ms = percentile(timings, 95) * 1000
+    print(f"{label:<40} mean={mean_ms:9.3f}ms  p50={p50_ms:9.3f}ms  p95={p95_ms:9.3f}ms  n={len(timings)}")
+    return mean_ms
+
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+STATES = ["All India", "Andhra Pradesh", "Karnataka", "Kerala", "Maharashtra",
+          "Tamil Nadu", "Uttar Pradesh", "West Bengal"]
+SECTORS = ["Rural", "Urban", "Combined"]
+GROUPS = {
+    "Food and Beverages": ["Cereals and Products", "Meat and Fish", "Egg", "Milk and Products", "Oils and Fats"],
+    "Fuel and Light": ["Fuel and Light"],
+    "Housing": ["Housing"],
+    "Clothing and Footwear": ["Clothing", "Footwear"],
+}
+
+
+def make_cpi_db(path, years=range(2013, 2025), scale=1):
+    """Write a synthetic CPI database with the same `data` table as functions/preprocess.py."""
+    rng = random.Random(42)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE data (
+        BaseYear INTEGER,
+        Year INTEGER,
+        Month TEXT,
+        State TEXT,
+        Sector TEXT,
+        "Group" TEXT,
+        SubGroup TEXT,
+        "Index" REAL,
+        "Inflation (%)" REAL
+    )
+    ''')
+    rows = (
+        (2012, year, month, state, sector, group, subgroup,
+         round(rng.uniform(100, 250), 1), round(rng.uniform(-2, 15), 2))
+        for _ in range(scale)
+        for year in years
+        for month in MONTHS
+        for state in STATES
+        for sector in SECTORS
+        for group, subgroups in GROUPS.items()
+        for subgroup in subgroups
+    )
+    conn.executemany("INSERT INTO data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+    conn.close()
+    return count
+
+
+class StubMessage:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+class StubLLM:
+    """Stands in for the fine-tuned model: fixed SQL after a gaussian delay."""
+
+    def __init__(self, sql='SELECT Year, AVG("Inflation (%)") FROM data GROUP BY Year;',
+                 latency_ms=300.0, jitter_ms=50.0, seed=0):
+        self.sql = sql
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        # How many replies were drawn, across invoke, ainvoke and stream.
+        self.calls = 0
+
+    def _delay(self):
+        self.calls += 1
+        return max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self._delay())
+        return StubMessage(self.sql)
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self._delay())
+        return StubMessage(self.sql)
+
+    def stream(self, messages, **kwargs):
+        # The delay is spread over the tokens, as a streamed reply's would be.
+        words = self.sql.split(" ")
+        delay = self._delay() / len(words)
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            yield StubMessage(word if i == 0 else " " + word)
+
+
+def upload_db(module, path):
+    """Push a database through the app's own /api/upload handler."""
+    with open(path, "rb") as f:
+        response = module.app.test_client().post(
+            "/api/upload", data={"file": (f, os.path.basename(path))},
+            content_type="multipart/form-data")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
@@ -0,0 +1,60 @@
+"""agentic-app: /api/ask vs. the server-sent events of /api/ask/events.
+
+Both run the same question through the graph with stub LLMs (~300ms per
+call). For the event stream this reports when the first byte, the first SQL,
+the first result rows, the answer and the end of the explanation arrive.
+Run from the backend directory:
+    python -m benchmarks.event_stream [iterations]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import StubLLM, load_app, make_cpi_db, upload_db
+
+QUESTION = "compare food and fuel inflation over the years"
+MILESTONES = ("start", "sql", "result", "answer", "done")
+
+
+def main(iterations=5):
+    module = load_app("agentic-app.py")
+    module.app.config['EXPLANATION'] = 'inline'  # /api/ask as before: one response with everything
+    module.llm = StubLLM()
+    module.explanation_llm = StubLLM(sql="The query groups the rows by year and averages inflation for each group.")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        database_id = upload_db(module, path)["database_id"]
+        client = module.app.test_client()
+        payload = {"database_id": database_id, "question": QUESTION, "history": []}
+
+        blocking = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = client.post("/api/ask", json=payload)
+            assert response.status_code == 200, response.get_json()
+            blocking.append(time.perf_counter() - start)
+
+        arrivals = {name: [] for name in MILESTONES}
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = client.post("/api/ask/events", json=payload, buffered=False)
+            seen = set()
+            for chunk in response.response:
+                for line in chunk.decode().splitlines():
+                    name = line[len("event: "):] if line.startswith("event: ") else None
+                    if name in arrivals and name not in seen:
+                        seen.add(name)
+                        arrivals[name].append(time.perf_counter() - start)
+            response.close()
+
+        print(f"{'/api/ask (everything at once)':<40} {statistics.median(blocking) * 1000:8.1f}ms")
+        for name in MILESTONES:
+            if arrivals[name]:
+                print(f"{'/api/ask/events first ' + repr(name):<40} {statistics.median(arrivals[name]) * 1000:8.1f}ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,85 @@
+"""Few-shot examples: every example on every call vs. the k most similar from ExampleStore.
+
+Fills a store with the vetted CPI examples plus generated question/SQL pairs,
+then measures prompt size, retrieval latency and start-up (reopening the file,
+index included). Run from the backend directory:
+    python -m benchmarks.example_store [examples]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import GROUPS, MONTHS, SECTORS, STATES, summarize, time_calls
+from functions.example_store import CPI_SIGNATURE, SEED_EXAMPLES, ExampleStore
+from functions.history import count_tokens
+from functions.value_index import ValueIndex
+
+QUESTIONS = [
+    ("monthly inflation trend for 2023", "inflation summary for year 2024 by months"),
+    ("which subgroups drive inflation in Kerala in 2024", "what factors are affecting inflation rate of Karnataka in 2024"),
+    ("food versus fuel inflation over the years", "compare food and fuel inflation in combined sector"),
+    ("show rows for tn and up in december 2024", "show data for andhra, tn, up in october 2024"),
+    ("rural vs urban inflation by year", "compare sector-wise inflation"),
+]
+
+
+def generated_examples(count, seed=3):
+    rng = random.Random(seed)
+    templates = [
+        ("average inflation in {state} for {year}",
+         "SELECT AVG(`Inflation (%)`) FROM data WHERE `State` = '{state}' AND `Year` = {year};"),
+        ("highest index in {month} {year} by state",
+         "SELECT `State`, MAX(`Index`) FROM data WHERE `Month` = '{month}' AND `Year` = {year} GROUP BY `State`;"),
+        ("{state} inflation by subgroup in {year}",
+         "SELECT `SubGroup`, AVG(`Inflation (%)`) FROM data WHERE `State` = '{state}' AND `Year` = {year} "
+         "GROUP BY `SubGroup`;"),
+    ]
+    for _ in range(count):
+        question, sql = rng.choice(templates)
+        values = {"state": rng.choice(STATES), "year": rng.randint(2013, 2024), "month": rng.choice(MONTHS)}
+        yield question.format(**values), sql.format(**values)
+
+
+def prompt_tokens(examples):
+    return count_tokens([{"role": "system", "content": ExampleStore.describe(examples)}])
+
+
+def main(count=500, iterations=200):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "examples.db")
+        store = ExampleStore(path)
+        store.seed()
+        learned = sum(store.learn(CPI_SIGNATURE, "benchmark", question, sql) for question, sql in generated_examples(count))
+        store.close()
+
+        start = time.perf_counter()
+        store = ExampleStore(path)
+        store.similar(CPI_SIGNATURE, QUESTIONS[0][0], owner="benchmark")
+        print(f"{store.count()} examples ({learned} learned); reopen + first lookup "
+              f"{(time.perf_counter() - start) * 1000:.1f}ms\n")
+
+        values = ValueIndex({("data", "State"): STATES, ("data", "Sector"): SECTORS, ("data", "Month"): MONTHS,
+                             ("data", "Group"): list(GROUPS)})
+
+        def similar(question):
+            # As in the apps: the columns of mentioned values widen the search.
+            columns = sorted({match["column"] for match in values.resolve(question)})
+            return store.similar(CPI_SIGNATURE, question, 3, columns, owner="benchmark")
+
+        everything = [dict(question=q, sql=s, source="seed", score=0.0) for q, s in SEED_EXAMPLES]
+        hits = 0
+        for question, expected in QUESTIONS:
+            examples = similar(question)
+            hits += any(example["question"] == expected for example in examples)
+            print(f"{question:<52} {prompt_tokens(examples):4d} tokens  top: {examples[0]['question'] if examples else '-'}")
+        print(f"\nall {len(SEED_EXAMPLES)} seed examples: {prompt_tokens(everything)} tokens; "
+              f"all {store.count()}: {prompt_tokens(everything) * store.count() // len(SEED_EXAMPLES)} tokens (est.)")
+        print(f"expected seed example in the top 3 for {hits}/{len(QUESTIONS)} questions\n")
+        summarize("resolve + similar(k=3)", time_calls(lambda: similar(QUESTIONS[1][0]), iterations))
+        store.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
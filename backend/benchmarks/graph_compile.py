@@ -0,0 +1,24 @@
+"""Per-request graph overhead: building a fresh graph vs. reusing the compiled one.
+
+Run from the backend directory:
+    python -m benchmarks.graph_compile [iterations]
+"""
+import sys
+
+from benchmarks.common import load_app, summarize, time_calls
+
+
+def main(iterations=200):
+    for filename in ("app.py", "agentic-app.py"):
+        module = load_app(filename)
+        module.graph_registry.invalidate()
+
+        print(f"\n{filename}")
+        before = summarize("create_graph() per request", time_calls(module.create_graph, iterations))
+        module.get_graph()  # warm the registry, as done at startup
+        after = summarize("get_graph() per request", time_calls(module.get_graph, iterations))
+        print(f"{'saved per request':<40} {before - after:9.3f}ms  (builds={module.graph_registry.builds})")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
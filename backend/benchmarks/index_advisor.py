@@ -0,0 +1,64 @@
+"""Query latency before and after the index advisor has seen a workload.
+
+The workload is the few-shot examples from original.py, run against a synthetic
+CPI `data` table (functions/preprocess.py layout, no indexes). Run from the backend directory:
+    python -m benchmarks.index_advisor [scale]
+"""
+import os
+import sys
+import tempfile
+
+from benchmarks.common import make_cpi_db, summarize, time_calls
+from functions.index_advisor import IndexAdvisor
+from functions.sqlite_engine import ReadOnlyEngine
+
+WORKLOAD = {
+    "year + months": "SELECT * FROM data WHERE `Year` = 2024 AND `Month` IN ('October', 'November', 'December') LIMIT 5;",
+    "monthly summary": "SELECT `Month`, AVG(`Inflation (%)`) FROM data WHERE `Year` = 2024 GROUP BY `Month`;",
+    "states in a month": "SELECT * FROM data WHERE `Year` = 2024 AND `Month` = 'October' "
+                         "AND `State` IN ('Andhra Pradesh', 'Tamil Nadu', 'Uttar Pradesh');",
+    "sector-wise": "SELECT `Year`, AVG(`Inflation (%)`) FROM data WHERE `Sector` IN ('Rural', 'Urban') GROUP BY `Year`;",
+    "food vs fuel": "SELECT `Year`, AVG(`Inflation (%)`) FROM data WHERE `Sector` = 'Combined' "
+                    "AND `Group` IN ('Food and Beverages', 'Fuel and Light') GROUP BY `Year`;",
+    "state drivers": "SELECT `SubGroup`, AVG(`Inflation (%)`) AS a FROM data WHERE `Year` = 2024 "
+                     "AND `State` = 'Karnataka' GROUP BY `SubGroup` ORDER BY a DESC LIMIT 5;",
+}
+
+
+def run_workload(engine, iterations):
+    return {label: summarize(f"  {label}", time_calls(lambda: engine.execute(sql), iterations))
+            for label, sql in WORKLOAD.items()}
+
+
+def main(scale=4, iterations=30):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        rows = make_cpi_db(path, scale=scale)
+        print(f"{rows:,} rows\n\nbefore (no indexes)")
+        engine = ReadOnlyEngine(path)
+        before = run_workload(engine, iterations)
+
+        advisor = IndexAdvisor(path, min_observations=3)
+        indexes = []
+        for _ in range(advisor.min_observations):
+            for sql in WORKLOAD.values():
+                index = advisor.observe(engine, sql)
+                if index is not None:
+                    indexes.append(index)
+        engine.close()
+        print("\nindexes:")
+        for table, columns in indexes:
+            print(f"  {table}({', '.join(columns)})")
+
+        engine = ReadOnlyEngine(advisor.build(indexes))
+        print("\nafter")
+        after = run_workload(engine, iterations)
+        engine.close()
+
+        print("\nspeedup (mean)")
+        for label in WORKLOAD:
+            print(f"  {label:<20} {before[label] / after[label]:6.1f}x")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
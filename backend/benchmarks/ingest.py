@@ -0,0 +1,70 @@
+"""Loading a CPI-shaped TSV: chunked ingest_file vs. the old pandas read_csv + to_sql.
+
+The pandas path is skipped when pandas is not installed. Run from the backend directory:
+    python -m benchmarks.ingest [scale]
+"""
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import make_cpi_db
+from functions.ingest import DATA_SCHEMA, ingest_file
+
+
+def write_tsv(db_path, tsv_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        with open(tsv_path, "w", newline="") as f:
+            writer = csv.writer(f, delimiter="\t")
+            writer.writerow([name for name, _ in DATA_SCHEMA])
+            writer.writerows(conn.execute("SELECT * FROM data"))
+    finally:
+        conn.close()
+
+
+def measure(label, fn, rows):
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    # A second, traced run for peak memory; tracemalloc slows the timed run down a lot.
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {seconds:7.2f}s  {rows / seconds:>10,.0f} rows/sec  peak={peak / 2**20:7.1f}MB")
+
+
+def pandas_load(tsv_path, db_path):
+    import pandas as pd
+
+    df = pd.read_csv(tsv_path, sep="\t", na_values=["*"])
+    conn = sqlite3.connect(db_path)
+    try:
+        df.to_sql("data", conn, if_exists="replace", index=False)
+    finally:
+        conn.close()
+
+
+def main(scale=8):
+    with tempfile.TemporaryDirectory() as tmp:
+        source_db = os.path.join(tmp, "source.db")
+        tsv_path = os.path.join(tmp, "cpi.tsv")
+        rows = make_cpi_db(source_db, scale=scale)
+        write_tsv(source_db, tsv_path)
+        print(f"{rows:,} rows, {os.path.getsize(tsv_path) / 2**20:.1f}MB TSV\n")
+
+        measure("ingest_file", lambda: ingest_file(tsv_path, os.path.join(tmp, "ingest.db")), rows)
+        try:
+            import pandas  # noqa: F401
+        except ImportError:
+            print("pandas not installed; skipping read_csv + to_sql")
+        else:
+            measure("pandas read_csv + to_sql", lambda: pandas_load(tsv_path, os.path.join(tmp, "pandas.db")), rows)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,63 @@
+"""Per-node logging cost: f-string state dumps vs. StateTracer summaries.
+
+Uses a state shaped like execute_query's output on a large result and a long
+conversation, with the handler writing to a null stream. Run from the backend directory:
+    python -m benchmarks.logging_overhead [rows]
+"""
+import io
+import logging
+import os
+import sys
+import tempfile
+
+from benchmarks.common import make_cpi_db, summarize, time_calls
+from functions.sqlite_engine import ReadOnlyEngine
+from functions.tracing import StateTracer
+
+
+def make_state(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        engine = ReadOnlyEngine(path)
+        columns, data, _ = engine.execute(f"SELECT * FROM data LIMIT {rows};")
+        engine.close()
+    history = []
+    for i in range(20):
+        history.append({"role": "user", "content": f"Question {i} about inflation in Kerala by month"})
+        history.append({"role": "assistant", "content": "SELECT Month, AVG(\"Inflation (%)\") FROM data GROUP BY Month;"})
+    return {
+        "question": "Show every row for 2024",
+        "sql_query": f"SELECT * FROM data LIMIT {rows};",
+        "history": history,
+        "retries": 0,
+        "result": {"columns": columns, "data": [dict(zip(columns, row)) for row in data], "truncated": False},
+    }
+
+
+def main(rows=10000, iterations=30):
+    state = make_state(rows)
+    print(f"state: {len(state['result']['data'])} rows, {len(state['history'])} history messages\n")
+
+    logger = logging.getLogger("benchmarks.logging_overhead")
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+
+    def fstring():
+        # The pattern graph nodes used before: formatted even when INFO is off.
+        logger.info(f"execute_query: Output State: {state}")
+
+    def traced(tracer):
+        return lambda: tracer.state("execute_query", "output", state)
+
+    for level_name, level in (("INFO off", logging.WARNING), ("INFO on", logging.INFO)):
+        logger.setLevel(level)
+        print(level_name)
+        summarize("  f-string full state", time_calls(fstring, iterations))
+        summarize("  tracer summary", time_calls(traced(StateTracer(logger)), iterations))
+        summarize("  tracer, 1% full-state sampling",
+                  time_calls(traced(StateTracer(logger, sample_rate=0.01)), iterations))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
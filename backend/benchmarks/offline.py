@@ -0,0 +1,75 @@
+"""Offline regression and load run of both apps with LLM_PROVIDER=stub.
+
+The stub replays recorded question -> SQL pairs (LLM_STUB_RECORDINGS, or the
+vetted CPI examples by default) with simulated latency, so the full graph runs
+without network access or an API key. The regression pass checks that every
+recorded question comes back with its recorded SQL and a non-empty result; the
+load pass sends them concurrently through /api/ask. Run from the backend directory:
+    python -m benchmarks.offline [requests] [concurrency]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import load_app, make_cpi_db, percentile, upload_db
+from functions.example_store import SEED_EXAMPLES
+
+# Repeated questions would otherwise be answered by app.py's result cache.
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+
+def regression(module, database_id):
+    client = module.app.test_client()
+    failures = []
+    for question, expected in SEED_EXAMPLES:
+        body = client.post("/api/ask", json={"database_id": database_id, "question": question,
+                                             "history": []}).get_json()
+        result = body.get("result") or {}
+        if body.get("sql_query", "").rstrip(";") != expected.rstrip(";"):
+            failures.append(f"{question!r}: SQL changed to {body.get('sql_query')!r}")
+        elif "error" in result or not result.get("data"):
+            failures.append(f"{question!r}: {result.get('error') or 'empty result'}")
+    return failures
+
+
+def load(module, database_id, requests, concurrency):
+    client = module.app.test_client()
+
+    def ask(i):
+        question = SEED_EXAMPLES[i % len(SEED_EXAMPLES)][0]
+        start = time.perf_counter()
+        response = client.post("/api/ask", json={"database_id": database_id, "question": question, "history": []})
+        assert response.status_code == 200, response.get_json()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(ask, range(requests)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 95)
+
+
+def main(requests=200, concurrency=16):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        for filename in ("app.py", "agentic-app.py"):
+            module = load_app(filename)
+            settings = module.app.config['LLM']
+            database_id = upload_db(module, path)["database_id"]
+            failures = regression(module, database_id)
+            print(f"{filename}: provider={settings['provider']} latency={settings['distribution']} "
+                  f"{settings['latency_ms']:.0f}+/-{settings['jitter_ms']:.0f}ms")
+            print(f"  regression: {len(SEED_EXAMPLES) - len(failures)}/{len(SEED_EXAMPLES)} recorded answers reproduced")
+            for failure in failures:
+                print(f"    {failure}")
+            throughput, p50, p95 = load(module, database_id, requests, concurrency)
+            print(f"  load: {requests} requests, {concurrency} concurrent: {throughput:.1f} req/s  "
+                  f"p50={p50 * 1000:.0f}ms  p95={p95 * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,75 @@
+"""Prompt prefix stability and how much of each generate_query prompt a provider cache could serve.
+
+Builds the prefix the apps use (SchemaCache -> build_prefix) and replays a
+conversation, counting per request the tokens shared with the previous
+request; the stability checks themselves are in tests/test_prompt_builder.py.
+Token counts use tiktoken's o200k_base encoding when it can be loaded (it is
+downloaded on first use, or read from TIKTOKEN_CACHE_DIR) and are estimated
+otherwise; the first line says which. Providers cache whole blocks of a
+shared prefix once it reaches a minimum length (OpenAI: 1024 tokens, then
+128-token steps); the real hit rate is in nl2sql_llm_cached_prompt_ratio.
+Run from the backend directory:
+    python -m benchmarks.prompt_prefix
+"""
+import os
+import tempfile
+
+from langchain_community.utilities import SQLDatabase
+
+from benchmarks.common import make_cpi_db
+from functions.history import TOKEN_COUNTING, count_tokens
+from functions.prompt_builder import PROMPT_VERSION, assemble, build_prefix, prefix_hash
+from functions.schema_cache import SchemaCache
+
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+CONVERSATION = [
+    ("inflation summary for year 2024 by months", "SELECT `Month`, AVG(`Inflation (%)`) FROM data WHERE `Year` = 2024 GROUP BY `Month`;"),
+    ("and for 2023?", "SELECT `Month`, AVG(`Inflation (%)`) FROM data WHERE `Year` = 2023 GROUP BY `Month`;"),
+    ("only for kerala", "SELECT `Month`, AVG(`Inflation (%)`) FROM data WHERE `Year` = 2023 AND `State` = 'Kerala' GROUP BY `Month`;"),
+    ("compare with tamil nadu", "SELECT `State`, `Month`, AVG(`Inflation (%)`) FROM data WHERE `Year` = 2023 AND `State` IN ('Kerala', 'Tamil Nadu') GROUP BY `State`, `Month`;"),
+    ("which month was highest?", "SELECT `Month`, MAX(`Inflation (%)`) FROM data WHERE `Year` = 2023;"),
+]
+
+
+def cacheable(tokens):
+    if tokens < CACHE_MIN_TOKENS:
+        return 0
+    return CACHE_MIN_TOKENS + (tokens - CACHE_MIN_TOKENS) // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+
+
+def shared_tokens(previous, current):
+    shared = 0
+    while shared < min(len(previous), len(current)) and previous[shared] == current[shared]:
+        shared += 1
+    return count_tokens(current[:shared])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        first = build_prefix(SchemaCache().get_or_build(path, SQLDatabase.from_uri(f"sqlite:///{path}")))
+    print(f"token counts: {TOKEN_COUNTING}")
+    print(f"prompt version {PROMPT_VERSION}, prefix {prefix_hash(first)}: {count_tokens(first)} tokens\n")
+
+    history, previous = [], None
+    total = served = 0
+    hint = {"role": "system", "content": "Values mentioned in the question, as stored in the database:\n- ..."}
+    for question, sql in CONVERSATION:
+        messages = assemble(first, history, [hint], question)
+        assert messages[:len(first)] == first, "prefix moved"
+        tokens = count_tokens(messages)
+        shared = shared_tokens(previous, messages) if previous else count_tokens(first)
+        total += tokens
+        served += cacheable(shared)
+        print(f"{question:<28} prompt {tokens:5d} tokens  shared with previous {shared:5d}  "
+              f"cacheable {cacheable(shared):5d} ({cacheable(shared) / tokens:.0%})")
+        history = history + [{"role": "user", "content": question}, {"role": "assistant", "content": sql}]
+        previous = messages
+    print(f"\ncacheable over the conversation: {served / total:.0%} of {total} prompt tokens")
+
+
+if __name__ == '__main__':
+    main()
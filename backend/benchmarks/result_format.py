@@ -0,0 +1,60 @@
+"""Serialized size and encode/decode time of /api/ask result formats.
+
+Results come from the `data` table layout created by functions/preprocess.py
+(synthetic values). Run from the backend directory:
+    python -m benchmarks.result_format
+"""
+import importlib.util
+import json
+import os
+import tempfile
+
+from benchmarks.common import make_cpi_db, summarize, time_calls
+from functions.result_format import encode_arrow, encode_result
+from functions.sqlite_engine import ReadOnlyEngine
+
+QUERIES = {
+    "SELECT * (10k rows)": "SELECT * FROM data LIMIT 10000;",
+    "wide aggregation": """
+        SELECT Year, Month, State,
+            AVG(CASE WHEN Sector = 'Rural' THEN "Inflation (%)" END) AS "Rural Inflation (%)",
+            AVG(CASE WHEN Sector = 'Urban' THEN "Inflation (%)" END) AS "Urban Inflation (%)",
+            AVG(CASE WHEN Sector = 'Combined' THEN "Inflation (%)" END) AS "Combined Inflation (%)",
+            AVG(CASE WHEN "Group" = 'Food and Beverages' THEN "Inflation (%)" END) AS "Food Inflation (%)",
+            AVG(CASE WHEN "Group" = 'Fuel and Light' THEN "Inflation (%)" END) AS "Fuel Inflation (%)",
+            AVG("Index") AS "Average Index"
+        FROM data GROUP BY Year, Month, State;
+    """,
+}
+
+
+def main(iterations=20):
+    has_arrow = importlib.util.find_spec("pyarrow") is not None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        engine = ReadOnlyEngine(path)
+
+        for label, query in QUERIES.items():
+            columns, rows, _ = engine.execute(query)
+            result = {"columns": columns, "data": [dict(zip(columns, row)) for row in rows]}
+            print(f"\n{label}: {len(rows)} rows x {len(columns)} columns")
+
+            for fmt in ("records", "compact", "columnar"):
+                encoded = encode_result(result, fmt)
+                payload = json.dumps(encoded)
+                print(f"  {fmt:<9} {len(payload.encode()):>10,} bytes")
+                summarize(f"    encode {fmt}", time_calls(lambda: json.dumps(encode_result(result, fmt)), iterations))
+                summarize(f"    decode {fmt}", time_calls(lambda: json.loads(payload), iterations))
+
+            if has_arrow:
+                payload = encode_arrow(result)
+                print(f"  {'arrow':<9} {len(payload):>10,} bytes")
+                summarize("    encode arrow", time_calls(lambda: encode_arrow(result), iterations))
+            else:
+                print("  arrow     skipped (pyarrow not installed)")
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Aggregate queries on the raw `data` table vs. the same queries rewritten onto rollups.
+
+Uses a scaled-up synthetic CPI dataset (functions/preprocess.py layout). Every
+rewritten result is checked against the raw one with ==. Run from the backend directory:
+    python -m benchmarks.rollups [scale]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_cpi_db, summarize, time_calls
+from functions.rollups import ROLLUP_SCHEMA, RollupSet
+from functions.sqlite_engine import ReadOnlyEngine
+
+WORKLOAD = {
+    "yearly average": 'SELECT Year, AVG("Inflation (%)") FROM data GROUP BY Year;',
+    "monthly 2024": "SELECT `Month`, AVG(`Inflation (%)`) AS `Total Inflation (%)` FROM data "
+                    "WHERE `Year` = 2024 GROUP BY `Month`;",
+    "state ranking": 'SELECT State, MAX("Index") AS peak, COUNT(*) FROM data '
+                     "WHERE Year BETWEEN 2020 AND 2024 AND Sector = 'Rural' GROUP BY State ORDER BY peak DESC LIMIT 5;",
+    "group extremes": 'SELECT "Group", MIN("Inflation (%)"), MAX("Inflation (%)") FROM data '
+                      "WHERE State = 'Kerala' GROUP BY \"Group\";",
+    "readings per year": 'SELECT Year, COUNT("Inflation (%)") AS readings FROM data GROUP BY Year ORDER BY Year;',
+    "rounded average": 'SELECT State, ROUND(AVG("Index"), 2) AS idx FROM data GROUP BY State ORDER BY idx DESC LIMIT 5;',
+    "not rewritable": 'SELECT SubGroup, AVG("Inflation (%)") FROM data GROUP BY SubGroup;',
+}
+
+
+def main(scale=8, iterations=20):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        print(f"{make_cpi_db(path, scale=scale):,} rows")
+
+        rollups = RollupSet(os.path.join(tmp, "rollups.db"))
+        start = time.perf_counter()
+        rollups.load_or_build(path, "benchmark")
+        print(f"built {len(rollups.rollups)} rollups in {(time.perf_counter() - start) * 1000:.0f}ms: "
+              + ", ".join(f"{r.name}({', '.join(r.dimensions)}) {r.rows:,} rows" for r in rollups.rollups))
+
+        raw = ReadOnlyEngine(path)
+        attached = ReadOnlyEngine(path, attach={ROLLUP_SCHEMA: rollups.path})
+        for label, sql in WORKLOAD.items():
+            rewritten = rollups.rewrite(sql)
+            print(f"\n{label}")
+            before = summarize("  raw table", time_calls(lambda: raw.execute(sql), iterations))
+            if rewritten is None:
+                print("  not rewritten (runs on the raw table)")
+                continue
+            columns, rows, _ = raw.execute(sql)
+            rollup_columns, rollup_rows, _ = attached.execute(rewritten)
+            after = summarize("  rollup", time_calls(lambda: attached.execute(rewritten), iterations))
+            summarize("  rewrite overhead", time_calls(lambda: rollups.rewrite(sql), iterations))
+            print(f"  speedup {before / after:.1f}x, identical: {columns == rollup_columns and rows == rollup_rows}")
+        raw.close()
+        attached.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,118 @@
+"""Prompt size and linking latency: full schema vs. SchemaLinker on a multi-table database.
+
+The database is the synthetic CPI `data` table plus related economic tables
+(wholesale prices, GDP, employment, trade, ...) joined through a `states`
+table. Each question lists the tables it needs, to check linking recall.
+Run from the backend directory:
+    python -m benchmarks.schema_linking [extra_tables]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.common import STATES, make_cpi_db, summarize, time_calls
+from functions.history import count_tokens
+from functions.schema_linking import SchemaLinker
+
+TABLES = {
+    "states": ["state_id INTEGER PRIMARY KEY", "state_name TEXT", "region TEXT", "population INTEGER"],
+    "wholesale_prices": ["state_id INTEGER REFERENCES states(state_id)", "year INTEGER", "commodity TEXT",
+                         "wpi_index REAL", "wpi_inflation REAL"],
+    "gdp": ["state_id INTEGER REFERENCES states(state_id)", "year INTEGER", "quarter TEXT",
+            "gsdp_crore REAL", "growth_rate REAL", "per_capita_income REAL"],
+    "employment": ["state_id INTEGER REFERENCES states(state_id)", "year INTEGER", "gender TEXT",
+                   "unemployment_rate REAL", "labour_force_participation REAL", "worker_population_ratio REAL"],
+    "trade": ["year INTEGER", "month TEXT", "partner_country TEXT", "exports_usd_mn REAL", "imports_usd_mn REAL",
+              "trade_balance REAL"],
+    "interest_rates": ["year INTEGER", "month TEXT", "repo_rate REAL", "reverse_repo_rate REAL", "crr REAL",
+                       "slr REAL", "bank_rate REAL"],
+    "fuel_prices": ["state_id INTEGER REFERENCES states(state_id)", "year INTEGER", "month TEXT", "fuel TEXT",
+                    "retail_price REAL"],
+    "agriculture": ["state_id INTEGER REFERENCES states(state_id)", "year INTEGER", "crop TEXT", "season TEXT",
+                    "area_hectares REAL", "production_tonnes REAL", "yield_per_hectare REAL", "msp REAL"],
+}
+VALUES = {
+    "region": ["North", "South", "East", "West", "Central"],
+    "commodity": ["Primary Articles", "Fuel and Power", "Manufactured Products"],
+    "quarter": ["Q1", "Q2", "Q3", "Q4"],
+    "gender": ["Male", "Female", "Person"],
+    "partner_country": ["United States", "China", "United Arab Emirates", "Germany", "Singapore"],
+    "month": ["January", "April", "July", "October"],
+    "fuel": ["Petrol", "Diesel", "LPG", "Kerosene"],
+    "crop": ["Rice", "Wheat", "Pulses", "Sugarcane", "Cotton"],
+    "season": ["Kharif", "Rabi", "Zaid"],
+}
+QUESTIONS = [
+    ("Average inflation in Kerala for the Rural sector by year", {"data"}),
+    ("Which month of 2024 had the highest CPI index for Food and Beverages?", {"data"}),
+    ("Compare wholesale price inflation of Fuel and Power across regions", {"wholesale_prices", "states"}),
+    ("GSDP growth rate of Maharashtra per quarter", {"gdp", "states"}),
+    ("Female unemployment rate by state in 2023", {"employment", "states"}),
+    ("Trade balance with China each month", {"trade"}),
+    ("How did the repo rate change over the years?", {"interest_rates"}),
+    ("Diesel retail price in Tamil Nadu over time", {"fuel_prices", "states"}),
+    ("Rice production in Kharif season by state", {"agriculture", "states"}),
+]
+
+
+def make_economy_db(path, extra_tables=0, rows=500):
+    make_cpi_db(path, years=range(2020, 2025))
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    tables = dict(TABLES)
+    # Filler tables stand in for the long tail of a real multi-table upload.
+    for i in range(extra_tables):
+        tables[f"survey_{i}"] = ["state_id INTEGER REFERENCES states(state_id)", "year INTEGER"] + [
+            f"indicator_{j} REAL" for j in range(12)]
+    for table, columns in tables.items():
+        conn.execute(f"CREATE TABLE {table} ({', '.join(columns)})")
+        names = [column.split()[0] for column in columns]
+        if table == "states":
+            data = [(i, state, rng.choice(VALUES["region"]), rng.randint(1, 200) * 10 ** 5)
+                    for i, state in enumerate(STATES)]
+        else:
+            def value(name):
+                if name == "state_id":
+                    return rng.randrange(len(STATES))
+                if name == "year":
+                    return rng.randint(2015, 2024)
+                if name in VALUES:
+                    return rng.choice(VALUES[name])
+                return round(rng.uniform(0, 100), 2)
+            data = [tuple(value(name) for name in names) for _ in range(rows)]
+        conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in names)})", data)
+    conn.commit()
+    conn.close()
+    return len(tables) + 1
+
+
+def prompt_tokens(schema):
+    return count_tokens([{"role": "system", "content": schema["table_info"] + "\n" + schema["sample_data"]}])
+
+
+def main(extra_tables=20, iterations=50):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "economy.db")
+        table_count = make_economy_db(path, extra_tables)
+
+        start = time.perf_counter()
+        linker = SchemaLinker.from_database(path)
+        print(f"{table_count} tables; linker built in {(time.perf_counter() - start) * 1000:.1f}ms\n")
+
+        full = prompt_tokens(linker.full_schema())
+        found = 0
+        for question, expected in QUESTIONS:
+            linked = linker.link(question)
+            tokens = prompt_tokens(linked)
+            found += expected <= set(linked["tables"])
+            print(f"{question[:52]:<54} {tokens:5d} tokens ({1 - tokens / full:4.0%} smaller)  "
+                  f"tables={','.join(linked['tables'])}")
+        print(f"\nfull schema: {full} tokens; expected tables linked for {found}/{len(QUESTIONS)} questions\n")
+        summarize("link()", time_calls(lambda: [linker.link(q) for q, _ in QUESTIONS], iterations))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,60 @@
+"""How many typical LLM SQL mistakes SqlRepairer fixes without another LLM round trip.
+
+Each case is a malformed generation for the `data` table created by
+functions/preprocess.py. Run from the backend directory:
+    python -m benchmarks.sql_repair
+"""
+import os
+import tempfile
+
+from benchmarks.common import make_cpi_db, summarize, time_calls
+from functions.sql_repair import SqlRepairer
+from functions.sqlite_engine import ReadOnlyEngine
+
+CASES = {
+    "valid": "SELECT Year, AVG(\"Inflation (%)\") FROM data GROUP BY Year;",
+    "markdown fence": "```sql\nSELECT Month, AVG(\"Inflation (%)\") FROM data WHERE Year = 2024 GROUP BY Month;\n```",
+    "trailing explanation": "SELECT State, MAX(\"Index\") FROM data GROUP BY State;\nThis query returns the highest index per state.",
+    "explanation, no `;`": "SELECT State, MAX(\"Index\") FROM data GROUP BY State\n\nThis query returns the highest index per state.",
+    "leading prose": "Here is the SQL query:\nSELECT COUNT(*) FROM data WHERE Sector = 'Rural';",
+    "prose saying with": "Here is the query with the yearly filter:\nSELECT COUNT(*) FROM data WHERE Year = 2024",
+    "unquoted Inflation (%)": "SELECT Year, AVG(Inflation (%)) FROM data GROUP BY Year;",
+    "single-quoted column": "SELECT Year, AVG('Inflation (%)') FROM data GROUP BY Year;",
+    "keyword columns": "SELECT Group, AVG(Index) FROM data GROUP BY Group;",
+    "misspelled column": "SELECT SubGrop, AVG(\"Inflation (%)\") FROM data GROUP BY SubGrop;",
+    "lowercase column": "SELECT state, sector FROM data WHERE year = 2023 LIMIT 5;",
+    "wrong table name": "SELECT * FROM cpi_data WHERE Year = 2024 LIMIT 5;",
+    "unknown column": "SELECT Population FROM data;",
+    "syntax error": "SELECT Year, FROM data;",
+}
+
+
+def main(iterations=50):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        engine = ReadOnlyEngine(path)
+        repairer = SqlRepairer(engine)
+
+        avoided = failed = 0
+        for label, sql in CASES.items():
+            repair = repairer.repair(sql)
+            if repair["avoided_retry"]:
+                avoided += 1
+                outcome = "repaired: " + ", ".join(repair["fixes"])
+            elif repair["error"]:
+                failed += 1
+                outcome = "LLM retry: " + repair["error"]
+            else:
+                outcome = "ok" + (" (" + ", ".join(repair["fixes"]) + ")" if repair["fixes"] else "")
+            print(f"{label:<24} {outcome}")
+
+        invalid = avoided + failed
+        print(f"\nLLM retries avoided: {avoided} of {invalid} failing generations\n")
+        for label in ("valid", "misspelled column", "unknown column"):
+            summarize(f"repair: {label}", time_calls(lambda: repairer.repair(CASES[label]), iterations))
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
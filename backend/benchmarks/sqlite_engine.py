@@ -0,0 +1,63 @@
+"""Mixed-query workload: SQLDatabase.run (default SQLAlchemy settings) vs. ReadOnlyEngine.
+
+Run from the backend directory:
+    python -m benchmarks.sqlite_engine [queries] [threads]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.utilities import SQLDatabase
+
+from benchmarks.common import make_cpi_db, percentile
+from functions.sqlite_engine import DEFAULT_PRAGMAS, ReadOnlyEngine
+
+WORKLOAD = [
+    "SELECT * FROM data WHERE Year = 2024 AND Month = 'October' AND State = 'Karnataka' LIMIT 5;",
+    "SELECT Month, AVG(\"Inflation (%)\") FROM data WHERE Year = 2024 GROUP BY Month;",
+    "SELECT State, Sector, AVG(\"Inflation (%)\") FROM data GROUP BY State, Sector;",
+    "SELECT SubGroup, AVG(\"Inflation (%)\") AS avg_inflation FROM data WHERE State = 'Kerala' "
+    "GROUP BY SubGroup ORDER BY avg_inflation DESC LIMIT 5;",
+    "SELECT COUNT(*) FROM data WHERE \"Group\" = 'Food and Beverages';",
+    "SELECT * FROM data LIMIT 500;",
+]
+
+
+def run(label, execute, queries, threads):
+    def timed(i):
+        start = time.perf_counter()
+        execute(WORKLOAD[i % len(WORKLOAD)])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed, range(queries)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {queries / elapsed:8.1f} q/s  "
+          f"p50={percentile(latencies, 50) * 1000:7.2f}ms  p95={percentile(latencies, 95) * 1000:7.2f}ms")
+
+
+def main(queries=2000, threads=8):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        rows = make_cpi_db(path, scale=2)
+        print(f"synthetic CPI rows: {rows}, threads: {threads}")
+
+        db = SQLDatabase.from_uri(f"sqlite:///{path}")
+        run("SQLDatabase.run(fetch='cursor')",
+            lambda q: [dict(row) for row in db.run(q, fetch="cursor").mappings()], queries, threads)
+
+        untuned = ReadOnlyEngine(path, pragmas={"query_only": 1}, pool_size=threads)
+        run("ReadOnlyEngine (query_only only)", untuned.execute, queries, threads)
+        untuned.close()
+
+        tuned = ReadOnlyEngine(path, pragmas=DEFAULT_PRAGMAS, pool_size=threads)
+        run("ReadOnlyEngine (default pragmas)", tuned.execute, queries, threads)
+        tuned.close()
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
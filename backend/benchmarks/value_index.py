@@ -0,0 +1,56 @@
+"""Entity resolution of State/Sector/Group mentions with ValueIndex.
+
+Checks that informal mentions resolve to the stored values, and compares the
+injected hint with listing every distinct value in the prompt. Uses the
+synthetic CPI dataset (functions/preprocess.py layout). Run from the backend directory:
+    python -m benchmarks.value_index
+"""
+import os
+import tempfile
+import time
+
+from benchmarks.common import make_cpi_db, summarize, time_calls
+from functions.history import count_tokens
+from functions.value_index import ValueIndex
+
+# question -> stored values it must resolve to
+CASES = {
+    "inflation in andhra, tn, up": {"Andhra Pradesh", "Tamil Nadu", "Uttar Pradesh"},
+    "food inflation in karnatka": {"Food and Beverages", "Karnataka"},
+    "UP vs WB for urban areas": {"Uttar Pradesh", "West Bengal", "Urban"},
+    "cereal prices in maharastra villages": {"Cereals and Products", "Maharashtra", "Rural"},
+    "compare all india with tamil nadu": {"All India", "Tamil Nadu"},
+    "milk and egg prices in kerala cities": {"Milk and Products", "Egg", "Kerala", "Urban"},
+    "clothes and footwear inflation nationwide": {"Clothing and Footwear", "Footwear", "All India"},
+    "energy costs in bengal": {"Fuel and Light", "West Bengal"},
+    "how did prices go up in 2024": set(),
+    "average inflation by month": set(),
+}
+
+
+def main(iterations=200):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cpi.db")
+        make_cpi_db(path)
+        start = time.perf_counter()
+        index = ValueIndex.from_database(path)
+        print(f"{len(index)} values indexed in {(time.perf_counter() - start) * 1000:.1f}ms\n")
+
+    correct = 0
+    for question, expected in CASES.items():
+        found = {match["value"] for match in index.resolve(question)}
+        correct += found == expected
+        status = "ok" if found == expected else f"expected {sorted(expected)}"
+        print(f"{question:<42} {sorted(found)}  {status}")
+    print(f"\n{correct}/{len(CASES)} questions resolved exactly")
+
+    listing = "\n".join(f"{column}: {', '.join(values)}" for (_, column), values in index.values.items())
+    hints = [ValueIndex.describe(index.resolve(q)) for q, expected in CASES.items() if expected]
+    listing_tokens = count_tokens([{"role": "system", "content": listing}])
+    hint_tokens = sum(count_tokens([{"role": "system", "content": hint}]) for hint in hints) / len(hints)
+    print(f"all distinct values: {listing_tokens} tokens; resolved hint: {hint_tokens:.0f} tokens on average\n")
+    summarize("resolve()", time_calls(lambda: [index.resolve(q) for q in CASES], iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import json
+from typing import Awaitable, Callable, Dict, Tuple
+
+AsyncHandler = Callable[[dict], Awaitable[Tuple[dict, int]]]
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"content-type"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, body: dict, status: int):
+    payload = json.dumps(body, default=str).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())] + CORS_HEADERS,
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+def create_asgi_app(routes: Dict[Tuple[str, str], AsyncHandler], wsgi_app):
+    """ASGI app serving `routes` natively on the event loop and everything else through `wsgi_app`.
+
+    `routes` maps (method, path) to an async handler taking the JSON payload and
+    returning (body, status). Run with e.g. `uvicorn --factory app:create_asgi`.
+    """
+    # Only needed in ASGI mode, so the plain Flask server does not require asgiref.
+    from asgiref.wsgi import WsgiToAsgi
+
+    fallback = WsgiToAsgi(wsgi_app)
+    paths = {path for _, path in routes}
+
+    async def asgi_app(scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in paths:
+            return await fallback(scope, receive, send)
+
+        if scope["method"] == "OPTIONS":
+            await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        handler = routes.get((scope["method"], scope["path"]))
+        if handler is None:
+            return await _send_json(send, {"error": "Method not allowed"}, 405)
+
+        try:
+            payload = json.loads(await _read_body(receive) or b"{}")
+        except ValueError:
+            return await _send_json(send, {"error": "Invalid JSON body"}, 400)
+
+        body, status = await handler(payload)
+        await _send_json(send, body, status)
+
+    return asgi_app
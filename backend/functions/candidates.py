@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypedDict
+
+# Floats are compared at this many significant digits, so AVG over the same rows
+# in a different order (or from a rollup) still counts as the same answer.
+SIGNIFICANT_DIGITS = 9
+
+
+class Vote(TypedDict):
+    # Index of the chosen candidate
+    winner: int
+    # Candidates whose result matched the winner's (1 when nobody agreed)
+    votes: int
+    # How the winner was picked: "quorum", "majority", "first_valid", "first_empty" or "first"
+    reason: str
+    # Candidates still running when the answer was decided
+    cancelled: int
+
+
+def _normalize(value):
+    if isinstance(value, float):
+        return float(f"{value:.{SIGNIFICANT_DIGITS}g}")
+    return value
+
+
+def result_signature(result: Optional[dict]) -> Optional[str]:
+    """Order- and alias-insensitive fingerprint of a successful, non-empty result."""
+    if not result or "error" in result or not result.get("data"):
+        return None
+    rows = sorted(json.dumps([_normalize(value) for value in row.values()], default=str)
+                  for row in result["data"])
+    return hashlib.sha1("\n".join(rows).encode()).hexdigest()
+
+
+def vote(results: Dict[int, Optional[dict]], cancelled: int = 0) -> Vote:
+    """Pick among candidate results (by candidate index; lower indices are preferred).
+
+    The largest group of equivalent non-empty results wins; without any
+    agreement, the first non-empty result, then the first empty one, then the
+    first error.
+    """
+    signatures = {index: result_signature(result) for index, result in results.items()}
+    counts = Counter(signature for signature in signatures.values() if signature is not None)
+    if counts and counts.most_common(1)[0][1] > 1:
+        best = max(counts.values())
+        winner = min(index for index, signature in signatures.items() if counts.get(signature) == best)
+        return Vote(winner=winner, votes=best, reason="majority", cancelled=cancelled)
+    valid = [index for index, signature in signatures.items() if signature is not None]
+    if valid:
+        return Vote(winner=min(valid), votes=1, reason="first_valid", cancelled=cancelled)
+    empty = [index for index, result in results.items() if result is not None and "error" not in result]
+    if empty:
+        return Vote(winner=min(empty), votes=1, reason="first_empty", cancelled=cancelled)
+    return Vote(winner=min(results), votes=1, reason="first", cancelled=cancelled)
+
+
+def quorum(n: int) -> int:
+    return n // 2 + 1
+
+
+def _quorum_winner(results: Dict[int, Any], result_of: Callable[[Any], Optional[dict]],
+                   needed: int) -> Optional[Tuple[int, int]]:
+    signatures = {index: result_signature(result_of(value)) for index, value in results.items()}
+    counts = Counter(signature for signature in signatures.values() if signature is not None)
+    for signature, count in counts.items():
+        if count >= needed:
+            return min(index for index, other in signatures.items() if other == signature), count
+    return None
+
+
+def failed_candidate(error: Exception) -> dict:
+    """What a candidate that raised is recorded as: an attempt with no SQL and an error result."""
+    return {"sql_query": "", "history": [], "result": {"error": str(error)}}
+
+
+def race(run: Callable[[int, threading.Event], Any], n: int, executor: Executor,
+         result_of: Callable[[Any], Optional[dict]],
+         failed: Callable[[Exception], Any] = failed_candidate) -> Tuple[Any, Vote, Dict[int, Any]]:
+    """Run `run(index, cancel)` for n candidates on `executor` and vote on their results.
+
+    As soon as a majority of candidates agree, the rest are abandoned: tasks that
+    have not started are cancelled and `cancel` is set so running SQL stops.
+    `result_of` maps a candidate's return value to its result dict. A candidate
+    that raises is recorded as `failed(exception)`, which should have the shape
+    of a successful candidate.
+    """
+    cancel = threading.Event()
+    futures = {executor.submit(run, index, cancel): index for index in range(n)}
+    done: Dict[int, Any] = {}
+    needed = quorum(n)
+    pending = set(futures)
+    try:
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    done[futures[future]] = future.result()
+                except Exception as e:
+                    done[futures[future]] = failed(e)
+            agreed = _quorum_winner(done, result_of, needed)
+            if agreed is not None:
+                winner, votes = agreed
+                return done[winner], Vote(winner=winner, votes=votes, reason="quorum", cancelled=len(pending)), done
+    finally:
+        if pending:
+            cancel.set()
+            for future in pending:
+                future.cancel()
+    decided = vote({index: result_of(value) for index, value in done.items()})
+    return done[decided["winner"]], decided, done
+
+
+async def race_async(run: Callable[[int, threading.Event], Awaitable[Any]], n: int,
+                     result_of: Callable[[Any], Optional[dict]],
+                     failed: Callable[[Exception], Any] = failed_candidate) -> Tuple[Any, Vote, Dict[int, Any]]:
+    """`race` for coroutines: stragglers are cancelled as tasks and through `cancel`."""
+    cancel = threading.Event()
+    tasks = {asyncio.ensure_future(run(index, cancel)): index for index in range(n)}
+    done: Dict[int, Any] = {}
+    needed = quorum(n)
+    pending = set(tasks)
+    try:
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                try:
+                    done[tasks[task]] = task.result()
+                except Exception as e:
+                    done[tasks[task]] = failed(e)
+            agreed = _quorum_winner(done, result_of, needed)
+            if agreed is not None:
+                winner, votes = agreed
+                return done[winner], Vote(winner=winner, votes=votes, reason="quorum", cancelled=len(pending)), done
+    finally:
+        if pending:
+            cancel.set()
+            for task in pending:
+                task.cancel()
+    decided = vote({index: result_of(value) for index, value in done.items()})
+    return done[decided["winner"]], decided, done
@@ -0,0 +1,34 @@
+import re
+from typing import Optional, Pattern, Tuple
+
+# (name, cue in the question, SQL construct that shows the simple query already covers it).
+# A cue without a construct always asks for refinement.
+_CUES: Tuple[Tuple[str, Pattern, Optional[Pattern]], ...] = (
+    ("analysis", re.compile(r"\b(analy[sz]\w*|insights?|why)\b", re.I), None),
+    ("comparison", re.compile(r"\b(compare\w*|comparison|versus|vs|difference|against|relative to)\b", re.I),
+     re.compile(r"\b(GROUP\s+BY|CASE)\b", re.I)),
+    ("trend", re.compile(r"\b(trends?|over (the )?(years|months|time)|growth|change[ds]?|yearly|monthly|"
+                         r"year[- ]on[- ]year|yoy)\b", re.I),
+     re.compile(r"\bGROUP\s+BY\b", re.I)),
+    ("ranking", re.compile(r"\b(top|bottom|highest|lowest|most|least|largest|smallest|best|worst|rank\w*)\b", re.I),
+     re.compile(r"\b(ORDER\s+BY|MAX|MIN)\b", re.I)),
+    ("breakdown", re.compile(r"\b(by|per|each|breakdown|wise|distribution|share|factors?|drive[sn]?|driving|"
+                             r"affect\w*|contribut\w*)\b", re.I),
+     re.compile(r"\bGROUP\s+BY\b", re.I)),
+    ("aggregate", re.compile(r"\b(average|avg|mean|total|sum|summary|overall)\b", re.I),
+     re.compile(r"\b(AVG|SUM|COUNT|MIN|MAX)\s*\(", re.I)),
+)
+
+
+def refinement_reason(question: str, sql: str) -> Optional[str]:
+    """Why the simple query for `question` probably needs complexify_query, or None.
+
+    Each cue in the question ("compare", "trend", "top", "by state", "average")
+    is covered when the SQL has the matching construct (CASE or GROUP BY, GROUP
+    BY, ORDER BY/MIN/MAX, GROUP BY, an aggregate); "why" and "analyse" always
+    ask for refinement. Plain lookups have no cue and are answered as they are.
+    """
+    for name, cue, covered in _CUES:
+        if cue.search(question) and (covered is None or not covered.search(sql)):
+            return name
+    return None
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+
+class DatabaseEntry:
+    """One uploaded database together with everything derived from it."""
+
+    def __init__(self, database_id: str, path: str, db, schema, prompt_prefix: List[dict], engine=None,
+                 repairer=None, advisor=None, rollups=None, linker=None,
+                 values=None):
+        self.database_id = database_id
+        self.path = path
+        self.db = db
+        self.engine = engine
+        self.repairer = repairer
+        self.advisor = advisor
+        self.rollups = rollups
+        # Set for schemas too large to send whole; picks the tables each question needs.
+        self.linker = linker
+        # ValueIndex of the categorical columns, for resolving mentions like "tn" or "andhra".
+        self.values = values
+        # Held while the engine is swapped for one over an indexed copy or with rollups attached.
+        self.lock = threading.Lock()
+        self.schema = schema
+        self.prompt_prefix = prompt_prefix
+        self.size_bytes = os.path.getsize(path)
+        self.last_used = time.time()
+
+    @property
+    def fingerprint(self) -> str:
+        return self.schema["fingerprint"]
+
+    def replace_engine(self, engine):
+        """Serve queries from `engine` from now on; queries already running finish on the old one."""
+        old, self.engine = self.engine, engine
+        if self.repairer is not None:
+            self.repairer.engine = engine
+        if old is not None:
+            old.close()
+
+
+class DatabaseRegistry:
+    """Uploaded databases by id, evicting the least recently used ones.
+
+    Eviction happens when more than `max_entries` databases are registered or
+    their combined file size exceeds `memory_budget_bytes`. The most recently
+    used database is never evicted, even if it alone exceeds the budget.
+    """
+
+    def __init__(self, max_entries: int = 16, memory_budget_bytes: int = 2 * 1024 ** 3,
+                 on_evict: Optional[Callable[[DatabaseEntry], None]] = None):
+        self.max_entries = max_entries
+        self.memory_budget_bytes = memory_budget_bytes
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[str, DatabaseEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def register(self, entry: DatabaseEntry) -> DatabaseEntry:
+        with self._lock:
+            self._entries[entry.database_id] = entry
+            self._entries.move_to_end(entry.database_id)
+            evicted = self._evict_locked()
+        for old in evicted:
+            self._close(old)
+        return entry
+
+    def get(self, database_id: Optional[str]) -> Optional[DatabaseEntry]:
+        if not database_id:
+            return None
+        with self._lock:
+            entry = self._entries.get(database_id)
+            if entry is not None:
+                self._entries.move_to_end(database_id)
+                entry.last_used = time.time()
+            return entry
+
+    def get_by_path(self, path: str) -> Optional[DatabaseEntry]:
+        """The live entry serving the file at `path`, if any."""
+        path = os.path.abspath(path)
+        with self._lock:
+            for database_id, entry in reversed(self._entries.items()):
+                if os.path.abspath(entry.path) == path:
+                    self._entries.move_to_end(database_id)
+                    entry.last_used = time.time()
+                    return entry
+        return None
+
+    def is_registered(self, entry: DatabaseEntry) -> bool:
+        """Whether `entry` itself is still registered (not evicted), without marking it used."""
+        with self._lock:
+            return self._entries.get(entry.database_id) is entry
+
+    def has_fingerprint(self, fingerprint: str) -> bool:
+        with self._lock:
+            return any(entry.fingerprint == fingerprint for entry in self._entries.values())
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict_locked(self) -> List[DatabaseEntry]:
+        evicted = []
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or total > self.memory_budget_bytes):
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.size_bytes
+            evicted.append(entry)
+        return evicted
+
+    def _close(self, entry: DatabaseEntry):
+        if entry.engine is not None:
+            entry.engine.close()
+        sa_engine = getattr(entry.db, "_engine", None)
+        if sa_engine is not None:
+            sa_engine.dispose()
+        if self.on_evict is not None:
+            self.on_evict(entry)
@@ -1,29 +1,37 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Optional
 import sqlite3
 
+from functions.sqlite_engine import quote_identifier, read_only_uri
+
 class Column(BaseModel):
     name: str
     type: str
+    primary_key: bool = False
+    # "table.column" this column is a foreign key to, if any
+    references: Optional[str] = None
 
 class TableSchema(BaseModel):
     table_name: str
     columns: List[Column]
 
 def extract_schema(db_path: str) -> List[TableSchema]:
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(read_only_uri(db_path), uri=True)
     cursor = conn.cursor()
 
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
     tables = cursor.fetchall()
 
     schema = []
     for table in tables:
         table_name = table[0]
-        cursor.execute(f"PRAGMA table_info({table_name});")
+        cursor.execute(f"PRAGMA foreign_key_list({quote_identifier(table_name)});")
+        references = {fk[3]: f"{fk[2]}.{fk[4]}" for fk in cursor.fetchall() if fk[4] is not None}
+        cursor.execute(f"PRAGMA table_info({quote_identifier(table_name)});")
         columns_info = cursor.fetchall()
-        columns = [Column(name=col[1], type=col[2]) for col in columns_info]
+        columns = [Column(name=col[1], type=col[2], primary_key=bool(col[5]), references=references.get(col[1]))
+                   for col in columns_info]
         schema.append(TableSchema(table_name=table_name, columns=columns))
 
     conn.close()
-    return schema, table_name
\ No newline at end of file
+    return schema
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
+
+from functions.ingest import DATA_SCHEMA
+
+# Learned examples kept per database; the least used are dropped beyond this.
+MAX_LEARNED_PER_DATABASE = 500
+# Examples sharing only very common words (e.g. "inflation") score about 0 and are left out.
+MIN_SCORE = 0.01
+_WORD = re.compile(r"[A-Za-z0-9]+")
+
+# Vetted question/SQL pairs for the CPI `data` table (from original.py's few-shot
+# examples, with the sector literals matching the stored values).
+SEED_EXAMPLES: Tuple[Tuple[str, str], ...] = (
+    ("show results from oct, nov, dec 2024",
+     "SELECT * FROM data WHERE `Year` = 2024 AND `Month` IN ('October', 'November', 'December') LIMIT 5;"),
+    ("inflation summary for year 2024 by months",
+     "SELECT `Month`, AVG(`Inflation (%)`) AS `Total Inflation (%)` FROM data WHERE `Year` = 2024 GROUP BY `Month` "
+     "ORDER BY CASE `Month` WHEN 'January' THEN 1 WHEN 'February' THEN 2 WHEN 'March' THEN 3 WHEN 'April' THEN 4 "
+     "WHEN 'May' THEN 5 WHEN 'June' THEN 6 WHEN 'July' THEN 7 WHEN 'August' THEN 8 WHEN 'September' THEN 9 "
+     "WHEN 'October' THEN 10 WHEN 'November' THEN 11 WHEN 'December' THEN 12 END;"),
+    ("show data for andhra, tn, up in october 2024",
+     "SELECT * FROM data WHERE `Year` = 2024 AND `Month` = 'October' "
+     "AND `State` IN ('Andhra Pradesh', 'Tamil Nadu', 'Uttar Pradesh') LIMIT 5;"),
+    ("compare sector-wise inflation",
+     "SELECT `Year`, AVG(CASE WHEN `Sector` = 'Rural' THEN `Inflation (%)` END) AS `Rural Inflation (%)`, "
+     "AVG(CASE WHEN `Sector` = 'Urban' THEN `Inflation (%)` END) AS `Urban Inflation (%)`, "
+     "AVG(CASE WHEN `Sector` = 'Combined' THEN `Inflation (%)` END) AS `Combined Inflation (%)` "
+     "FROM data GROUP BY `Year` ORDER BY `Year`;"),
+    ("compare food and fuel inflation in combined sector",
+     "SELECT `Year`, AVG(CASE WHEN `Group` = 'Food and Beverages' THEN `Inflation (%)` END) AS `Food Inflation (%)`, "
+     "AVG(CASE WHEN `Group` = 'Fuel and Light' THEN `Inflation (%)` END) AS `Fuel Inflation (%)` FROM data "
+     "WHERE `Sector` = 'Combined' AND `Group` IN ('Food and Beverages', 'Fuel and Light') "
+     "GROUP BY `Year` ORDER BY `Year`;"),
+    ("show inflation rate trends in 2024",
+     "SELECT `Month`, AVG(`Inflation (%)`) AS `Avg_Inflation` FROM data WHERE `Year` = 2024 GROUP BY `Month` "
+     "ORDER BY CASE `Month` WHEN 'January' THEN 1 WHEN 'February' THEN 2 WHEN 'March' THEN 3 WHEN 'April' THEN 4 "
+     "WHEN 'May' THEN 5 WHEN 'June' THEN 6 WHEN 'July' THEN 7 WHEN 'August' THEN 8 WHEN 'September' THEN 9 "
+     "WHEN 'October' THEN 10 WHEN 'November' THEN 11 WHEN 'December' THEN 12 END;"),
+    ("what factors are affecting inflation rate of Karnataka in 2024",
+     "SELECT `SubGroup`, AVG(`Inflation (%)`) AS `Avg_Inflation` FROM data WHERE `Year` = 2024 "
+     "AND `State` = 'Karnataka' GROUP BY `SubGroup` ORDER BY `Avg_Inflation` DESC LIMIT 5;"),
+)
+
+
+class Example(TypedDict):
+    question: str
+    sql: str
+    # "seed" for vetted pairs, "learned" for ones recorded from successful queries
+    source: str
+    score: float
+
+
+def schema_signature(columns: Dict[str, Sequence[str]]) -> str:
+    """Key for databases that share table and column names, whatever their content."""
+    names = sorted(f"{table.lower()}.{column.lower()}" for table, table_columns in columns.items()
+                   for column in table_columns)
+    return hashlib.sha1("\n".join(names).encode()).hexdigest()[:16]
+
+
+CPI_SIGNATURE = schema_signature({"data": [name for name, _ in DATA_SCHEMA]})
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(word.lower() for word in _WORD.findall(question))
+
+
+class ExampleStore:
+    """Question/SQL examples in an SQLite file with an FTS5 (BM25) index on the questions.
+
+    Examples are scoped by schema_signature, so pairs written for one schema are
+    never shown for another. Vetted seeds are shared by every database with the
+    schema; learned pairs also carry an `owner` (the fingerprint of the database
+    they ran on) and are only shown for that database, so one upload's questions
+    and filter values never reach another's prompt. `similar` returns the k
+    best-ranked examples for a question; the index lives in the same file, so
+    nothing is rebuilt at start-up. `learn` adds pairs that ran successfully, up
+    to MAX_LEARNED_PER_DATABASE per owner, dropping the least used first.
+    """
+
+    def __init__(self, path: str, max_learned: int = MAX_LEARNED_PER_DATABASE):
+        self.path = path
+        self.max_learned = max_learned
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(examples)")]
+        if columns and "owner" not in columns:
+            # Files from before learned examples had an owner pooled them per schema;
+            # they cannot be attributed, so start over (seeds are re-added by seed()).
+            self._conn.executescript("""
+                DROP TRIGGER IF EXISTS examples_ai;
+                DROP TRIGGER IF EXISTS examples_ad;
+                DROP TABLE IF EXISTS examples_fts;
+                DROP TABLE examples;
+            """)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS examples (
+                id INTEGER PRIMARY KEY,
+                schema TEXT NOT NULL,
+                owner TEXT NOT NULL DEFAULT '',
+                question TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                source TEXT NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                UNIQUE (schema, owner, normalized)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS examples_fts USING fts5(
+                question, content='examples', content_rowid='id', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS examples_ai AFTER INSERT ON examples BEGIN
+                INSERT INTO examples_fts(rowid, question) VALUES (new.id, new.question);
+            END;
+            CREATE TRIGGER IF NOT EXISTS examples_ad AFTER DELETE ON examples BEGIN
+                INSERT INTO examples_fts(examples_fts, rowid, question) VALUES ('delete', old.id, old.question);
+            END;
+        """)
+
+    def add(self, schema: str, question: str, sql: str, source: str = "seed", owner: str = "") -> bool:
+        """Store a pair; False if the schema (and owner) already has an example for this question."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO examples (schema, owner, question, normalized, sql, source, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (schema, owner, question, normalize_question(question), sql.strip(), source, time.time()))
+            return cursor.rowcount == 1
+
+    def seed(self, schema: str = CPI_SIGNATURE, examples: Sequence[Tuple[str, str]] = SEED_EXAMPLES) -> int:
+        return sum(self.add(schema, question, sql, "seed") for question, sql in examples)
+
+    def learn(self, schema: str, owner: str, question: str, sql: str) -> bool:
+        """Store a pair that ran on the database `owner`; only that database is shown it."""
+        normalized = normalize_question(question)
+        if not owner or not normalized:
+            return False
+        with self._lock:
+            seeded = self._conn.execute("SELECT 1 FROM examples WHERE schema = ? AND normalized = ? AND source = 'seed'",
+                                        (schema, normalized)).fetchone()
+        if seeded:
+            return False
+        added = self.add(schema, question, sql, "learned", owner)
+        if added:
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM examples WHERE id IN (SELECT id FROM examples WHERE schema = ? AND owner = ? "
+                    "AND source = 'learned' ORDER BY uses DESC, created DESC LIMIT -1 OFFSET ?)",
+                    (schema, owner, self.max_learned))
+        return added
+
+    def similar(self, schema: str, question: str, k: int = 3, extra_terms: Sequence[str] = (),
+                owner: Optional[str] = None) -> List[Example]:
+        """The k seeds and `owner`'s learned examples ranked best for `question`; `extra_terms`
+        (e.g. the columns of values it mentions) widen the search without being part of the question."""
+        words = _WORD.findall(question) + [word for term in extra_terms for word in _WORD.findall(term)]
+        if not words or k <= 0:
+            return []
+        # Any shared word counts; bm25() ranks by how rare and how frequent the shared words are.
+        match = " OR ".join(f'"{word}"' for word in words)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT e.id, e.question, e.sql, e.source, bm25(examples_fts) AS rank FROM examples_fts "
+                "JOIN examples e ON e.id = examples_fts.rowid "
+                "WHERE examples_fts MATCH ? AND e.schema = ? AND (e.source = 'seed' OR e.owner = ?) "
+                "ORDER BY rank LIMIT ?",
+                (match, schema, owner or "", k)).fetchall()
+            rows = [row for row in rows if -row[4] >= MIN_SCORE]
+            if rows:
+                self._conn.execute(f"UPDATE examples SET uses = uses + 1 WHERE id IN ({','.join('?' * len(rows))})",
+                                   [row[0] for row in rows])
+        return [Example(question=question, sql=sql, source=source, score=round(-rank, 3))
+                for _, question, sql, source, rank in rows]
+
+    def count(self, schema: Optional[str] = None) -> int:
+        with self._lock:
+            if schema is None:
+                return self._conn.execute("SELECT COUNT(*) FROM examples").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM examples WHERE schema = ?", (schema,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def describe(examples: List[Example]) -> str:
+        """Prompt text with the examples as question/SQL pairs."""
+        pairs = "\n\n".join(f"Question: {example['question']}\nSQL: {example['sql']}" for example in examples)
+        return "Examples of questions about this database and their SQL:\n\n" + pairs
@@ -0,0 +1,74 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Executor, Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Optional, Tuple, TypedDict
+
+
+class ExplanationStatus(TypedDict):
+    # "pending", "ready" or "failed"
+    status: str
+    explanation: Optional[str]
+    error: Optional[str]
+
+
+class ExplanationJobs:
+    """Explanations produced off the request path and fetched later by id.
+
+    `submit` starts `explain()` on `executor` and returns an id right away, so an
+    answer can be sent before its explanation exists. `get` reports a job,
+    optionally waiting up to `wait` seconds for it to finish. Jobs are forgotten
+    `ttl_seconds` after submission, and beyond `max_entries` oldest first.
+    """
+
+    def __init__(self, executor: Executor, max_entries: int = 1024, ttl_seconds: float = 900,
+                 clock: Callable[[], float] = time.monotonic):
+        self.executor = executor
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._jobs: "OrderedDict[str, Tuple[Future, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, explain: Callable[[], str]) -> str:
+        job_id = uuid.uuid4().hex
+        future = self.executor.submit(explain)
+        with self._lock:
+            self._expire()
+            self._jobs[job_id] = (future, self.clock() + self.ttl_seconds)
+            while len(self._jobs) > self.max_entries:
+                _, (oldest, _) = self._jobs.popitem(last=False)
+                oldest.cancel()
+        return job_id
+
+    def _expire(self):
+        now = self.clock()
+        while self._jobs:
+            job_id, (future, expires_at) = next(iter(self._jobs.items()))
+            if expires_at > now:
+                return
+            del self._jobs[job_id]
+            future.cancel()
+
+    def get(self, job_id: str, wait: float = 0.0) -> Optional[ExplanationStatus]:
+        """The job's status, or None for an unknown or expired id."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        try:
+            explanation = job[0].result(timeout=max(wait, 0.0))
+        except FutureTimeout:
+            return ExplanationStatus(status="pending", explanation=None, error=None)
+        except CancelledError:
+            return ExplanationStatus(status="failed", explanation=None, error="cancelled")
+        except Exception as e:
+            return ExplanationStatus(status="failed", explanation=None, error=str(e))
+        return ExplanationStatus(status="ready", explanation=explanation, error=None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
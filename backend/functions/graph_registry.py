@@ -0,0 +1,48 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class GraphRegistry:
+    """Keeps one compiled LangGraph workflow per variant for the whole process.
+
+    A variant is looked up by name and rebuilt only when the config it was
+    compiled with changes (e.g. a different retry limit or node set).
+    """
+
+    def __init__(self):
+        self._graphs: Dict[str, Tuple[Hashable, Any]] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    @staticmethod
+    def _config_key(config: Dict[str, Any]) -> Hashable:
+        frozen = {}
+        for name, value in config.items():
+            if isinstance(value, list):
+                value = tuple(value)
+            elif isinstance(value, set):
+                value = frozenset(value)
+            frozen[name] = value
+        return tuple(sorted(frozen.items()))
+
+    def get(self, name: str, builder: Callable[..., Any], **config) -> Any:
+        key = self._config_key(config)
+        entry = self._graphs.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        with self._lock:
+            # Another thread may have compiled the graph while we waited.
+            entry = self._graphs.get(name)
+            if entry is None or entry[0] != key:
+                entry = (key, builder(**config))
+                self._graphs[name] = entry
+                self.builds += 1
+            return entry[1]
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            if name is None:
+                self._graphs.clear()
+            else:
+                self._graphs.pop(name, None)
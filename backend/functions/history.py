@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import tiktoken
+    # Downloaded on first use; offline, point TIKTOKEN_CACHE_DIR at a cached copy.
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken missing or its encoding files unavailable offline
+    _encoding = None
+# What count_tokens counts with, for reports that quote its numbers.
+TOKEN_COUNTING = "o200k_base" if _encoding is not None else "estimate, ~4 characters per token"
+
+RETRY_ERROR_PREFIX = "Previous SQL error:"
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+# Rough per-message overhead of the chat format (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+Message = Dict[str, str]
+
+
+def as_message(item) -> Message:
+    # The simple chat page sends plain strings (the user's previous questions).
+    if isinstance(item, dict):
+        return item
+    return {"role": "user", "content": str(item)}
+
+
+def count_tokens(messages: Sequence) -> int:
+    total = 0
+    for message in messages:
+        content = as_message(message).get("content", "")
+        total += MESSAGE_OVERHEAD_TOKENS + (len(_encoding.encode(content)) if _encoding else len(content) // 4 + 1)
+    return total
+
+
+def is_retry_error(message) -> bool:
+    message = as_message(message)
+    return message.get("role") == "system" and message.get("content", "").startswith(RETRY_ERROR_PREFIX)
+
+
+def drop_retry_errors(history: Sequence, since: int = 0) -> List:
+    """Remove retry-error messages after `since`, with the failed attempt each one answered.
+
+    Every failed attempt appends (user question, assistant SQL) followed by one
+    "Previous SQL error" message, so each error takes the two messages before it along.
+    """
+    kept = list(history[:since])
+    for item in history[since:]:
+        if is_retry_error(item):
+            del kept[max(since, len(kept) - 2):]
+        else:
+            kept.append(item)
+    return kept
+
+
+def current_attempts(messages: Sequence, question: Optional[str] = None) -> int:
+    """Index of the first attempt at `question` among the trailing retries, or len(messages).
+
+    Each retry appends the question again, so the attempts at the current
+    question are the trailing run of user messages that all repeat it. Without
+    `question`, the latest user message is taken as the question.
+    """
+    messages = [as_message(item) for item in messages]
+    if question is None:
+        question = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), None)
+    start = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].get("role") == "user":
+            if messages[i].get("content") != question:
+                break
+            start = i
+    return start
+
+
+def _chain_digest(previous: str, message: Message) -> str:
+    return hashlib.sha256((previous + json.dumps(message, sort_keys=True)).encode()).hexdigest()
+
+
+class HistoryManager:
+    """Fits conversation history into a per-request token budget.
+
+    The last `keep_recent` messages are kept verbatim. Older ones are folded into
+    a rolling summary when a `summarize(previous_summary, messages) -> str`
+    callable is given, or dropped otherwise. Summaries are cached by a hash
+    chain over the summarized messages, so each turn is summarized once and
+    later requests extend the longest summary already computed. `aprepare`
+    awaits `asummarize` when given, else runs `summarize` on the default executor.
+    """
+
+    def __init__(self, token_budget: int = 2000, keep_recent: int = 10,
+                 summarize: Optional[Callable[[Optional[str], List[Message]], str]] = None,
+                 max_cached_summaries: int = 512,
+                 asummarize: Optional[Callable[[Optional[str], List[Message]], Awaitable[str]]] = None):
+        self.token_budget = token_budget
+        self.keep_recent = max(1, keep_recent)
+        self.summarize = summarize
+        self.asummarize = asummarize
+        self.max_cached_summaries = max_cached_summaries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached_summary(self, older: List[Message]) -> Tuple[List[str], int, Optional[str]]:
+        """(hash chain over `older`, how many of them the longest cached summary covers, that summary)."""
+        digests = []
+        digest = ""
+        for message in older:
+            digest = _chain_digest(digest, message)
+            digests.append(digest)
+
+        with self._lock:
+            for i in range(len(digests) - 1, -1, -1):
+                if digests[i] in self._summaries:
+                    self._summaries.move_to_end(digests[i])
+                    return digests, i + 1, self._summaries[digests[i]]
+        return digests, 0, None
+
+    def _store_summary(self, digests: List[str], summary: str):
+        with self._lock:
+            self._summaries[digests[-1]] = summary
+            while len(self._summaries) > self.max_cached_summaries:
+                self._summaries.popitem(last=False)
+
+    def _rolling_summary(self, older: List[Message]) -> Optional[str]:
+        digests, start, summary = self._cached_summary(older)
+        if start == len(older):
+            return summary
+        summary = self.summarize(summary, older[start:])
+        self._store_summary(digests, summary)
+        return summary
+
+    async def _arolling_summary(self, older: List[Message]) -> Optional[str]:
+        digests, start, summary = self._cached_summary(older)
+        if start == len(older):
+            return summary
+        if self.asummarize is not None:
+            summary = await self.asummarize(summary, older[start:])
+        else:
+            loop = asyncio.get_running_loop()
+            summary = await loop.run_in_executor(None, self.summarize, summary, older[start:])
+        self._store_summary(digests, summary)
+        return summary
+
+    def _split(self, history: Sequence, question: Optional[str]) -> Tuple[List[Message], List[Message], int]:
+        messages = [as_message(item) for item in history]
+        tokens_before = count_tokens(messages)
+
+        # Retry errors only matter for the question currently being retried.
+        current = current_attempts(messages, question)
+        messages = [m for i, m in enumerate(messages) if i >= current or not is_retry_error(m)]
+        return messages[:-self.keep_recent], messages[-self.keep_recent:], tokens_before
+
+    def _fit(self, history: Sequence, older: List[Message], recent: List[Message], summary: Optional[str],
+             tokens_before: int) -> Tuple[List[Message], dict]:
+        prefix = [] if summary is None else [{"role": "system", "content": f"{SUMMARY_PREFIX} {summary}"}]
+
+        # Still over budget: drop the oldest verbatim turns, always keeping the latest one.
+        while len(recent) > 1 and count_tokens(prefix + recent) > self.token_budget:
+            recent.pop(0)
+
+        prepared = prefix + recent
+        tokens_after = count_tokens(prepared)
+        summarized = len(older) if prefix else 0
+        return prepared, {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+            "summarized_messages": summarized,
+            "dropped_messages": len(history) - summarized - len(recent),
+        }
+
+    def prepare(self, history: Sequence, question: Optional[str] = None) -> Tuple[List[Message], dict]:
+        """Return (messages to send, report) for `history` before asking `question`.
+
+        Retry errors are kept for the attempts at `question` only; when not
+        given, the latest user message in `history` is taken as the question.
+        """
+        older, recent, tokens_before = self._split(history, question)
+        summary = self._rolling_summary(older) if older and self.summarize is not None else None
+        return self._fit(history, older, recent, summary, tokens_before)
+
+    async def aprepare(self, history: Sequence, question: Optional[str] = None) -> Tuple[List[Message], dict]:
+        """prepare() for the event loop: summarization is awaited instead of blocking it."""
+        older, recent, tokens_before = self._split(history, question)
+        summarize = older and (self.summarize is not None or self.asummarize is not None)
+        summary = await self._arolling_summary(older) if summarize else None
+        return self._fit(history, older, recent, summary, tokens_before)
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from functions.sqlite_engine import quote_identifier, read_only_uri
+
+# Longest composite index the advisor will create.
+MAX_INDEX_COLUMNS = 4
+
+_CLAUSE_END = r"(?=\bGROUP\s+BY\b|\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|\bWINDOW\b|;|$)"
+_WHERE = re.compile(r"\bWHERE\b(.*?)" + _CLAUSE_END, re.IGNORECASE | re.DOTALL)
+_GROUP_BY = re.compile(r"\bGROUP\s+BY\b(.*?)(?=\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|;|$)",
+                       re.IGNORECASE | re.DOTALL)
+_EQUALITY = r"\s*(?:=|==|\bIN\b|\bIS\b)"
+_RANGE = r"\s*(?:<|>|\bBETWEEN\b|\bLIKE\b)"
+
+# (table, equality columns, range columns, group-by columns)
+Pattern = Tuple[str, Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]
+
+
+def _column_regex(column: str) -> str:
+    names = [re.escape('"' + column + '"'), re.escape("`" + column + "`"), re.escape("[" + column + "]")]
+    if re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", column):
+        names.append(r"(?<![\w\"'`.])" + re.escape(column) + r"(?![\w\"'`])")
+    return r"(?:\w+\.)?(?:" + "|".join(names) + ")"
+
+
+def query_pattern(sql: str, table: str, columns: List[str]) -> Pattern:
+    """The columns `sql` filters on by equality, by range and groups by."""
+    where = " ".join(match.group(1) for match in _WHERE.finditer(sql))
+    group_by = " ".join(match.group(1) for match in _GROUP_BY.finditer(sql))
+    equality, ranges, grouped = [], [], []
+    for column in columns:
+        regex = _column_regex(column)
+        if re.search(regex + _EQUALITY, where, re.IGNORECASE):
+            equality.append(column)
+        elif re.search(regex + _RANGE, where, re.IGNORECASE):
+            ranges.append(column)
+        if re.search(regex, group_by):
+            grouped.append(column)
+    return table, tuple(equality), tuple(ranges), tuple(grouped)
+
+
+def index_name(table: str, columns: Tuple[str, ...]) -> str:
+    digest = hashlib.sha1("\0".join((table,) + columns).encode()).hexdigest()[:10]
+    return f"auto_{re.sub(r'[^A-Za-z0-9_]', '_', table)}_{digest}"
+
+
+class IndexAdvisor:
+    """Suggests and builds indexes for one uploaded database from the queries run on it.
+
+    Every executed query is matched against EXPLAIN QUERY PLAN; queries that
+    full-scan a table are recorded by the columns they filter and group on.
+    Once a pattern has been seen `min_observations` times, `observe` returns a
+    composite index for it (equality columns by selectivity, then GROUP BY
+    columns, then one range column). `build` creates the indexes on a private
+    copy of the upload, so the uploaded file and its fingerprint never change.
+    """
+
+    def __init__(self, path: str, min_observations: int = 3, max_indexes: int = 8):
+        self.path = path
+        # The file currently served: the upload until the first build, then the latest copy.
+        self.current_path = path
+        self._version = 0
+        self.min_observations = min_observations
+        self.max_indexes = max_indexes
+        self.patterns: Counter = Counter()
+        self.built: Set[Tuple[str, Tuple[str, ...]]] = set()
+        self._pending: Set[Tuple[str, Tuple[str, ...]]] = set()
+        self._columns: Optional[Dict[str, List[str]]] = None
+        self._distinct: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _table_columns(self, conn: sqlite3.Connection) -> Dict[str, List[str]]:
+        if self._columns is None:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            self._columns = {
+                table: [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+                for table in tables
+            }
+        return self._columns
+
+    def _distinct_count(self, conn: sqlite3.Connection, table: str, column: str) -> int:
+        key = (table, column)
+        if key not in self._distinct:
+            self._distinct[key] = conn.execute(
+                f"SELECT COUNT(DISTINCT {quote_identifier(column)}) FROM {quote_identifier(table)}").fetchone()[0]
+        return self._distinct[key]
+
+    def _index_columns(self, conn: sqlite3.Connection, pattern: Pattern) -> Tuple[str, ...]:
+        table, equality, ranges, grouped = pattern
+        columns = sorted(equality, key=lambda column: -self._distinct_count(conn, table, column))
+        columns += [column for column in grouped if column not in columns]
+        if ranges and ranges[0] not in columns:
+            columns.append(ranges[0])
+        return tuple(columns[:MAX_INDEX_COLUMNS])
+
+    def observe(self, engine, sql: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+        """Record an executed query; returns (table, columns) when an index should be built."""
+        with engine.connection() as conn:
+            try:
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            except sqlite3.Error:
+                return None
+            tables = self._table_columns(conn)
+            scanned = [detail.split(" ")[1] for detail in plan if detail.startswith("SCAN ")]
+            scanned = [table for table in scanned if table in tables]
+            if len(scanned) != 1:
+                return None  # joins and aliased scans are left to the guardrails
+            pattern = query_pattern(sql, scanned[0], tables[scanned[0]])
+            if not (pattern[1] or pattern[2] or pattern[3]):
+                return None
+
+            with self._lock:
+                self.patterns[pattern] += 1
+                if self.patterns[pattern] < self.min_observations:
+                    return None
+                index = (pattern[0], self._index_columns(conn, pattern))
+                if (index in self.built or index in self._pending
+                        or len(self.built) + len(self._pending) >= self.max_indexes):
+                    return None
+                self._pending.add(index)
+                return index
+
+    def build(self, indexes: List[Tuple[str, Tuple[str, ...]]]) -> str:
+        """Copy the database currently served, add `indexes` to the copy and return its path.
+
+        Each build writes a new copy, so connections still reading the previous
+        one are never blocked by CREATE INDEX; the caller swaps engines and then
+        removes the old copy with `remove_copy`.
+        """
+        with self._build_lock:
+            self._version += 1
+            target_path = f"{self.path}.indexed{self._version}"
+            tmp_path = target_path + ".tmp"
+            try:
+                source = sqlite3.connect(read_only_uri(self.current_path), uri=True)
+                target = sqlite3.connect(tmp_path)
+                try:
+                    source.backup(target)
+                    for table, columns in indexes:
+                        target.execute(
+                            f"CREATE INDEX IF NOT EXISTS {index_name(table, columns)} ON {quote_identifier(table)} "
+                            f"({', '.join(quote_identifier(column) for column in columns)})"
+                        )
+                    target.execute("ANALYZE")
+                    target.commit()
+                finally:
+                    source.close()
+                    target.close()
+                os.replace(tmp_path, target_path)
+            except Exception:
+                with self._lock:
+                    self._pending.difference_update(indexes)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self.current_path = target_path
+            with self._lock:
+                self._pending.difference_update(indexes)
+                self.built.update(indexes)
+            return target_path
+
+    def remove_copy(self, path: str):
+        """Delete a private copy made by `build`; the original upload is never removed."""
+        if path == self.path:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # still open elsewhere (e.g. on Windows); left on disk
+
+    def discard(self):
+        """Delete the latest private copy, e.g. when the database is evicted."""
+        self.remove_copy(self.current_path)
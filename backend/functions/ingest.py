@@ -0,0 +1,199 @@
+"""Chunked CSV/TSV/Parquet ingestion into an SQLite `data` table.
+
+Usage (from the backend directory):
+    python -m functions.ingest "dataset/cpi Group data.csv" inflation_data.db
+"""
+import argparse
+import csv
+import importlib.util
+import os
+import sqlite3
+import time
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, TypedDict
+
+from functions.sqlite_engine import quote_identifier
+
+# The CPI table of the original preprocessing script. Files whose header matches
+# it keep these types; any other file gets types inferred from its first chunk.
+DATA_SCHEMA: Tuple[Tuple[str, str], ...] = (
+    ("BaseYear", "INTEGER"),
+    ("Year", "INTEGER"),
+    ("Month", "TEXT"),
+    ("State", "TEXT"),
+    ("Sector", "TEXT"),
+    ("Group", "TEXT"),
+    ("SubGroup", "TEXT"),
+    ("Index", "REAL"),
+    ("Inflation (%)", "REAL"),
+)
+# Built after the load, on the columns nearly every generated query filters on.
+DEFAULT_INDEXES: Tuple[Tuple[str, ...], ...] = (
+    ("Year", "Month"),
+    ("State", "Sector"),
+)
+NA_VALUES = frozenset({"", "*", "NA", "N/A", "NaN", "nan", "null", "NULL"})
+# Only for the load: the file is fresh, so a crash just means loading again.
+LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": -256 * 1024,
+    "temp_store": "MEMORY",
+}
+INGEST_EXTENSIONS = ("csv", "tsv", "parquet")
+
+
+class IngestReport(TypedDict):
+    table: str
+    rows: int
+    columns: List[str]
+    seconds: float
+    rows_per_sec: float
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def ingest_extensions() -> set:
+    """File extensions ingest_file accepts here; Parquet needs pyarrow."""
+    return {ext for ext in INGEST_EXTENSIONS if ext != "parquet" or parquet_available()}
+
+
+def _infer_type(values: Iterable) -> str:
+    inferred = "INTEGER"
+    for value in values:
+        if value is None:
+            continue
+        value = str(value)
+        try:
+            int(value)
+            continue
+        except ValueError:
+            pass
+        try:
+            float(value)
+            inferred = "REAL"
+        except ValueError:
+            return "TEXT"
+    return inferred
+
+
+def _schema_for(header: Sequence[str], sample: List[list]) -> List[Tuple[str, str]]:
+    declared = {name.lower(): (name, type_) for name, type_ in DATA_SCHEMA}
+    if len(header) == len(DATA_SCHEMA) and all(name.strip().lower() in declared for name in header):
+        return [declared[name.strip().lower()] for name in header]
+    return [(name.strip(), _infer_type(row[i] for row in sample)) for i, name in enumerate(header)]
+
+
+def _csv_rows(path: str, delimiter: Optional[str], na_values: frozenset) -> Tuple[List[str], Iterator[list]]:
+    f = open(path, newline="", encoding="utf-8-sig")
+    if delimiter is None:
+        first_line = f.readline()
+        f.seek(0)
+        delimiter = "\t" if first_line.count("\t") > first_line.count(",") else ","
+    reader = csv.reader(f, delimiter=delimiter)
+    header = next(reader, None)
+    if not header:
+        f.close()
+        raise ValueError(f"{path} has no header row")
+
+    def rows():
+        try:
+            for row in reader:
+                if row:
+                    yield [None if value in na_values else value for value in row]
+        finally:
+            f.close()
+    return header, rows()
+
+
+def _parquet_rows(path: str, chunk_rows: int) -> Tuple[List[str], Iterator[list]]:
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+
+    def rows():
+        for batch in parquet.iter_batches(batch_size=chunk_rows):
+            columns = [column.to_pylist() for column in batch.columns]
+            yield from (list(row) for row in zip(*columns))
+    return parquet.schema_arrow.names, rows()
+
+
+def ingest_file(source: str, db_path: str, table: str = "data", delimiter: Optional[str] = None,
+                chunk_rows: int = 50_000, indexes: Sequence[Sequence[str]] = DEFAULT_INDEXES,
+                na_values: frozenset = NA_VALUES) -> IngestReport:
+    """Load `source` into a new table in `db_path`, `chunk_rows` rows at a time.
+
+    Values are inserted as read and converted by the declared column types
+    (SQLite type affinity), so memory stays bounded by one chunk whatever the
+    file size. Everything is inserted in one transaction with journaling and
+    syncing off; indexes listed in `indexes` that exist in the table are
+    created afterwards, followed by ANALYZE.
+    """
+    start = time.perf_counter()
+    if source.lower().endswith(".parquet"):
+        header, rows = _parquet_rows(source, chunk_rows)
+    else:
+        header, rows = _csv_rows(source, delimiter, na_values)
+
+    first_chunk = list(islice(rows, chunk_rows))
+    schema = _schema_for(header, first_chunk)
+    names = [name for name, _ in schema]
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        for name, value in LOAD_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table)}")
+        conn.execute(f"CREATE TABLE {quote_identifier(table)} ("
+                     + ", ".join(f"{quote_identifier(name)} {type_}" for name, type_ in schema) + ")")
+        insert = (f"INSERT INTO {quote_identifier(table)} VALUES ("
+                  + ", ".join("?" for _ in schema) + ")")
+
+        total = 0
+        chunk = first_chunk
+        while chunk:
+            # Short rows are padded and long ones cut, instead of failing the whole load.
+            width = len(schema)
+            conn.executemany(insert, (row if len(row) == width else (row + [None] * width)[:width] for row in chunk))
+            total += len(chunk)
+            chunk = list(islice(rows, chunk_rows))
+
+        lowered = {name.lower(): name for name in names}
+        for columns in indexes:
+            if all(column.lower() in lowered for column in columns):
+                resolved = [lowered[column.lower()] for column in columns]
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {quote_identifier('idx_' + table + '_' + '_'.join(resolved))} "
+                    f"ON {quote_identifier(table)} ({', '.join(quote_identifier(c) for c in resolved)})"
+                )
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - start
+    return IngestReport(table=table, rows=total, columns=names, seconds=round(seconds, 3),
+                        rows_per_sec=round(total / seconds) if seconds else float(total))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load a CSV/TSV/Parquet file into an SQLite database.")
+    parser.add_argument("source")
+    parser.add_argument("database")
+    parser.add_argument("--table", default="data")
+    parser.add_argument("--delimiter", help="default: tab or comma, detected from the header")
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    report = ingest_file(args.source, args.database, table=args.table, delimiter=args.delimiter,
+                         chunk_rows=args.chunk_rows)
+    print(f"{report['rows']:,} rows into {args.database}:{report['table']} in {report['seconds']:.1f}s "
+          f"({report['rows_per_sec']:,.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypedDict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from functions.example_store import SEED_EXAMPLES, normalize_question
+from functions.history import count_tokens
+
+PROVIDERS = ("openai", "local", "google", "stub")
+LATENCY_DISTRIBUTIONS = ("fixed", "normal", "lognormal")
+EMBEDDING_DIMENSIONS = 256
+
+# What the stub answers when no recording matches: a query that runs on any database,
+# or a sentence for the explanation and summary models.
+STUB_SQL_FALLBACK = "SELECT 1 AS no_recording;"
+STUB_TEXT_FALLBACK = "Answered by the offline stub model."
+# How agentic-app's complexify prompt quotes the question it refines.
+ORIGINAL_QUESTION = "Original question:"
+
+
+class LLMSettings(TypedDict):
+    # "openai", "local" (any OpenAI-compatible server), "google" or "stub"
+    provider: str
+    local_url: str
+    local_model: str
+    google_model: str
+    # JSONL of {"question", "response" or "sql", optional "role"} replayed by the stub
+    recordings: Optional[str]
+    latency_ms: float
+    jitter_ms: float
+    # "fixed", "normal" or "lognormal"
+    distribution: str
+    seed: int
+    # When set, every prompt/response pair of the real models is appended here
+    record_path: Optional[str]
+
+
+def llm_settings_from_env() -> LLMSettings:
+    settings = LLMSettings(
+        provider=os.getenv("LLM_PROVIDER", "openai"),
+        local_url=os.getenv("LOCAL_LLM_URL", "http://localhost:11434/v1"),
+        local_model=os.getenv("LOCAL_LLM_MODEL", "qwen2.5-coder:1.5b"),
+        google_model=os.getenv("GOOGLE_LLM_MODEL", "models/gemini-2.0-flash"),
+        recordings=os.getenv("LLM_STUB_RECORDINGS"),
+        latency_ms=float(os.getenv("LLM_STUB_LATENCY_MS", 300)),
+        jitter_ms=float(os.getenv("LLM_STUB_JITTER_MS", 50)),
+        distribution=os.getenv("LLM_STUB_DISTRIBUTION", "normal"),
+        seed=int(os.getenv("LLM_STUB_SEED", 0)),
+        record_path=os.getenv("LLM_RECORD_PATH"),
+    )
+    if settings["provider"] not in PROVIDERS:
+        raise ValueError(f"LLM_PROVIDER must be one of {', '.join(PROVIDERS)}, not {settings['provider']!r}")
+    if settings["distribution"] not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"LLM_STUB_DISTRIBUTION must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+    return settings
+
+
+def _content(message) -> str:
+    content = message.content if isinstance(message, BaseMessage) else message.get("content", "")
+    return content if isinstance(content, str) else json.dumps(content, default=str)
+
+
+def _is_human(message) -> bool:
+    if isinstance(message, BaseMessage):
+        return message.type == "human"
+    return message.get("role") in ("user", "human")
+
+
+def load_recordings(path: Optional[str], role: str) -> Dict[str, str]:
+    """Normalized question -> response for `role` (records without a role apply to all).
+
+    Without a file, the SQL models replay the vetted CPI examples.
+    """
+    recordings: Dict[str, str] = {}
+    if path is None:
+        if role.startswith("sql"):
+            recordings.update((normalize_question(question), sql) for question, sql in SEED_EXAMPLES)
+        return recordings
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("role", role) == role:
+                recordings[normalize_question(record["question"])] = record.get("response", record.get("sql", ""))
+    return recordings
+
+
+class RecordedChatModel(BaseChatModel):
+    """Offline stand-in for a chat model that replays recorded question -> response pairs.
+
+    The reply is the recording for the longest recorded question found in the
+    last user message, else in the "Original question: ..." line of a complexify
+    prompt, else `fallback`. System messages such as few-shot hints are never
+    matched, so replies do not depend on which examples were retrieved. Each
+    call waits for a latency drawn from `distribution`; draws are seeded by
+    (seed, question, n-th call), so a run replays the same latencies whatever
+    the concurrency.
+    """
+
+    recordings: Dict[str, str] = {}
+    fallback: str = STUB_SQL_FALLBACK
+    latency_ms: float = 300.0
+    jitter_ms: float = 50.0
+    distribution: str = "normal"
+    seed: int = 0
+    _calls: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "recorded"
+
+    def _reply(self, messages: Sequence) -> Tuple[str, str]:
+        question = next((_content(message) for message in reversed(messages) if _is_human(message)), "")
+        texts = [question] + [_content(message).split("\n", 1)[0][len(ORIGINAL_QUESTION):]
+                              for message in messages if _content(message).startswith(ORIGINAL_QUESTION)]
+        for text in texts:
+            text = f" {normalize_question(text)} "
+            best = max((recorded for recorded in self.recordings if recorded and f" {recorded} " in text),
+                       key=len, default=None)
+            if best is not None:
+                return self.recordings[best], best
+        return self.fallback, normalize_question(question)
+
+    def _delay(self, key: str) -> float:
+        with self._lock:
+            count = self._calls[key] = self._calls.get(key, 0) + 1
+        rng = random.Random(f"{self.seed}:{key}:{count}")
+        if self.distribution == "fixed":
+            latency = self.latency_ms
+        elif self.distribution == "lognormal":
+            # Median latency_ms with a long right tail; jitter_ms sets the spread.
+            sigma = math.log1p(self.jitter_ms / self.latency_ms) if self.latency_ms > 0 else 0.0
+            latency = self.latency_ms * math.exp(rng.gauss(0, sigma))
+        else:
+            latency = rng.gauss(self.latency_ms, self.jitter_ms)
+        return max(latency, 0.0) / 1000
+
+    def _result(self, messages: Sequence, text: str) -> ChatResult:
+        input_tokens = count_tokens([{"content": _content(message)} for message in messages])
+        output_tokens = count_tokens([{"content": text}])
+        message = AIMessage(content=text, usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                                          "total_tokens": input_tokens + output_tokens})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, key = self._reply(messages)
+        time.sleep(self._delay(key))
+        return self._result(messages, text)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, key = self._reply(messages)
+        await asyncio.sleep(self._delay(key))
+        return self._result(messages, text)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        text, key = self._reply(messages)
+        words = text.split(" ")
+        # The latency is spread over the tokens, as a streamed reply's would be.
+        delay = self._delay(key) / len(words)
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            token = word if i == 0 else " " + word
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class RecordingCallback(BaseCallbackHandler):
+    """Appends each call's last user message and reply to a JSONL file LLM_STUB_RECORDINGS can replay."""
+
+    def __init__(self, path: str, role: str):
+        self.path = path
+        self.role = role
+        self._questions: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        human = [_content(message) for message in messages[0] if getattr(message, "type", None) == "human"]
+        self._questions[run_id] = human[-1] if human else ""
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        question = self._questions.pop(run_id, None)
+        if not question or not response.generations or not response.generations[0]:
+            return
+        record = {"role": self.role, "question": question, "response": response.generations[0][0].text}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._questions.pop(run_id, None)
+
+
+def chat_model(settings: LLMSettings, role: str, model: str, temperature: float = 0,
+               callbacks: Optional[List[BaseCallbackHandler]] = None) -> BaseChatModel:
+    """The chat model for `role` ("sql", "explanation", ...) from the configured provider.
+
+    `model` names the OpenAI model; the local and Google providers use their own
+    configured model, and the stub replays recordings for `role`.
+    """
+    callbacks = list(callbacks or [])
+    provider = settings["provider"]
+    if settings["record_path"] and provider != "stub":
+        callbacks.append(RecordingCallback(settings["record_path"], role))
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model, temperature=temperature, callbacks=callbacks)
+    if provider == "local":
+        # Ollama, llama.cpp's llama-server and vLLM all serve the OpenAI chat API.
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=settings["local_model"], base_url=settings["local_url"], api_key="local",
+                          temperature=temperature, callbacks=callbacks)
+    if provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=settings["google_model"], google_api_key=os.getenv("GOOGLE_API_KEY"),
+                                      temperature=temperature, callbacks=callbacks)
+    return RecordedChatModel(
+        recordings=load_recordings(settings["recordings"], role),
+        fallback=STUB_SQL_FALLBACK if role.startswith("sql") else STUB_TEXT_FALLBACK,
+        latency_ms=settings["latency_ms"],
+        jitter_ms=settings["jitter_ms"],
+        distribution=settings["distribution"],
+        # Sampled candidates should not share latencies with the greedy model.
+        seed=settings["seed"] + int(hashlib.sha1(role.encode()).hexdigest()[:8], 16),
+        callbacks=callbacks,
+    )
+
+
+def hashed_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Deterministic bag-of-words vector; similar wording gives similar vectors, offline."""
+    vector = [0.0] * dimensions
+    for word in normalize_question(text).split():
+        digest = hashlib.sha1(word.encode()).digest()
+        vector[int.from_bytes(digest[:4], "big") % dimensions] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+def embedder(settings: LLMSettings) -> Callable[[str], List[float]]:
+    """embed_query for the semantic cache and schema linking; offline providers hash words instead."""
+    if settings["provider"] == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings().embed_query
+    return hashed_embedding
@@ -0,0 +1,211 @@
+import functools
+import inspect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.graph import StateGraph
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+RETRY_BUCKETS = (0, 1, 2, 3, 4, 5)
+RATIO_BUCKETS = (0, 0.1, 0.25, 0.5, 0.75, 0.9, 1)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_METRICS = (
+    ("node_seconds", "Wall time per graph node", LATENCY_BUCKETS),
+    ("node_errors_total", "Graph node invocations that raised", None),
+    ("llm_seconds", "Latency of LLM calls", LATENCY_BUCKETS),
+    ("llm_calls_total", "LLM calls", None),
+    ("llm_errors_total", "LLM calls that failed", None),
+    ("llm_prompt_tokens_total", "Prompt tokens reported by the provider", None),
+    ("llm_completion_tokens_total", "Completion tokens reported by the provider", None),
+    ("llm_cached_prompt_tokens_total", "Prompt tokens the provider served from its prompt cache", None),
+    ("llm_cached_prompt_ratio", "Share of each call's prompt tokens served from the prompt cache", RATIO_BUCKETS),
+    ("sql_seconds", "Execution time of generated SQL", LATENCY_BUCKETS),
+    ("sql_rows", "Rows returned by generated SQL", ROW_BUCKETS),
+    ("sql_errors_total", "Generated SQL that failed to execute", None),
+    ("sql_limit_exceeded_total", "Generated SQL stopped or rejected by an execution limit", None),
+    ("sql_repairs_total", "Deterministic fixes applied to generated SQL", None),
+    ("llm_retries_avoided_total", "Failing SQL repaired locally instead of asking the LLM again", None),
+    ("indexes_built_total", "Indexes created by the index advisor", None),
+    ("rollup_rewrites_total", "Generated SQL answered from a rollup table", None),
+    ("candidate_votes", "Candidate queries that agreed with the chosen answer", RETRY_BUCKETS),
+    ("candidates_cancelled_total", "Candidate queries abandoned once a majority agreed", None),
+    ("complexify_decisions_total", "Successful simple queries, by whether complexify_query refined them", None),
+    ("examples_learned_total", "Question/SQL pairs added to the example store from successful queries", None),
+    ("retries", "Retries needed per question", RETRY_BUCKETS),
+)
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(labels: Labels, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self, namespace: str = "nl2sql"):
+        self.namespace = namespace
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+        for name, help_text, buckets in DEFAULT_METRICS:
+            self.describe(name, help_text, buckets)
+
+    def _name(self, name: str) -> str:
+        return f"{self.namespace}_{name}"
+
+    def describe(self, name: str, help_text: str, buckets: Optional[Sequence[float]] = None):
+        self._help[self._name(name)] = help_text
+        if buckets is not None:
+            self._buckets[self._name(name)] = buckets
+
+    def inc(self, name: str, value: float = 1, labels: Optional[Dict[str, str]] = None):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(self._name(name), {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        full_name = self._name(name)
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(full_name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(full_name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        """Add a callable yielding (name, labels, value) gauges, evaluated on every render."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                full_name = self._name(name)
+                lines.append(f"# TYPE {full_name} gauge")
+                lines.append(f"{full_name}{_format_labels(_labels(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def time_node(self, node: str, fn: Callable) -> Callable:
+        """Wrap a graph node so its wall time and failures are recorded under `node`."""
+        labels = {"node": node}
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(state, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(state, *args, **kwargs)
+                except Exception:
+                    self.inc("node_errors_total", labels=labels)
+                    raise
+                finally:
+                    self.observe("node_seconds", time.perf_counter() - start, labels)
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(state, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(state, *args, **kwargs)
+            except Exception:
+                self.inc("node_errors_total", labels=labels)
+                raise
+            finally:
+                self.observe("node_seconds", time.perf_counter() - start, labels)
+        return timed
+
+
+class InstrumentedStateGraph(StateGraph):
+    """StateGraph whose nodes are timed automatically as they are added."""
+
+    def __init__(self, state_schema, metrics: Metrics, **kwargs):
+        super().__init__(state_schema, **kwargs)
+        self.metrics = metrics
+
+    def add_node(self, node, action=None, **kwargs):
+        if isinstance(node, str) and action is not None:
+            action = self.metrics.time_node(node, action)
+        return super().add_node(node, action, **kwargs)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """LangChain callback recording latency and token usage of every call made by one model."""
+
+    def __init__(self, metrics: Metrics, model: str):
+        self.metrics = metrics
+        self.labels = {"model": model}
+        self._started: Dict[object, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            self.metrics.observe("llm_seconds", time.perf_counter() - start, self.labels)
+        self.metrics.inc("llm_calls_total", labels=self.labels)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.metrics.inc("llm_prompt_tokens_total", usage.get("input_tokens", 0), self.labels)
+                self.metrics.inc("llm_completion_tokens_total", usage.get("output_tokens", 0), self.labels)
+                cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+                self.metrics.inc("llm_cached_prompt_tokens_total", cached, self.labels)
+                if usage.get("input_tokens"):
+                    self.metrics.observe("llm_cached_prompt_ratio", cached / usage["input_tokens"], self.labels)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        self.metrics.inc("llm_errors_total", labels=self.labels)
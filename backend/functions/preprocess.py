@@ -1,31 +1,7 @@
-import pandas as pd
-import sqlite3
+# Run from the backend directory: python -m functions.preprocess
+from functions.ingest import ingest_file
 
-# Read the CSV file, replacing '*' with None
-df = pd.read_csv("dataset\cpi Group data.csv", sep="\t", na_values=["*"])
-
-# Create an SQLite database
-conn = sqlite3.connect("inflation_data.db")
-cursor = conn.cursor()
-
-# Create table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS data (
-    BaseYear INTEGER,
-    Year INTEGER,
-    Month TEXT,
-    State TEXT,
-    Sector TEXT,
-    "Group" TEXT,
-    SubGroup TEXT,
-    "Index" REAL,
-    "Inflation (%)" REAL
-)
-''')
-
-# Insert data into the table
-df.to_sql("data", conn, if_exists="replace", index=False)
-
-# Commit and close connection
-conn.commit()
-conn.close()
+# Load the CPI CSV ('*' marks missing values) into the typed `data` table.
+# See functions/ingest.py for other files: python -m functions.ingest <file> <database>
+report = ingest_file("dataset\cpi Group data.csv", "inflation_data.db", delimiter="\t")
+print(f"{report['rows']:,} rows loaded ({report['rows_per_sec']:,.0f} rows/sec)")
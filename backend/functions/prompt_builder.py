@@ -0,0 +1,70 @@
+import hashlib
+import json
+from typing import Dict, List, Mapping, Optional, Sequence
+
+# Bump when INSTRUCTIONS or the layout below change; it is part of prefix_hash, so
+# traces and cache metrics from different prompt versions are told apart.
+PROMPT_VERSION = 2
+
+# Fixed for every upload and question: nothing in here is formatted per request.
+INSTRUCTIONS = """You are an extremely precise SQL expert analyzing economic data in a conversation. Your goal is to generate only valid, executable SQL queries. You MUST follow these instructions exactly. Pay very close attention to the conversation history and to error messages to refine your queries.
+
+When the question is vague or requires summarization:
+- Identify and select only the columns relevant to the question.
+- Use appropriate aggregations (e.g., SUM, AVG, COUNT) or grouping when the question asks for trends or summaries.
+- If the question asks about trends over time (e.g., monthly, quarterly), group by the Month or Year column as appropriate.
+- If the question asks about factors affecting inflation or trends, consider aggregating on Inflation (%) and selecting relevant columns such as State, Sector, or Group.
+
+Handling Follow-up Questions:
+When you receive a new question, consider the conversation history to understand the user's evolving information needs.
+- Identify Semantic Context: Focus on the overall meaning and topic of the conversation, not just keywords.  Understand the user's underlying intent.
+- Recognize Question Type: Determine if the new question is a refinement, specification, or related question to the previous turns. Is it asking for similar information but with different parameters, or a completely new topic?
+- Maintain Semantic Consistency: If the current question is semantically related to the previous ones, try to maintain consistency in the query structure (e.g., columns, aggregations) while adjusting filters or groupings as needed. For very short follow-up questions (like single words or years),  infer the implied intent from the semantic context of the conversation.  **However, be cautious not to over-infer context if the new question introduces a significantly different topic or data requirement.**
+- Independent Questions: If the new question appears to be unrelated to the conversation history, generate a new SQL query from scratch, disregarding prior context.
+
+Generate SQL queries for SQLite following these rules:
+1. Return a single SQL query per question.
+2. Select necessary columns to support user question.
+3. Check previous questions in the conversation history to provide context and maintain semantic consistency where appropriate.
+4. Use only columns that exist in the tables below.
+5. Escape reserved keywords with backticks (`).
+6. Return only the SQL query without Markdown (dont wrap with ```sql).
+7. Use `LIMIT 5` when results need to be restricted."""
+
+
+def _clean(text: str) -> str:
+    # Line endings and trailing spaces differ between drivers; the prompt must not.
+    return "\n".join(line.rstrip() for line in str(text).replace("\r\n", "\n").split("\n")).strip()
+
+
+def build_prefix(schema: Mapping[str, str]) -> List[Dict[str, str]]:
+    """The system message every question about `schema` starts with.
+
+    Instructions first, then the tables and sample rows (`schema` is a SchemaInfo
+    or LinkedSchema), each exactly once. The same schema always gives the same
+    bytes, so providers can serve the prefix from their prompt cache.
+    """
+    content = (f"{INSTRUCTIONS}\n\n"
+               f"Available tables:\n{_clean(schema['table_info'])}\n\n"
+               f"Here are some sample rows from the database to understand the structure:\n"
+               f"{_clean(schema['sample_data'])}")
+    return [{"role": "system", "content": content}]
+
+
+def prefix_hash(prefix: Sequence[Dict[str, str]]) -> str:
+    payload = json.dumps([PROMPT_VERSION, list(prefix)], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def assemble(prefix: Sequence[Dict[str, str]], history: Sequence[Dict[str, str]],
+             hints: Sequence[Optional[Dict[str, str]]], question: str) -> List[Dict[str, str]]:
+    """Prefix, then conversation history, per-question hints and the question.
+
+    Everything that changes between calls comes after the prefix, and the hints
+    come after the history, so consecutive turns of one conversation share
+    everything up to the newest messages.
+    """
+    messages = list(prefix) + list(history)
+    messages.extend(hint for hint in hints if hint is not None)
+    messages.append({"role": "user", "content": question})
+    return messages
@@ -0,0 +1,133 @@
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?.!").strip().lower()
+
+
+def history_key(history: Sequence, window: int) -> str:
+    """Stable key for the last `window` turns; older turns do not change the answer."""
+    recent = list(history)[-window:] if window > 0 else []
+    return json.dumps(recent, sort_keys=True, default=str)
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "scope", "vector")
+
+    def __init__(self, value, expires_at, scope, vector):
+        self.value = value
+        self.expires_at = expires_at
+        self.scope = scope
+        self.vector = vector
+
+
+class ResultCache:
+    """LRU + TTL cache of question -> {sql_query, result} for one or more uploaded databases.
+
+    The exact tier is keyed on (db fingerprint, normalized question, trimmed history).
+    When an `embed` callable is given, a miss falls back to the most similar cached
+    question with the same fingerprint and history whose cosine similarity is at
+    least `similarity_threshold`. `embed` is called synchronously by get and put
+    (once per miss and per store), so async callers run them on an executor.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600,
+                 history_window: int = 10,
+                 embed: Optional[Callable[[str], List[float]]] = None,
+                 similarity_threshold: float = 0.92,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.history_window = history_window
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _key(self, fingerprint: str, question: str, history: Sequence):
+        scope = (fingerprint, history_key(history, self.history_window))
+        return scope + (normalize_question(question),), scope
+
+    def get(self, fingerprint: str, question: str, history: Sequence) -> Optional[dict]:
+        key, scope = self._key(fingerprint, question, history)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                del self._entries[key]
+                self.expirations += 1
+
+        if self.embed is not None:
+            vector = self.embed(key[-1])
+            with self._lock:
+                best_key, best_score = None, self.similarity_threshold
+                for candidate_key, candidate in self._entries.items():
+                    if candidate.scope != scope or candidate.vector is None or candidate.expires_at <= now:
+                        continue
+                    score = _cosine(vector, candidate.vector)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key].value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, fingerprint: str, question: str, history: Sequence, value: dict):
+        key, scope = self._key(fingerprint, question, history)
+        vector = self.embed(key[-1]) if self.embed is not None else None
+        with self._lock:
+            self._entries[key] = _Entry(value, self.clock() + self.ttl_seconds, scope, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, fingerprint: Optional[str] = None):
+        with self._lock:
+            if fingerprint is None:
+                self._entries.clear()
+                return
+            for key in [k for k, entry in self._entries.items() if entry.scope[0] == fingerprint]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
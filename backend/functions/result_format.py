@@ -0,0 +1,54 @@
+import importlib.util
+from typing import Optional
+
+RESULT_FORMATS = ("records", "compact", "columnar")
+ARROW_MIME_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Pick the result encoding from the request body's `format` or the Accept header.
+
+    Anything unknown falls back to "records", the original list-of-dicts shape.
+    Arrow is only offered when pyarrow is installed.
+    """
+    if accept and ARROW_MIME_TYPE in accept and importlib.util.find_spec("pyarrow") is not None:
+        return "arrow"
+    if requested in RESULT_FORMATS:
+        return requested
+    return "records"
+
+
+def encode_result(result: Optional[dict], fmt: str) -> Optional[dict]:
+    """Re-encode a {"columns", "data": [row dicts]} result.
+
+    compact:  {"columns": [...], "rows": [[v1, v2, ...], ...]}
+    columnar: {"columns": [...], "data": {column: [values]}}
+    Errors and other keys (e.g. "truncated") pass through unchanged.
+    """
+    if fmt == "records" or not result or "error" in result:
+        return result
+
+    columns = result.get("columns", [])
+    data = result.get("data", [])
+    encoded = {key: value for key, value in result.items() if key != "data"}
+    encoded["format"] = fmt
+    if fmt == "compact":
+        encoded["rows"] = [[row.get(col) for col in columns] for row in data]
+    elif fmt == "columnar":
+        encoded["data"] = {col: [row.get(col) for row in data] for col in columns}
+    else:
+        raise ValueError(f"Unknown result format: {fmt}")
+    return encoded
+
+
+def encode_arrow(result: dict) -> bytes:
+    """Serialize a result as an Arrow IPC stream. Requires pyarrow."""
+    import pyarrow as pa
+
+    columns = result.get("columns", [])
+    data = result.get("data", [])
+    table = pa.table({col: [row.get(col) for row in data] for col in columns})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,55 @@
+import json
+import sqlite3
+from typing import Iterator
+
+from functions.sqlite_engine import QueryLimitExceeded
+
+
+def ndjson(obj) -> str:
+    return json.dumps(obj, default=str) + "\n"
+
+
+def sse(event: str, data) -> str:
+    """One server-sent event with `data` encoded as a single line of JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def stream_rows(engine, query: str, batch_size: int = 500, max_rows: int = 10000,
+                max_bytes: int = 8 * 1024 * 1024) -> Iterator[str]:
+    """Stream a query result as NDJSON `rows` lines followed by one `end` line.
+
+    Rows are pulled from the cursor `batch_size` at a time and encoded once each.
+    Streaming stops once `max_rows` rows or `max_bytes` of row payload have been
+    sent, and the `end` line then carries `truncated: true`.
+    """
+    sent_rows = 0
+    sent_bytes = 0
+    truncated = False
+    batches = engine.iter_batches(query, batch_size)
+    try:
+        for columns, rows in batches:
+            encoded = []
+            for row in rows:
+                if sent_rows + len(encoded) >= max_rows:
+                    truncated = True
+                    break
+                record = json.dumps(dict(zip(columns, row)), default=str)
+                if sent_bytes + len(record) + 1 > max_bytes:
+                    truncated = True
+                    break
+                sent_bytes += len(record) + 1
+                encoded.append(record)
+            if encoded:
+                sent_rows += len(encoded)
+                yield '{"type": "rows", "rows": [' + ",".join(encoded) + "]}\n"
+            if truncated:
+                break
+    except sqlite3.Error as e:
+        error = {"type": "error", "error": str(e)}
+        if isinstance(e, QueryLimitExceeded):
+            error["limit"] = e.limit
+        yield ndjson(error)
+        return
+    finally:
+        batches.close()
+    yield ndjson({"type": "end", "row_count": sent_rows, "truncated": truncated})
@@ -0,0 +1,341 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from functions.sqlite_engine import quote_identifier, read_only_uri
+
+# Name the rollup file is attached under on every ReadOnlyEngine connection.
+ROLLUP_SCHEMA = "rollup"
+
+# Candidate dimension sets for the `data` table of functions/preprocess.py; a
+# rollup is built for each set whose columns all exist in the uploaded table.
+DEFAULT_DIMENSIONS: Tuple[Tuple[str, ...], ...] = (
+    ("Year", "Month", "Sector", "Group"),
+    ("Year", "Month", "State", "Sector"),
+    ("Year", "State", "Sector", "Group"),
+)
+MEASURE_TYPES = ("REAL", "FLOA", "DOUB", "NUMERIC", "DECIMAL")
+
+_TOKEN = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><=|>=|<>|!=|==|\|\||[-+*/%<>=(),.;])
+  | (?P<space>\s+)
+""", re.VERBOSE)
+
+AGGREGATES = {"AVG", "SUM", "COUNT", "MIN", "MAX", "TOTAL"}
+# Bare words allowed next to dimension columns and rewritten aggregates.
+ALLOWED_WORDS = {
+    "AND", "OR", "NOT", "IN", "BETWEEN", "IS", "NULL", "LIKE", "GLOB", "ESCAPE",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "ASC", "DESC", "NULLS", "FIRST", "LAST",
+    "COLLATE", "NOCASE", "RTRIM", "BINARY", "CAST", "AS", "REAL", "INTEGER", "TEXT", "NUMERIC",
+    "ROUND", "ABS", "LOWER", "UPPER", "TRIM", "COALESCE", "IFNULL", "NULLIF", "OFFSET",
+    "TRUE", "FALSE",
+}
+CLAUSES = ("SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT")
+
+
+class Token:
+    __slots__ = ("kind", "text", "start", "end")
+
+    def __init__(self, kind: str, text: str, start: int, end: int):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+
+    @property
+    def name(self) -> str:
+        """Identifier value: unquoted, case-folded for comparison."""
+        if self.kind == "ident":
+            text = self.text[1:-1]
+            return (text.replace('""', '"') if self.text[0] == '"' else text).lower()
+        return self.text.lower()
+
+    @property
+    def upper(self) -> str:
+        return self.text.upper() if self.kind == "word" else ""
+
+
+def tokenize(sql: str) -> Optional[List[Token]]:
+    tokens, pos = [], 0
+    while pos < len(sql):
+        match = _TOKEN.match(sql, pos)
+        if match is None:
+            return None  # comments, parameters, anything unexpected
+        if match.lastgroup != "space":
+            tokens.append(Token(match.lastgroup, match.group(), match.start(), match.end()))
+        pos = match.end()
+    return tokens
+
+
+def _split(tokens: List[Token], separator: str = ",") -> List[List[Token]]:
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        if depth == 0 and token.text == separator:
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+
+class _Query:
+    """Top-level clauses of a SELECT; raises ValueError for shapes the rewriter does not handle."""
+
+    def __init__(self, sql: str, tokens: List[Token]):
+        self.sql = sql
+        self.clauses: Dict[str, List[Token]] = {}
+        depth, current, i = 0, None, 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token.text == "(":
+                depth += 1
+            elif token.text == ")":
+                depth -= 1
+            if depth == 0 and token.upper in CLAUSES:
+                current = token.upper
+                if current in self.clauses:
+                    raise ValueError("repeated clause")
+                self.clauses[current] = []
+                if current in ("GROUP", "ORDER"):
+                    i += 1
+                    if i >= len(tokens) or tokens[i].upper != "BY":
+                        raise ValueError(f"{current} without BY")
+            elif current is None:
+                raise ValueError("does not start with SELECT")
+            else:
+                self.clauses[current].append(token)
+            i += 1
+
+    def text(self, tokens: List[Token]) -> str:
+        return self.sql[tokens[0].start:tokens[-1].end] if tokens else ""
+
+
+class Rollup:
+    def __init__(self, name: str, dimensions: Sequence[str], rows: int):
+        self.name = name
+        self.dimensions = list(dimensions)
+        self.rows = rows
+
+
+class RollupSet:
+    """Pre-aggregated summaries of one table, kept in a separate SQLite file.
+
+    Each rollup stores, per combination of its dimension columns, the row count
+    and count/min/max of every measure (REAL) column. `rewrite` turns an
+    aggregate query over the raw table into one over the smallest covering
+    rollup, but only for shapes where the answer is identical: a single-table
+    SELECT whose WHERE/GROUP BY/ORDER BY/HAVING use only the rollup's dimension
+    columns and whose aggregates are COUNT/MIN/MAX of a measure or COUNT(*).
+    AVG/SUM/TOTAL over pre-summed partials add in a different order and can
+    differ in the last bits, enough to flip a ROUND or reorder an ORDER BY ...
+    LIMIT, so they and anything else return None and run on the raw table.
+    """
+
+    def __init__(self, path: str, table: str = "data",
+                 dimensions: Sequence[Sequence[str]] = DEFAULT_DIMENSIONS):
+        self.path = path
+        self.table = table
+        self.candidate_dimensions = [tuple(dims) for dims in dimensions]
+        self.rollups: List[Rollup] = []
+        self.dimension_names: Dict[str, str] = {}
+        self.measures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def load_or_build(self, source_path: str, fingerprint: str) -> bool:
+        """Use the rollup file if it was built from `fingerprint`, else rebuild it. False if none apply."""
+        with self._lock:
+            if not self._load(fingerprint):
+                self._build(source_path, fingerprint)
+            return bool(self.rollups)
+
+    def _load(self, fingerprint: str) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        conn = sqlite3.connect(read_only_uri(self.path), uri=True)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM rollup_meta"))
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
+        if meta.get("fingerprint") != fingerprint or meta.get("table") != self.table:
+            return False
+        self._set_layout(json.loads(meta["layout"]))
+        return True
+
+    def _set_layout(self, layout: dict):
+        self.measures = {name.lower(): i for i, name in enumerate(layout["measures"])}
+        self.rollups = [Rollup(r["name"], r["dimensions"], r["rows"]) for r in layout["rollups"]]
+        self.rollups.sort(key=lambda rollup: rollup.rows)
+        self.dimension_names = {dim.lower(): dim for r in self.rollups for dim in r.dimensions}
+
+    def _build(self, source_path: str, fingerprint: str):
+        # Identical uploads share a rollup file and may build it concurrently.
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (os.path.abspath(source_path),))
+            info = list(conn.execute(f"PRAGMA src.table_info({quote_identifier(self.table)})"))
+            columns = {row[1].lower(): row[1] for row in info}
+            measures = [row[1] for row in info if any(t in (row[2] or "").upper() for t in MEASURE_TYPES)]
+            layout = {"measures": measures, "rollups": []}
+            for n, dims in enumerate(self.candidate_dimensions):
+                if not all(dim.lower() in columns for dim in dims) or not measures:
+                    continue
+                dims = [columns[dim.lower()] for dim in dims]
+                if any(dim in measures for dim in dims):
+                    continue
+                name = f"rollup_{n}"
+                select = [quote_identifier(dim) for dim in dims] + ["COUNT(*) AS n_rows"]
+                for i, measure in enumerate(measures):
+                    m = quote_identifier(measure)
+                    select += [f"COUNT({m}) AS m{i}_cnt", f"MIN({m}) AS m{i}_min", f"MAX({m}) AS m{i}_max"]
+                group = ", ".join(quote_identifier(dim) for dim in dims)
+                conn.execute(f"CREATE TABLE {name} AS SELECT {', '.join(select)} "
+                             f"FROM src.{quote_identifier(self.table)} GROUP BY {group}")
+                conn.execute(f"CREATE INDEX {name}_dims ON {name} ({group})")
+                rows = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+                layout["rollups"].append({"name": name, "dimensions": dims, "rows": rows})
+            conn.execute("CREATE TABLE rollup_meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany("INSERT INTO rollup_meta VALUES (?, ?)", [
+                ("fingerprint", fingerprint), ("table", self.table), ("layout", json.dumps(layout))])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.path)
+        self._set_layout(layout)
+
+    def discard(self):
+        with self._lock:
+            self.rollups = []
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _aggregate(self, func: str, arg: Token) -> Optional[str]:
+        if arg.text == "*":
+            return "COALESCE(SUM(n_rows), 0)" if func == "COUNT" else None
+        if arg.kind not in ("word", "ident") or arg.name not in self.measures:
+            return None
+        m = f"m{self.measures[arg.name]}"
+        return {
+            "COUNT": f"COALESCE(SUM({m}_cnt), 0)",
+            "MIN": f"MIN({m}_min)",
+            "MAX": f"MAX({m}_max)",
+        }.get(func)
+
+    def _rewrite_tokens(self, tokens: List[Token], allowed: set, used: set) -> Optional[Tuple[str, bool]]:
+        """Rewrite aggregates in `tokens`; (text, has_aggregate), or None if anything else is referenced."""
+        parts, has_aggregate, i = [], False, 0
+        while i < len(tokens):
+            token = tokens[i]
+            window = tokens[i:i + 4]
+            if (token.upper in AGGREGATES and len(window) == 4
+                    and window[1].text == "(" and window[3].text == ")"):
+                replacement = self._aggregate(token.upper, window[2])
+                if replacement is None:
+                    return None
+                parts.append(replacement)
+                has_aggregate = True
+                i += 4
+                continue
+            if token.kind in ("word", "ident"):
+                if token.kind == "word" and token.upper in ALLOWED_WORDS:
+                    pass
+                elif token.name in allowed:
+                    used.add(token.name)
+                else:
+                    return None
+            elif token.text in (".", ";"):
+                return None
+            parts.append(token.text)
+            i += 1
+        return " ".join(parts), has_aggregate
+
+    def rewrite(self, sql: str) -> Optional[str]:
+        """`sql` against the smallest rollup that gives the same result, or None."""
+        if not self.rollups:
+            return None
+        sql = sql.strip().rstrip(";").strip()
+        tokens = tokenize(sql)
+        if not tokens:
+            return None
+        try:
+            query = _Query(sql, tokens)
+        except ValueError:
+            return None
+        clauses = query.clauses
+        source = clauses.get("FROM", [])
+        if len(source) != 1 or source[0].name != self.table.lower() or "SELECT" not in clauses:
+            return None
+
+        dimensions = set(self.dimension_names)
+        used: set = set()
+        grouped = set()
+        for item in _split(clauses.get("GROUP", [])) if "GROUP" in clauses else []:
+            if len(item) != 1 or item[0].kind not in ("word", "ident") or item[0].name not in dimensions:
+                return None
+            grouped.add(item[0].name)
+        used |= grouped
+
+        select, aliases, has_aggregate = [], set(), False
+        for item in _split(clauses["SELECT"]):
+            alias = None
+            if len(item) >= 3 and item[-2].upper == "AS" and item[-1].kind in ("word", "ident"):
+                alias, item = item[-1], item[:-2]
+            if not item:
+                return None
+            rewritten = self._rewrite_tokens(item, grouped, used)
+            if rewritten is None:
+                return None
+            text, aggregated = rewritten
+            has_aggregate |= aggregated
+            if alias is not None:
+                aliases.add(alias.name)
+                select.append(f"{text} AS {alias.text}")
+            elif aggregated:
+                # Unaliased expressions are named after their text; keep the name the raw query would have.
+                select.append(f"{text} AS {quote_identifier(query.text(item))}")
+            else:
+                select.append(query.text(item))
+        if not has_aggregate:
+            return None  # row-level queries need the raw table
+
+        sections = [f"SELECT {', '.join(select)}", None]  # FROM is filled in once the rollup is chosen
+        if "WHERE" in clauses:
+            if self._rewrite_tokens(clauses["WHERE"], dimensions, used) is None:
+                return None
+            if any(token.upper in AGGREGATES for token in clauses["WHERE"]):
+                return None
+            sections.append(f"WHERE {query.text(clauses['WHERE'])}")
+        if "GROUP" in clauses:
+            sections.append(f"GROUP BY {query.text(clauses['GROUP'])}")
+        for clause, keyword in (("HAVING", "HAVING"), ("ORDER", "ORDER BY")):
+            if clause in clauses:
+                rewritten = self._rewrite_tokens(clauses[clause], grouped | aliases, used)
+                if rewritten is None:
+                    return None
+                sections.append(f"{keyword} {rewritten[0]}")
+        if "LIMIT" in clauses:
+            if any(token.kind not in ("number", "op") and token.upper != "OFFSET" for token in clauses["LIMIT"]):
+                return None
+            sections.append(f"LIMIT {query.text(clauses['LIMIT'])}")
+
+        needed = {self.dimension_names[name] for name in used - aliases if name in self.dimension_names}
+        for rollup in self.rollups:
+            if needed <= set(rollup.dimensions):
+                sections[1] = f"FROM {ROLLUP_SCHEMA}.{rollup.name}"
+                return " ".join(sections)
+        return None
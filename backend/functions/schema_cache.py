@@ -0,0 +1,87 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Optional, Tuple, TypedDict
+
+from functions.sqlite_engine import quote_identifier
+
+# Sample rows shown to the model: SAMPLE_ROWS for a single-table upload, else
+# SAMPLE_ROWS_PER_TABLE from each table, labelled with the table name.
+SAMPLE_ROWS = 5
+SAMPLE_ROWS_PER_TABLE = 3
+
+_digest_memo: Dict[Tuple[str, int, int], str] = {}
+
+
+class SchemaInfo(TypedDict):
+    fingerprint: str
+    table_info: str
+    sample_data: str
+
+
+def fingerprint_file(path: str) -> str:
+    """Content hash of a database file, memoized on (path, size, mtime) so unchanged files are not re-read."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digest_memo.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def remember_fingerprint(path: str, digest: str):
+    """Record the content hash of `path` computed elsewhere (e.g. while it was uploaded)."""
+    stat = os.stat(path)
+    _digest_memo[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+def sample_rows(db) -> str:
+    tables = db.get_usable_table_names()
+    if len(tables) == 1:
+        return db.run(f"SELECT * FROM {quote_identifier(tables[0])} LIMIT {SAMPLE_ROWS};")
+    return "\n".join(
+        f"{table}: {db.run(f'SELECT * FROM {quote_identifier(table)} LIMIT {SAMPLE_ROWS_PER_TABLE};')}"
+        for table in tables
+    )
+
+
+class SchemaCache:
+    """Table info and sample rows for uploaded databases, computed once per file content."""
+
+    def __init__(self):
+        self._entries: Dict[str, SchemaInfo] = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, path: str, db) -> SchemaInfo:
+        fingerprint = fingerprint_file(path)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+        if entry is not None:
+            return entry
+
+        # get_table_info() reflects the schema and runs a sample query per table,
+        # so it is only ever called here.
+        entry = SchemaInfo(
+            fingerprint=fingerprint,
+            table_info=db.get_table_info(),
+            sample_data=sample_rows(db),
+        )
+        with self._lock:
+            self._entries[fingerprint] = entry
+        return entry
+
+    def get(self, fingerprint: str) -> Optional[SchemaInfo]:
+        with self._lock:
+            return self._entries.get(fingerprint)
+
+    def invalidate(self, fingerprint: Optional[str] = None):
+        with self._lock:
+            if fingerprint is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(fingerprint, None)
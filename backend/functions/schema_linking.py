@@ -0,0 +1,201 @@
+import math
+import re
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypedDict
+
+from functions.db_to_class import TableSchema, extract_schema
+from functions.sqlite_engine import quote_identifier, read_only_uri
+from functions.value_index import ValueIndex, categorical_values
+
+# Categorical columns this small have every value listed in the prompt.
+LIST_ALL_VALUES = 12
+SAMPLE_ROWS = 3
+EMBEDDING_WEIGHT = 4.0
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from how in is it of on or show me tell the to was "
+    "were what when where which who with give list all each per vs versus".split()
+)
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def tokens(text: str) -> List[str]:
+    text = _CAMEL.sub(" ", text).lower()
+    return [_stem(word) for word in _WORD.findall(text) if word not in _STOPWORDS]
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class LinkedSchema(TypedDict):
+    # Same keys as SchemaInfo, so the result drops into prompt_builder.build_prefix.
+    table_info: str
+    sample_data: str
+    tables: List[str]
+    columns: Dict[str, List[str]]
+
+
+class SchemaLinker:
+    """Picks the tables and columns relevant to a question from a large schema.
+
+    Table and column names are indexed by their words; values of categorical
+    text columns (State, Sector, Group, ...) are resolved with a ValueIndex. A
+    question scores a column by the words it shares with the column's name and
+    by the values it mentions; with an `embed` callable, cosine similarity to a
+    short description of each column is added. The best `top_tables` tables are
+    kept with their best columns, their key columns and any values mentioned.
+    """
+
+    def __init__(self, tables: List[TableSchema], value_index: ValueIndex,
+                 samples: Dict[str, List[tuple]], embed: Optional[Callable[[str], List[float]]] = None,
+                 top_tables: int = 3, top_columns: int = 10):
+        self.tables = {table.table_name: table for table in tables}
+        self.value_index = value_index
+        self.values = value_index.values
+        self.samples = samples
+        self.embed = embed
+        self.top_tables = top_tables
+        self.top_columns = top_columns
+        self._name_tokens = {
+            (table.table_name, column.name): set(tokens(column.name))
+            for table in tables for column in table.columns
+        }
+        self._table_tokens = {name: set(tokens(name)) for name in self.tables}
+        self._vectors: Optional[Dict[Tuple[str, str], List[float]]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, path: str, value_index: Optional[ValueIndex] = None, **kwargs) -> "SchemaLinker":
+        tables = extract_schema(path)
+        if value_index is None:
+            value_index = ValueIndex(categorical_values(
+                path, [(table.table_name, [(column.name, column.type) for column in table.columns])
+                       for table in tables]))
+        conn = sqlite3.connect(read_only_uri(path), uri=True)
+        try:
+            samples = {
+                table.table_name: conn.execute(
+                    f"SELECT * FROM {quote_identifier(table.table_name)} LIMIT {SAMPLE_ROWS}").fetchall()
+                for table in tables
+            }
+        finally:
+            conn.close()
+        return cls(tables, value_index, samples, **kwargs)
+
+    def _mentioned_values(self, question: str) -> Dict[Tuple[str, str], List[str]]:
+        mentioned: Dict[Tuple[str, str], List[str]] = {}
+        for match in self.value_index.resolve(question):
+            mentioned.setdefault((match["table"], match["column"]), []).append(match["value"])
+        return mentioned
+
+    def _column_vectors(self) -> Dict[Tuple[str, str], List[float]]:
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = {}
+                for table in self.tables.values():
+                    for column in table.columns:
+                        described = f"{table.table_name}.{column.name}"
+                        examples = self.values.get((table.table_name, column.name), [])[:5]
+                        if examples:
+                            described += f" (e.g. {', '.join(examples)})"
+                        self._vectors[(table.table_name, column.name)] = self.embed(described)
+            return self._vectors
+
+    def scores(self, question: str) -> Tuple[Dict[Tuple[str, str], float], Dict[Tuple[str, str], List[str]]]:
+        """Relevance of every column to `question`, and the column values it mentions."""
+        word_set = set(tokens(question))
+        mentioned = self._mentioned_values(question)
+        scores = {}
+        for key, name_tokens in self._name_tokens.items():
+            score = 2.0 * len(name_tokens & word_set)
+            score += 1.0 * len(self._table_tokens[key[0]] & word_set)
+            score += 3.0 * len(mentioned.get(key, ()))
+            scores[key] = score
+        if self.embed is not None:
+            question_vector = self.embed(question)
+            for key, vector in self._column_vectors().items():
+                scores[key] += EMBEDDING_WEIGHT * max(0.0, _cosine(question_vector, vector))
+        return scores, mentioned
+
+    def link(self, question: str) -> LinkedSchema:
+        scores, mentioned = self.scores(question)
+        per_table: Dict[str, List[float]] = {}
+        for (table, _), score in scores.items():
+            per_table.setdefault(table, []).append(score)
+        # The best column decides; the rest only break ties between tables.
+        table_scores = {table: max(values) + 0.1 * sum(values) for table, values in per_table.items()}
+        ranked = sorted(self.tables, key=lambda table: -table_scores.get(table, 0.0))
+        chosen = [table for table in ranked if table_scores.get(table, 0.0) > 0][:self.top_tables]
+        chosen = chosen or ranked[:self.top_tables]
+
+        # Keep tables a chosen one joins to through a foreign key, so the join can be written.
+        for table in list(chosen):
+            for column in self.tables[table].columns:
+                target = column.references.split(".", 1)[0] if column.references else None
+                if target in self.tables and target not in chosen and len(chosen) < self.top_tables + 2:
+                    chosen.append(target)
+
+        columns = {}
+        for table in chosen:
+            schema = self.tables[table]
+            if len(schema.columns) <= self.top_columns:
+                columns[table] = [column.name for column in schema.columns]
+                continue
+            keep = {column.name for column in schema.columns if column.primary_key or column.references}
+            best = sorted(schema.columns, key=lambda column: -scores[(table, column.name)])
+            keep.update(column.name for column in best[:self.top_columns] if scores[(table, column.name)] > 0)
+            if len(keep) < 2:
+                keep.update(column.name for column in schema.columns[:self.top_columns])
+            columns[table] = [column.name for column in schema.columns if column.name in keep]
+
+        return LinkedSchema(
+            table_info=self.render_tables(columns, mentioned),
+            sample_data=self.render_samples(columns),
+            tables=chosen,
+            columns=columns,
+        )
+
+    def full_schema(self) -> LinkedSchema:
+        """Every table and column, rendered the same way (for comparison and small schemas)."""
+        columns = {name: [column.name for column in table.columns] for name, table in self.tables.items()}
+        return LinkedSchema(table_info=self.render_tables(columns, {}), sample_data=self.render_samples(columns),
+                            tables=list(columns), columns=columns)
+
+    def render_tables(self, columns: Dict[str, List[str]], mentioned: Dict[Tuple[str, str], List[str]]) -> str:
+        blocks = []
+        for table, names in columns.items():
+            lines = []
+            for column in self.tables[table].columns:
+                if column.name not in names:
+                    continue
+                line = f"\t{quote_identifier(column.name)} {column.type}".rstrip()
+                if column.primary_key:
+                    line += " PRIMARY KEY"
+                if column.references:
+                    target_table, target_column = column.references.split(".", 1)
+                    line += f" REFERENCES {quote_identifier(target_table)}({quote_identifier(target_column)})"
+                values = self.values.get((table, column.name), [])
+                hints = mentioned.get((table, column.name)) or (values if len(values) <= LIST_ALL_VALUES else [])
+                if hints:
+                    line += " /* values: " + ", ".join(repr(value) for value in hints) + " */"
+                lines.append(line)
+            blocks.append(f"CREATE TABLE {quote_identifier(table)} (\n" + ",\n".join(lines) + "\n)")
+        return "\n\n".join(blocks)
+
+    def render_samples(self, columns: Dict[str, List[str]]) -> str:
+        blocks = []
+        for table, names in columns.items():
+            all_names = [column.name for column in self.tables[table].columns]
+            positions = [all_names.index(name) for name in names]
+            rows = ["\t".join(str(row[i]) for i in positions) for row in self.samples.get(table, [])]
+            blocks.append(f"{table}:\n" + "\t".join(names) + ("\n" + "\n".join(rows) if rows else ""))
+        return "\n\n".join(blocks)
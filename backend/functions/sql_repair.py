@@ -0,0 +1,217 @@
+import difflib
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, TypedDict
+
+from functions.sqlite_engine import quote_identifier
+
+# Upper bound on error-driven fixes per query; each one costs a single EXPLAIN.
+MAX_REPAIR_STEPS = 5
+COLUMN_MATCH_CUTOFF = 0.75
+
+_FENCE = re.compile(r"```(?:sql|sqlite)?\s*(.*?)(?:```|$)", re.IGNORECASE | re.DOTALL)
+# A statement starts a line: "WITH" must open a CTE, so prose such as "the query with
+# the yearly filter" or "With this filter:" is not taken for SQL.
+_STATEMENT_START = re.compile(r"^[ \t]*(?:SELECT\b|WITH\s+(?:RECURSIVE\s+)?[\w\"]+\s*(?:\([^)]*\)\s*)?AS\s*\()",
+                              re.IGNORECASE | re.MULTILINE)
+_INLINE_SELECT = re.compile(r"\bSELECT\b", re.IGNORECASE)
+# An unindented line opening with two bare words (neither a keyword) or with "Word:"
+# cannot continue a statement, e.g. "This query returns..." or "Explanation: ...".
+_PROSE_LINE = re.compile(r"^(?:([A-Za-z_]\w*)[ \t]+([A-Za-z_]\w*)\b(?![.(])|[A-Za-z_]\w*:)")
+_SQL_KEYWORDS = frozenset("""
+    ALL AND AS ASC BETWEEN BY CASE CAST COLLATE CROSS CURRENT DESC DISTINCT ELSE END ESCAPE EXCEPT EXISTS
+    FILTER FIRST FOLLOWING FROM FULL GLOB GROUP HAVING IN INNER INTERSECT IS JOIN LAST LEFT LIKE LIMIT
+    NATURAL NOT NULL NULLS OFFSET ON OR ORDER OUTER OVER PARTITION PRECEDING RANGE RECURSIVE RIGHT ROW ROWS
+    SELECT THEN UNBOUNDED UNION USING VALUES WHEN WHERE WINDOW WITH
+""".split())
+_NO_SUCH_COLUMN = re.compile(r"no such column: (?:\w+\.)?(.+)$")
+_NO_SUCH_TABLE = re.compile(r"no such table: (.+)$")
+_SYNTAX_NEAR = re.compile(r'near "(.+)": syntax error$')
+_PLAIN_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class RepairResult(TypedDict):
+    sql: str
+    fixes: List[str]
+    error: Optional[str]
+    # True when the SQL as generated would have failed but the repaired SQL compiles,
+    # i.e. a round trip to the LLM was saved.
+    avoided_retry: bool
+
+
+def strip_fences(sql: str) -> str:
+    match = _FENCE.search(sql)
+    return match.group(1) if match else sql
+
+
+def _is_prose(line: str) -> bool:
+    match = _PROSE_LINE.match(line)
+    if not match:
+        return False
+    return match.group(1) is None or not {word.upper() for word in match.groups()} & _SQL_KEYWORDS
+
+
+def first_statement(sql: str) -> str:
+    """Drop prose before the first line starting with SELECT/WITH, and cut the statement
+    at its first top-level `;`, blank line or line of prose."""
+    start = _STATEMENT_START.search(sql) or _INLINE_SELECT.search(sql)
+    if start:
+        sql = sql[start.start():].lstrip()
+    quote = None
+    for i, ch in enumerate(sql):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"`[":
+            quote = "]" if ch == "[" else ch
+        elif ch == ";":
+            return sql[:i + 1].strip()
+        elif ch == "\n":
+            line = sql[i + 1:].split("\n", 1)[0]
+            if not line.strip() or _is_prose(line):
+                return sql[:i].strip()
+    return sql.strip()
+
+
+def _replace_outside_strings(sql: str, pattern: re.Pattern, replacement: str) -> str:
+    """Apply `pattern` only to the parts of `sql` that are not string literals or quoted names."""
+    parts = re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""", sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = pattern.sub(replacement, parts[i])
+    return "".join(parts)
+
+
+class SqlRepairer:
+    """Validates generated SQL with SQLite's EXPLAIN and applies deterministic fixes.
+
+    Fixes are markdown fences, prose around the statement, unquoted or
+    single-quoted column names that need double quotes (e.g. Inflation (%)),
+    and misspelled column or table names that have one close match in the
+    schema. SQL that already compiles is returned untouched; anything else
+    is reported back so the LLM can retry as before.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._columns: Optional[Dict[str, List[str]]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self) -> Dict[str, List[str]]:
+        """Column names per table, read once from the database."""
+        with self._lock:
+            if self._columns is None:
+                with self.engine.connection() as conn:
+                    tables = [row[0] for row in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+                        "AND name NOT LIKE 'sqlite_%'")]
+                    self._columns = {
+                        table: [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+                        for table in tables
+                    }
+            return self._columns
+
+    def _all_columns(self) -> List[str]:
+        return sorted({column for columns in self.columns.values() for column in columns})
+
+    def check(self, sql: str) -> Optional[str]:
+        """SQLite's compile error for `sql`, or None if it would run."""
+        try:
+            with self.engine.connection() as conn:
+                conn.execute(f"EXPLAIN {sql}").close()
+            return None
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            return str(e)
+
+    def _special_columns(self) -> List[str]:
+        return [column for column in self._all_columns() if not _PLAIN_IDENTIFIER.match(column)]
+
+    def _requote_string_columns(self, sql: str, fixes: List[str]) -> str:
+        # AVG('Inflation (%)') compiles, but averages a string literal rather than the column;
+        # repair() only gets here once the statement as a whole has failed to compile.
+        for column in self._special_columns():
+            single = "'" + column.replace("'", "''") + "'"
+            if single in sql:
+                sql = sql.replace(single, quote_identifier(column))
+                fixes.append(f"quoted {column}")
+        return sql
+
+    def _quote_special_columns(self, sql: str, fixes: List[str]) -> str:
+        for column in self._special_columns():
+            quoted = quote_identifier(column)
+            bare = re.compile(r"(?<![\w\"`\[])" + re.escape(column) + r"(?![\w\"`\]])")
+            fixed = _replace_outside_strings(sql, bare, quoted.replace("\\", "\\\\"))
+            if fixed != sql:
+                sql = fixed
+                fixes.append(f"quoted {column}")
+        return sql
+
+    def _fix_error(self, sql: str, error: str, fixes: List[str]) -> Optional[str]:
+        match = _NO_SUCH_COLUMN.search(error)
+        if match:
+            wrong = match.group(1).strip('"`[]')
+            columns = self._all_columns()
+            lowered = {column.lower(): column for column in columns}
+            candidates = difflib.get_close_matches(wrong.lower(), list(lowered), n=2, cutoff=COLUMN_MATCH_CUTOFF)
+            if len(candidates) == 1 or (candidates and candidates[0] == wrong.lower()):
+                column = lowered[candidates[0]]
+                pattern = re.compile(r"""(?<![\w'])["`\[]?""" + re.escape(wrong) + r"""["`\]]?(?![\w'])""")
+                fixed = pattern.sub(quote_identifier(column).replace("\\", "\\\\"), sql)
+                if fixed != sql:
+                    fixes.append(f"column {wrong} -> {column}")
+                    return fixed
+            return None
+
+        match = _NO_SUCH_TABLE.search(error)
+        if match:
+            wrong = match.group(1).strip('"`[]')
+            tables = list(self.columns)
+            candidates = difflib.get_close_matches(wrong, tables, n=1, cutoff=0.5) or (tables if len(tables) == 1 else [])
+            if candidates:
+                pattern = re.compile(r"""(?<!\w)["`\[]?""" + re.escape(wrong) + r"""["`\]]?(?!\w)""")
+                fixed = pattern.sub(quote_identifier(candidates[0]), sql)
+                if fixed != sql:
+                    fixes.append(f"table {wrong} -> {candidates[0]}")
+                    return fixed
+            return None
+
+        match = _SYNTAX_NEAR.search(error)
+        if match:
+            # Columns named after keywords (Group, Index) must be quoted; GROUP BY must not be.
+            token = match.group(1)
+            for column in self._all_columns():
+                if column.lower() == token.lower():
+                    bare = re.compile(r"(?<![\w\"])" + re.escape(token) + r"(?![\w\"])(?!\s+BY\b)", re.IGNORECASE)
+                    fixed = _replace_outside_strings(sql, bare, quote_identifier(column))
+                    if fixed != sql:
+                        fixes.append(f"quoted {column}")
+                        return fixed
+        return None
+
+    def repair(self, sql: str) -> RepairResult:
+        original_error = self.check(sql)
+        if original_error is None:
+            return RepairResult(sql=sql, fixes=[], error=None, avoided_retry=False)
+
+        fixes: List[str] = []
+        statement = first_statement(strip_fences(sql))
+        if statement != sql.strip():
+            fixes.append("extracted statement")
+        repaired = self._requote_string_columns(statement, fixes)
+        repaired = self._quote_special_columns(repaired, fixes)
+
+        error = self.check(repaired)
+        for _ in range(MAX_REPAIR_STEPS):
+            if error is None:
+                break
+            fixed = self._fix_error(repaired, error, fixes)
+            if fixed is None:
+                break
+            repaired = fixed
+            error = self.check(repaired)
+
+        if error is not None:
+            # Report the error of the query the model actually wrote.
+            return RepairResult(sql=sql, fixes=[], error=original_error, avoided_retry=False)
+        return RepairResult(sql=repaired, fixes=fixes, error=None, avoided_retry=True)
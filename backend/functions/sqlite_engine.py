@@ -0,0 +1,288 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+# Applied to every connection after it is opened. query_only is a second line of
+# defence next to mode=ro: even a writable handle would refuse to modify the file.
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "query_only": 1,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative = KiB, i.e. 64 MiB of page cache per connection
+    "temp_store": "MEMORY",
+}
+
+
+# How many SQLite VM instructions run between progress-handler calls.
+PROGRESS_INTERVAL = 1000
+
+
+class QueryLimitExceeded(sqlite3.OperationalError):
+    """A query was stopped or rejected by one of the engine's limits.
+
+    `limit` names the limit ("timeout", "vm_steps" or "scan_rows"); the message is
+    written for the model, so it can be fed back as a retry hint.
+    """
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+class QueryCancelled(sqlite3.OperationalError):
+    """A query was stopped through its `cancel` event, e.g. because another candidate answered first."""
+
+
+class _Budget:
+    """Wall-clock and VM-step allowance for one query, checked from SQLite's progress handler."""
+
+    def __init__(self, timeout_seconds: Optional[float], max_vm_steps: Optional[int],
+                 cancel: Optional[threading.Event] = None):
+        self.timeout_seconds = timeout_seconds
+        self.max_vm_steps = max_vm_steps
+        self.cancel = cancel
+        self.steps = 0
+        self.exceeded: Optional[str] = None
+        self.restart()
+
+    def restart(self):
+        # Streaming re-arms the clock per batch, so a slow client does not count against the query.
+        self.deadline = time.monotonic() + self.timeout_seconds if self.timeout_seconds else None
+
+    def __call__(self) -> int:
+        self.steps += PROGRESS_INTERVAL
+        if self.cancel is not None and self.cancel.is_set():
+            self.exceeded = "cancelled"
+        elif self.max_vm_steps and self.steps > self.max_vm_steps:
+            self.exceeded = "vm_steps"
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            self.exceeded = "timeout"
+        return 1 if self.exceeded else 0  # non-zero interrupts the statement
+
+
+def pragmas_from_env(prefix: str = "SQLITE_") -> Dict[str, Any]:
+    """DEFAULT_PRAGMAS overridden by e.g. SQLITE_MMAP_SIZE=0 or SQLITE_TEMP_STORE=FILE."""
+    pragmas = dict(DEFAULT_PRAGMAS)
+    for name in DEFAULT_PRAGMAS:
+        value = os.getenv(prefix + name.upper())
+        if value is not None:
+            pragmas[name] = int(value) if value.lstrip("-").isdigit() else value
+    return pragmas
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def read_only_uri(path: str) -> str:
+    return f"file:{quote(os.path.abspath(path))}?mode=ro"
+
+
+class ReadOnlyEngine:
+    """Pool of read-only sqlite3 connections to one uploaded database.
+
+    Connections are opened lazily up to `pool_size` and handed out LIFO, so the
+    most recently used (and cache-warm) connection is reused first. Callers
+    block when every connection is busy.
+
+    execute() and iter_batches() enforce optional limits: a wall-clock
+    `timeout_seconds` and a `max_vm_steps` budget, both checked by a progress
+    handler, and `max_scan_rows`, which rejects up front any join whose
+    full-table scans (per EXPLAIN QUERY PLAN) multiply out past that many rows.
+    Violations raise QueryLimitExceeded.
+    """
+
+    def __init__(self, path: str, pragmas: Optional[Dict[str, Any]] = None, pool_size: int = 8,
+                 timeout_seconds: Optional[float] = None, max_vm_steps: Optional[int] = None,
+                 max_scan_rows: Optional[int] = None, attach: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.uri = read_only_uri(path)
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.pool_size = pool_size
+        self.timeout_seconds = timeout_seconds
+        self.max_vm_steps = max_vm_steps
+        self.max_scan_rows = max_scan_rows
+        # Extra read-only databases attached to every connection, by schema name.
+        self.attach = dict(attach or {})
+        self._table_rows: Optional[Dict[str, int]] = None
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        for name, path in self.attach.items():
+            conn.execute(f"ATTACH DATABASE ? AS {quote_identifier(name)}", (read_only_uri(path),))
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return self._idle.get()
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def table_rows(self) -> Dict[str, int]:
+        """Row count per table, counted once."""
+        if self._table_rows is None:
+            with self.connection() as conn:
+                tables = [row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+                self._table_rows = {
+                    table: conn.execute("SELECT COUNT(*) FROM " + quote_identifier(table)).fetchone()[0]
+                    for table in tables
+                }
+        return self._table_rows
+
+    def _screen_plan(self, conn: sqlite3.Connection, query: str, params: Tuple):
+        """Reject joins of several full-table scans whose combined row product exceeds max_scan_rows.
+
+        Only scans that are siblings in one join loop (same `parent` in EXPLAIN
+        QUERY PLAN) multiply; scans inside subqueries, compound branches and
+        materialized CTEs run once each and are checked as their own loop.
+        """
+        plan = [(row[1], row[3]) for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+        subqueries = {detail.split(" ", 1)[1] for _, detail in plan
+                      if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+        table_rows = self.table_rows()
+        largest = max(table_rows.values(), default=0)
+        loops: Dict[int, List[Tuple[str, int]]] = {}
+        for parent, detail in plan:
+            if not detail.startswith("SCAN ") or detail == "SCAN CONSTANT ROW":
+                continue
+            name = detail.split(" ")[1]
+            if name in subqueries:
+                continue
+            # Aliased tables show up under their alias; assume the worst.
+            loops.setdefault(parent, []).append((name, table_rows.get(name, largest)))
+        for scans in loops.values():
+            if len(scans) < 2:
+                continue
+            product = 1
+            for _, rows in scans:
+                product *= max(rows, 1)
+            if product > self.max_scan_rows:
+                names = ", ".join(name for name, _ in scans)
+                raise QueryLimitExceeded(
+                    "scan_rows",
+                    f"Query rejected: it joins full scans of {names} (~{product:,} row combinations, "
+                    f"limit {self.max_scan_rows:,}). Add join conditions or filters, or aggregate "
+                    "before joining instead of joining whole tables."
+                )
+
+    @contextmanager
+    def _limited(self, conn: sqlite3.Connection, query: str, params: Tuple,
+                 cancel: Optional[threading.Event] = None):
+        """Screen `query` and install the time/step budget on `conn` for the duration."""
+        if self.max_scan_rows:
+            self._screen_plan(conn, query, params)
+        if not (self.timeout_seconds or self.max_vm_steps or cancel):
+            yield None
+            return
+        budget = _Budget(self.timeout_seconds, self.max_vm_steps, cancel)
+        conn.set_progress_handler(budget, PROGRESS_INTERVAL)
+        try:
+            yield budget
+        except sqlite3.OperationalError as e:
+            if budget.exceeded == "cancelled":
+                raise QueryCancelled("Query cancelled") from e
+            if budget.exceeded == "timeout":
+                raise QueryLimitExceeded(
+                    "timeout",
+                    f"Query cancelled after {self.timeout_seconds:g}s. Simplify it: avoid self-joins "
+                    "and unbounded recursive CTEs, filter early and aggregate instead of listing rows."
+                ) from e
+            if budget.exceeded == "vm_steps":
+                raise QueryLimitExceeded(
+                    "vm_steps",
+                    f"Query cancelled after {self.max_vm_steps:,} SQLite VM steps. Simplify it: avoid "
+                    "self-joins and unbounded recursive CTEs, filter early and aggregate instead of listing rows."
+                ) from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def execute(self, query: str, params: Tuple = (), max_rows: Optional[int] = None,
+                cancel: Optional[threading.Event] = None) -> Tuple[List[str], List[tuple], bool]:
+        """Run one statement and return (column names, rows, truncated).
+
+        With `max_rows`, at most that many rows are fetched and `truncated` tells
+        whether the statement would have returned more. Setting `cancel` from
+        another thread stops the statement with QueryCancelled.
+        """
+        with self.connection() as conn, self._limited(conn, query, params, cancel):
+            cursor = conn.execute(query, params)
+            try:
+                columns = [col[0] for col in cursor.description or ()]
+                if max_rows is None:
+                    return columns, cursor.fetchall(), False
+                rows = cursor.fetchmany(max_rows + 1)
+                return columns, rows[:max_rows], len(rows) > max_rows
+            finally:
+                cursor.close()
+
+    def iter_batches(self, query: str, batch_size: int = 500,
+                     params: Tuple = ()) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """Yield (column names, rows) in batches of `batch_size` straight from the cursor.
+
+        The connection stays checked out until the generator is exhausted or closed.
+        """
+        with self.connection() as conn, self._limited(conn, query, params) as budget:
+            cursor = conn.execute(query, params)
+            try:
+                columns = [col[0] for col in cursor.description or ()]
+                while True:
+                    if budget is not None:
+                        budget.restart()
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield columns, rows
+            finally:
+                cursor.close()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
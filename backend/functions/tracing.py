@@ -0,0 +1,73 @@
+import hashlib
+import json
+import logging
+import random
+from typing import Callable, Optional
+
+# Long enough to tell queries apart in logs, short enough to grep for.
+HASH_LENGTH = 12
+MAX_ERROR_CHARS = 200
+
+
+def short_hash(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return None
+    return hashlib.sha1(text.encode()).hexdigest()[:HASH_LENGTH]
+
+
+def summarize_state(state: dict) -> dict:
+    """Compact, constant-size view of a QueryState: hashes and counts, never rows or history."""
+    summary = {
+        "question_hash": short_hash(state.get("question")),
+        "query_hash": short_hash(state.get("sql_query")),
+        "query_chars": len(state.get("sql_query") or ""),
+        "history_messages": len(state.get("history") or ()),
+        "retries": state.get("retries", 0),
+    }
+    if "complexity_stage" in state:
+        summary["complexity_stage"] = state["complexity_stage"]
+    result = state.get("result")
+    if result:
+        if "error" in result:
+            summary["error"] = str(result["error"])[:MAX_ERROR_CHARS]
+        else:
+            columns = result.get("columns") or ()
+            summary["row_count"] = len(result.get("data") or ())
+            summary["column_count"] = len(columns)
+            summary["truncated"] = bool(result.get("truncated"))
+    return summary
+
+
+class StateTracer:
+    """Structured logging for graph nodes that does no work when the level is off.
+
+    Each call emits one JSON line with a summary of the state (see
+    `summarize_state`). A `sample_rate` fraction of state records also carry the
+    full state, for debugging individual requests without paying for every one.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO,
+                 sample_rate: float = 0.0, rng: Callable[[], float] = random.random):
+        self.logger = logger or logging.getLogger("nl2sql.graph")
+        self.level = level
+        self.sample_rate = sample_rate
+        self.rng = rng
+
+    def enabled(self) -> bool:
+        return self.logger.isEnabledFor(self.level)
+
+    def state(self, node: str, event: str, state: dict, **fields):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        record = {"node": node, "event": event, **summarize_state(state), **fields}
+        if self.sample_rate > 0 and self.rng() < self.sample_rate:
+            record["state"] = state
+        self._emit(record)
+
+    def event(self, node: str, event: str, **fields):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        self._emit({"node": node, "event": event, **fields})
+
+    def _emit(self, record: dict):
+        self.logger.log(self.level, "%s", json.dumps(record, default=str))
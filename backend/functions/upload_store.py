@@ -0,0 +1,93 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+from typing import BinaryIO, TypedDict
+
+from functions.schema_cache import remember_fingerprint
+from functions.sqlite_engine import read_only_uri
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+CHUNK_BYTES = 1024 * 1024
+
+
+class InvalidDatabase(ValueError):
+    """An uploaded .db file that is not a readable SQLite database."""
+
+
+class StoredFile(TypedDict):
+    path: str
+    checksum: str
+    size_bytes: int
+    # True when a file with the same content was already stored and this upload was dropped.
+    existed: bool
+
+
+def validate_sqlite(path: str):
+    """Raise InvalidDatabase unless `path` has an SQLite header, passes PRAGMA quick_check and has a table."""
+    with open(path, "rb") as f:
+        if f.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+            raise InvalidDatabase("not an SQLite database")
+    try:
+        conn = sqlite3.connect(read_only_uri(path), uri=True)
+        try:
+            problems = [row[0] for row in conn.execute("PRAGMA quick_check")]
+            tables = conn.execute("SELECT COUNT(*) FROM sqlite_master "
+                                  "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        raise InvalidDatabase(f"unreadable SQLite database: {e}") from e
+    if problems != ["ok"]:
+        raise InvalidDatabase(f"corrupt SQLite database: {problems[0]}")
+    if not tables:
+        raise InvalidDatabase("the database has no tables")
+
+
+class UploadStore:
+    """Uploaded files on disk, stored once per content under their SHA-256.
+
+    `save` streams the upload to a temporary file in `folder` while hashing it,
+    so large databases are never held in memory or written twice. A file whose
+    content is already stored is dropped, and the stored copy is returned.
+    """
+
+    def __init__(self, folder: str, chunk_bytes: int = CHUNK_BYTES):
+        self.folder = folder
+        self.chunk_bytes = chunk_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def path_for(self, checksum: str, extension: str) -> str:
+        return os.path.join(self.folder, f"{checksum}.{extension}")
+
+    def save(self, stream: BinaryIO, extension: str) -> StoredFile:
+        """Store `stream`; .db files are validated before they are accepted."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".part")
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: stream.read(self.chunk_bytes), b""):
+                    if size == 0 and extension == "db" and not chunk.startswith(SQLITE_HEADER):
+                        raise InvalidDatabase("not an SQLite database")
+                    sha.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            checksum = sha.hexdigest()
+            path = self.path_for(checksum, extension)
+            existed = os.path.exists(path)
+            if existed:
+                os.remove(tmp_path)
+            else:
+                if extension == "db":
+                    validate_sqlite(tmp_path)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if extension == "db":
+            # The content hash is the database fingerprint; spare SchemaCache a second read.
+            remember_fingerprint(path, checksum)
+        return StoredFile(path=path, checksum=checksum, size_bytes=size, existed=existed)
@@ -0,0 +1,240 @@
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, TypedDict
+
+from functions.sqlite_engine import quote_identifier, read_only_uri
+
+# Text columns with at most this many distinct values are treated as categorical.
+MAX_CATEGORICAL_VALUES = 200
+# Trigram similarity a misspelled mention needs to match a value (or a word of one).
+MIN_SIMILARITY = 0.5
+MAX_PHRASE_WORDS = 4
+
+# Extra names for values users write differently; only used for values present in the column.
+SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    "All India": ("india", "national", "nationwide", "country wide", "countrywide"),
+    "Rural": ("village", "villages", "countryside"),
+    "Urban": ("city", "cities", "town", "towns"),
+    "Food and Beverages": ("food", "beverage", "beverages", "drinks"),
+    "Fuel and Light": ("fuel", "energy", "electricity"),
+    "Clothing and Footwear": ("apparel", "clothes"),
+    "Housing": ("house rent", "rent"),
+    "Pan, Tobacco and Intoxicants": ("tobacco", "paan"),
+    "Odisha": ("orissa",),
+    "Puducherry": ("pondicherry", "pondy"),
+    "Uttarakhand": ("uttaranchal",),
+    "Delhi": ("ncr", "new delhi"),
+    "Jammu and Kashmir": ("j&k", "kashmir"),
+    # Month abbreviations, as in original.py's few-shot "oct, nov, dec 2024".
+    "January": ("jan",), "February": ("feb",), "March": ("mar",), "April": ("apr",), "June": ("jun",),
+    "July": ("jul",), "August": ("aug",), "September": ("sep", "sept"), "October": ("oct",),
+    "November": ("nov",), "December": ("dec",),
+}
+# English stopwords and other everyday words. Initials that spell one are not
+# indexed ("Oils and Fats" -> "of") unless users really write them as an
+# abbreviation (below), and a value that is one ("May") only matches when
+# written as a name.
+_COMMON_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me might more most must my myself no nor not now
+of off on once only or other our ours ourselves out over own same shall she should so some such than that the
+their theirs them themselves then there these they this those through to too under until up very was we were
+what when where which while who whom why will with would you your yours yourself yourselves may also get got
+go new old one two use way day see say set per vs via ok oh
+""".split())
+# Abbreviations users do write that are also English words; like every two-letter
+# abbreviation, they only match in capitals ("UP") or as part of a comma-separated
+# list ("andhra, tn, up").
+_AMBIGUOUS_ABBREVIATIONS = frozenset({"up", "as", "in", "or", "me", "hp", "ok", "an", "am", "mp", "it", "on"})
+_YEAR = re.compile(r"\s*(?:19|20)\d\d\b")
+_SKIP_IN_INITIALS = frozenset({"and", "of", "the", "&"})
+_WORD = re.compile(r"[A-Za-z0-9&]+")
+
+
+def _normalize(word: str) -> str:
+    word = word.lower()
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _words(text: str) -> Tuple[str, ...]:
+    return tuple(_normalize(word) for word in _WORD.findall(text))
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class ValueMatch(TypedDict):
+    table: str
+    column: str
+    value: str
+    # The text of the question that was resolved to `value`
+    mention: str
+    # "exact", "abbreviation", "word", "synonym" or "fuzzy"
+    how: str
+    score: float
+
+
+def categorical_values(path: str, tables: Optional[Iterable[Tuple[str, Sequence[Tuple[str, str]]]]] = None
+                       ) -> Dict[Tuple[str, str], List[str]]:
+    """Distinct values of the low-cardinality text columns of every table in `path`.
+
+    `tables` is (table, [(column, declared type), ...]) per table; read from the
+    database when not given.
+    """
+    values = {}
+    conn = sqlite3.connect(read_only_uri(path), uri=True)
+    try:
+        if tables is None:
+            names = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            tables = [(name, [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({quote_identifier(name)})")])
+                      for name in names]
+        for table, columns in tables:
+            for column, type_ in columns:
+                if type_ and "CHAR" not in type_.upper() and "TEXT" not in type_.upper():
+                    continue
+                # LIMIT stops high-cardinality columns early instead of reading them out.
+                distinct = [row[0] for row in conn.execute(
+                    f"SELECT DISTINCT {quote_identifier(column)} FROM {quote_identifier(table)} "
+                    f"WHERE typeof({quote_identifier(column)}) = 'text' LIMIT {MAX_CATEGORICAL_VALUES + 1}")]
+                if distinct and len(distinct) <= MAX_CATEGORICAL_VALUES:
+                    values[(table, column)] = sorted(distinct)
+    finally:
+        conn.close()
+    return values
+
+
+class ValueIndex:
+    """Resolves how users name categorical values to the values stored in the database.
+
+    Built once per upload from the distinct values of low-cardinality text
+    columns. Each value is reachable by its full name, by its initials
+    ("tn" -> Tamil Nadu), by any word unique to it within its column ("andhra",
+    "beverages"), by the synonyms in SYNONYMS, and, for misspellings, by
+    trigram similarity ("karnatka" -> Karnataka). `resolve` returns the
+    canonical values a question mentions, longest match first.
+    """
+
+    def __init__(self, values: Dict[Tuple[str, str], List[str]],
+                 synonyms: Optional[Dict[str, Tuple[str, ...]]] = None, min_similarity: float = MIN_SIMILARITY):
+        self.values = values
+        self.min_similarity = min_similarity
+        synonyms = SYNONYMS if synonyms is None else synonyms
+        # phrase (normalized words) -> [(table, column, value, how)]
+        self._aliases: Dict[Tuple[str, ...], List[Tuple[str, str, str, str]]] = {}
+        self._fuzzy: List[Tuple[Set[str], str, str, str]] = []
+        for (table, column), column_values in values.items():
+            word_counts: Dict[str, int] = {}
+            for value in column_values:
+                for word in set(_words(value)):
+                    word_counts[word] = word_counts.get(word, 0) + 1
+            for value in column_values:
+                words = _words(value)
+                if not words:
+                    continue
+                self._add(words, table, column, value, "exact")
+                self._fuzzy.append((_trigrams(" ".join(words)), table, column, value))
+                significant = [word for word in words if word not in _SKIP_IN_INITIALS]
+                initials = "".join(word[0] for word in significant)
+                if len(significant) >= 2 and (initials not in _COMMON_WORDS or initials in _AMBIGUOUS_ABBREVIATIONS):
+                    self._add((initials,), table, column, value, "abbreviation")
+                if len(words) >= 2:
+                    for word in significant:
+                        if len(word) >= 4 and word_counts[word] == 1:
+                            self._add((word,), table, column, value, "word")
+                            self._fuzzy.append((_trigrams(word), table, column, value))
+                for synonym in synonyms.get(value, ()):
+                    self._add(_words(synonym), table, column, value, "synonym")
+        self._longest = min(MAX_PHRASE_WORDS, max((len(phrase) for phrase in self._aliases), default=0))
+
+    @classmethod
+    def from_database(cls, path: str, **kwargs) -> "ValueIndex":
+        return cls(categorical_values(path), **kwargs)
+
+    def _add(self, phrase: Tuple[str, ...], table: str, column: str, value: str, how: str):
+        targets = self._aliases.setdefault(phrase, [])
+        if all((t, c, v) != (table, column, value) for t, c, v, _ in targets):
+            targets.append((table, column, value, how))
+
+    def __len__(self):
+        return sum(len(column_values) for column_values in self.values.values())
+
+    def resolve(self, question: str) -> List[ValueMatch]:
+        spans = [(match.group(0), match.start(), match.end()) for match in _WORD.finditer(question)]
+        words = [_normalize(text) for text, _, _ in spans]
+        matches: List[ValueMatch] = []
+        seen = set()
+
+        def add(table, column, value, start, end, how, score):
+            if (table, column, value) not in seen:
+                seen.add((table, column, value))
+                mention = question[spans[start][1]:spans[end - 1][2]]
+                matches.append(ValueMatch(table=table, column=column, value=value, mention=mention,
+                                          how=how, score=round(score, 3)))
+
+        i = 0
+        while i < len(words):
+            for length in range(min(self._longest, len(words) - i), 0, -1):
+                targets = self._aliases.get(tuple(words[i:i + length]))
+                if targets and self._accept(question, spans, i, length, targets):
+                    for table, column, value, how in targets:
+                        add(table, column, value, i, i + length, how, 1.0)
+                    i += length
+                    break
+            else:
+                if len(words[i]) >= 5 and not words[i].isdigit():
+                    self._fuzzy_match(words, i, add)
+                i += 1
+        return matches
+
+    def _accept(self, question, spans, i, length, targets) -> bool:
+        """Whether a single-word mention that could also be an ordinary word is meant as a value.
+
+        Two-letter and ambiguous abbreviations need capitals, common-word values
+        ("may") a capital or a year after them; a comma-separated list counts for both.
+        """
+        if length > 1:
+            return True
+        text, start, end = spans[i]
+        word = text.lower()
+        abbreviation = any(how == "abbreviation" for _, _, _, how in targets) and (
+            len(word) <= 2 or word in _AMBIGUOUS_ABBREVIATIONS)
+        common = any(how == "exact" for _, _, _, how in targets) and _normalize(word) in _COMMON_WORDS
+        if not (abbreviation or common):
+            return True
+        if abbreviation and text.isupper():
+            return True
+        if common and not abbreviation and (text[0].isupper() or _YEAR.match(question, end)):
+            return True
+        before, after = question[:start].rstrip(), question[end:].lstrip()
+        return before.endswith(",") or after.startswith(",")
+
+    def _fuzzy_match(self, words, i, add):
+        best_score, best = 0.0, []
+        for length in (2, 1):
+            if i + length > len(words):
+                continue
+            grams = _trigrams(" ".join(words[i:i + length]))
+            for value_grams, table, column, value in self._fuzzy:
+                score = _similarity(grams, value_grams)
+                if score > best_score + 1e-9:
+                    best_score, best = score, [(table, column, value, length)]
+                elif best and abs(score - best_score) <= 1e-9:
+                    best.append((table, column, value, length))
+        if best_score >= self.min_similarity:
+            for table, column, value, length in best:
+                add(table, column, value, i, i + length, "fuzzy", best_score)
+
+    @staticmethod
+    def describe(matches: List[ValueMatch]) -> str:
+        """Prompt text naming the exact stored values the question refers to."""
+        lines = [f'- "{match["mention"]}" means {quote_identifier(match["column"])} = '
+                 f"'{match['value'].replace(chr(39), chr(39) * 2)}'" for match in matches]
+        return "Values mentioned in the question, as stored in the database:\n" + "\n".join(lines)
@@ -2,7 +2,6 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 from werkzeug.utils import secure_filename
-from langchain_openai import ChatOpenAI
 from langchain.chains import create_sql_query_chain
 from langchain_community.utilities import SQLDatabase
 from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
@@ -11,7 +10,7 @@ from langchain_core.runnables import RunnablePassthrough
 import ast
 from typing import TypedDict, List, Optional, Dict
 from sqlalchemy import text
-from langchain_google_genai import ChatGoogleGenerativeAI
+from functions.llm_provider import chat_model, llm_settings_from_env
 from dotenv import load_dotenv
 import os
 import logging
@@ -26,8 +25,8 @@ HISTORY_WINDOW_SIZE = 10
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# llm = ChatGoogleGenerativeAI(model="models/gemini-2.0-flash", google_api_key=os.getenv("GOOGLE_API_KEY"), temperature=0)
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2)
+# LLM_PROVIDER=google for Gemini (GOOGLE_LLM_MODEL), stub to run offline.
+llm = chat_model(llm_settings_from_env(), "sql", "gpt-4o-mini", temperature=0.2)
 
 db = None
 sample_data = None
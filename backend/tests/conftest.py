@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import make_cpi_db  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def cpi_db(tmp_path_factory):
+    """Synthetic CPI database (one `data` table, ~31k rows) shared by the tests."""
+    path = str(tmp_path_factory.mktemp("db") / "cpi.db")
+    make_cpi_db(path)
+    return path
+
+
+@pytest.fixture
+def stub_app(tmp_path, monkeypatch):
+    """Load app.py or agentic-app.py against the offline stub model, with uploads under tmp_path."""
+    from benchmarks.common import load_app
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_PROVIDER", "stub")
+    monkeypatch.setenv("LLM_STUB_LATENCY_MS", "0")
+    monkeypatch.setenv("LLM_STUB_JITTER_MS", "0")
+    # Background rollup and index builds would outlive the test's working directory.
+    monkeypatch.setenv("ROLLUPS", "0")
+    monkeypatch.setenv("INDEX_ADVISOR", "0")
+
+    def load(filename="app.py", **env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return load_app(filename)
+    return load
@@ -0,0 +1,86 @@
+import json
+import os
+
+from benchmarks.common import make_cpi_db, upload_db
+from functions.example_store import SEED_EXAMPLES
+
+QUESTION, SQL = SEED_EXAMPLES[0]
+
+
+def stream(client, database_id, question):
+    response = client.post("/api/ask/stream", json={"database_id": database_id, "question": question,
+                                                     "history": []})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_stream_fills_and_reads_the_result_cache(stub_app, cpi_db):
+    module = stub_app("app.py")
+    database_id = upload_db(module, cpi_db)["database_id"]
+    client = module.app.test_client()
+
+    first = stream(client, database_id, QUESTION)
+    assert first[0]["type"] == "meta" and not first[0]["cached"]
+    assert first[-1]["type"] == "end"
+    assert module.result_cache.stats()["size"] == 1
+
+    second = stream(client, database_id, QUESTION)
+    assert second[0]["cached"] and second[0]["sql_query"] == first[0]["sql_query"]
+    assert second[1:] == first[1:]
+
+    body = client.post("/api/ask", json={"database_id": database_id, "question": QUESTION,
+                                         "history": []}).get_json()
+    assert body["cached"]
+
+
+def test_stream_records_retries_and_learns_examples(stub_app, cpi_db):
+    module = stub_app("app.py")
+    database_id = upload_db(module, cpi_db)["database_id"]
+    stream(module.app.test_client(), database_id, "how many distinct states are there")
+    rendered = module.metrics.render()
+    assert "nl2sql_retries_count 1" in rendered
+    assert "nl2sql_examples_learned_total 1" in rendered
+
+
+def evicted_entry(module, cpi_db, tmp_path):
+    database = module.databases.get(upload_db(module, cpi_db)["database_id"])
+    other = str(tmp_path / "other.db")
+    make_cpi_db(other, years=range(2020, 2025))
+    upload_db(module, other)
+    assert not module.databases.is_registered(database)
+    return database
+
+
+def test_rollups_finished_after_eviction_are_discarded(stub_app, cpi_db, tmp_path):
+    module = stub_app("app.py", MAX_DATABASES=1)
+    database = evicted_entry(module, cpi_db, tmp_path)
+    engine = database.engine
+
+    module.build_rollups(database)
+
+    assert database.rollups is None and database.engine is engine
+    assert os.listdir(tmp_path / "uploads" / "rollups") == []
+
+
+def test_indexes_finished_after_eviction_are_discarded(stub_app, cpi_db, tmp_path):
+    module = stub_app("app.py", MAX_DATABASES=1, INDEX_ADVISOR=1, INDEX_ADVISOR_MIN_QUERIES=1)
+    database = evicted_entry(module, cpi_db, tmp_path)
+    engine = database.engine
+
+    module.advise_indexes(database, "SELECT * FROM data WHERE State = 'Kerala' AND Year = 2024")
+
+    assert database.advisor.built and database.engine is engine
+    assert not os.path.exists(database.advisor.current_path)
+
+
+def test_complexify_skip_is_streamed_by_its_own_node(stub_app, cpi_db):
+    module = stub_app("agentic-app.py")
+    database = module.databases.get(upload_db(module, cpi_db)["database_id"])
+    graph = module.create_graph(complexify="auto", explain=False)
+
+    events = list(module.graph_events(graph, module.new_query_state(database, QUESTION, [])))
+
+    skipped = [data for event, data in events
+               if event == "node" and any(line.startswith("[Complexify Skipped]") for line in data["reasoning"])]
+    assert [data["node"] for data in skipped] == ["decide_complexify"]
+    assert events[-1][1]["needs_complexify"] is False
@@ -0,0 +1,51 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.common import upload_db
+from functions.candidates import race, race_async
+
+
+def test_race_when_every_candidate_fails():
+    def run(index, cancel):
+        raise RuntimeError(f"candidate {index} failed")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        winner, vote, done = race(run, 3, executor, lambda candidate: candidate.get("result"))
+    assert len(done) == 3 and vote["reason"] == "first"
+    assert winner == {"sql_query": "", "history": [], "result": {"error": "candidate 0 failed"}}
+
+
+def test_race_async_when_every_candidate_fails():
+    async def run(index, cancel):
+        raise RuntimeError(f"candidate {index} failed")
+
+    winner, vote, done = asyncio.run(race_async(run, 3, lambda candidate: candidate.get("result")))
+    assert len(done) == 3
+    assert winner["sql_query"] == "" and winner["history"] == [] and "error" in winner["result"]
+
+
+class FailingLLM:
+    def invoke(self, messages, **kwargs):
+        raise RuntimeError("model unavailable")
+
+    async def ainvoke(self, messages, **kwargs):
+        raise RuntimeError("model unavailable")
+
+
+@pytest.mark.parametrize("filename", ["app.py", "agentic-app.py"])
+def test_graph_answers_when_every_candidate_fails(stub_app, cpi_db, filename):
+    module = stub_app(filename, CANDIDATES=3, EXPLANATION="off")
+    module.llm = module.candidate_llm = FailingLLM()
+    database = module.databases.get(upload_db(module, cpi_db)["database_id"])
+    history = [{"role": "user", "content": "inflation in 2024"}, {"role": "assistant", "content": "SELECT 1"}]
+    for async_mode in (False, True):
+        graph = module.get_graph(async_mode=async_mode)
+        state = module.new_query_state(database, "inflation by year", history)
+        result_state = asyncio.run(graph.ainvoke(state)) if async_mode else graph.invoke(state)
+        assert result_state["result"] == {"error": "model unavailable"}
+        assert result_state["sql_query"] == ""
+        assert result_state["retries"] == module.MAX_RETRIES
+        # The conversation survives the failed attempts.
+        assert result_state["history"][:2] == history
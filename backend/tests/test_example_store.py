@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+from functions.example_store import CPI_SIGNATURE, SEED_EXAMPLES, ExampleStore
+
+QUESTION = "average inflation in Kerala for 2023"
+SQL = "SELECT AVG(`Inflation (%)`) FROM data WHERE `State` = 'Kerala' AND `Year` = 2023;"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ExampleStore(str(tmp_path / "examples.db"))
+    store.seed()
+    yield store
+    store.close()
+
+
+def questions(examples):
+    return [example["question"] for example in examples]
+
+
+def test_learned_examples_stay_with_their_database(store):
+    assert store.learn(CPI_SIGNATURE, "tenant-a", QUESTION, SQL)
+
+    assert QUESTION in questions(store.similar(CPI_SIGNATURE, QUESTION, owner="tenant-a"))
+    assert QUESTION not in questions(store.similar(CPI_SIGNATURE, QUESTION, owner="tenant-b"))
+    assert QUESTION not in questions(store.similar(CPI_SIGNATURE, QUESTION))
+
+
+def test_seeds_are_shared_by_every_database_with_the_schema(store):
+    question = SEED_EXAMPLES[1][0]
+    for owner in ("tenant-a", "tenant-b", None):
+        assert questions(store.similar(CPI_SIGNATURE, question, k=1, owner=owner)) == [question]
+
+
+def test_seed_questions_are_not_learned_again(store):
+    question, sql = SEED_EXAMPLES[0]
+    assert not store.learn(CPI_SIGNATURE, "tenant-a", question, sql)
+    assert store.count(CPI_SIGNATURE) == len(SEED_EXAMPLES)
+
+
+def test_each_database_keeps_its_own_learned_limit(tmp_path):
+    store = ExampleStore(str(tmp_path / "examples.db"), max_learned=1)
+    store.seed()
+    store.learn(CPI_SIGNATURE, "tenant-a", QUESTION, SQL)
+    store.learn(CPI_SIGNATURE, "tenant-b", "inflation in Goa for 2023", SQL)
+    store.learn(CPI_SIGNATURE, "tenant-a", "inflation in Kerala for 2022", SQL)
+    assert store.count(CPI_SIGNATURE) == len(SEED_EXAMPLES) + 2
+    assert "inflation in Goa for 2023" in questions(store.similar(CPI_SIGNATURE, "Goa 2023", owner="tenant-b"))
+    store.close()
+
+
+def test_pooled_learned_examples_are_dropped_from_old_files(tmp_path):
+    path = str(tmp_path / "examples.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE examples (id INTEGER PRIMARY KEY, schema TEXT NOT NULL, question TEXT NOT NULL, "
+                 "normalized TEXT NOT NULL, sql TEXT NOT NULL, source TEXT NOT NULL, "
+                 "uses INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, UNIQUE (schema, normalized))")
+    conn.execute("INSERT INTO examples (schema, question, normalized, sql, source, created) "
+                 "VALUES (?, ?, 'x', ?, 'learned', 0)", (CPI_SIGNATURE, QUESTION, SQL))
+    conn.commit()
+    conn.close()
+
+    store = ExampleStore(path)
+    assert store.count() == 0
+    assert store.seed() == len(SEED_EXAMPLES)
+    store.close()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from functions.history import RETRY_ERROR_PREFIX, SUMMARY_PREFIX, HistoryManager
+
+QUESTION = "inflation in kerala by year"
+
+
+def error(text):
+    return {"role": "system", "content": f"{RETRY_ERROR_PREFIX} {text}"}
+
+
+def test_retry_errors_of_the_current_question_are_kept():
+    history = [
+        {"role": "user", "content": "inflation in 2024"},
+        {"role": "assistant", "content": "SELECT Yr FROM data"},
+        error("no such column: Yr"),
+        {"role": "user", "content": QUESTION},
+        {"role": "assistant", "content": "SELECT bad"},
+        error("first failure"),
+        {"role": "user", "content": QUESTION},
+        {"role": "assistant", "content": "SELECT worse"},
+        error("second failure"),
+    ]
+    prepared, _ = HistoryManager(keep_recent=20).prepare(history, QUESTION)
+    contents = [message["content"] for message in prepared]
+    assert error("no such column: Yr")["content"] not in contents
+    assert error("first failure")["content"] in contents
+    assert error("second failure")["content"] in contents
+
+
+def test_retry_errors_of_an_earlier_question_are_dropped_on_a_new_one():
+    history = [
+        {"role": "user", "content": "inflation in 2024"},
+        {"role": "assistant", "content": "SELECT Yr FROM data"},
+        error("no such column: Yr"),
+    ]
+    prepared, _ = HistoryManager().prepare(history, QUESTION)
+    assert prepared == history[:2]
+
+
+def long_history(turns):
+    history = []
+    for i in range(turns):
+        history += [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"SELECT {i}"}]
+    return history
+
+
+def test_aprepare_does_not_block_the_event_loop():
+    def summarize(previous, messages):
+        time.sleep(0.2)
+        return "blocking summary"
+
+    async def asummarize(previous, messages):
+        await asyncio.sleep(0.2)
+        return "awaited summary"
+
+    async def run(manager):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        prepared, report = await manager.aprepare(long_history(10), "next question")
+        task.cancel()
+        return prepared, report, ticks
+
+    for manager, summary in ((HistoryManager(keep_recent=4, asummarize=asummarize), "awaited summary"),
+                             (HistoryManager(keep_recent=4, summarize=summarize), "blocking summary")):
+        prepared, report, ticks = asyncio.run(run(manager))
+        assert prepared[0]["content"] == f"{SUMMARY_PREFIX} {summary}"
+        assert report["summarized_messages"] == 16
+        assert ticks >= 10
+
+
+def test_prepare_and_aprepare_share_summaries():
+    calls = []
+
+    def summarize(previous, messages):
+        calls.append(len(messages))
+        return "summary"
+
+    manager = HistoryManager(keep_recent=4, summarize=summarize)
+    history = long_history(10)
+    assert manager.prepare(history) == asyncio.run(manager.aprepare(history))
+    assert calls == [16]
@@ -0,0 +1,40 @@
+from functions.example_store import SEED_EXAMPLES
+from functions.llm_provider import STUB_SQL_FALLBACK, RecordedChatModel, load_recordings
+
+(SEED_QUESTION, SEED_SQL), (OTHER_QUESTION, OTHER_SQL) = SEED_EXAMPLES[:2]
+
+
+def stub():
+    return RecordedChatModel(recordings=load_recordings(None, "sql"), latency_ms=0, jitter_ms=0)
+
+
+def example_hint(question, sql):
+    return {"role": "system", "content": f"Examples of questions and their SQL:\nQuestion: {question}\nSQL: {sql}"}
+
+
+def test_replays_the_recording_for_the_last_user_message():
+    messages = [{"role": "system", "content": "schema"}, example_hint(OTHER_QUESTION, OTHER_SQL),
+                {"role": "user", "content": SEED_QUESTION}]
+    assert stub().invoke(messages).content == SEED_SQL
+
+
+def test_questions_quoted_in_system_messages_are_not_matched():
+    messages = [{"role": "system", "content": "schema"}, example_hint(SEED_QUESTION, SEED_SQL),
+                {"role": "user", "content": "how many states report urban prices"}]
+    assert stub().invoke(messages).content == STUB_SQL_FALLBACK
+
+
+def test_earlier_user_turns_are_not_matched():
+    messages = [{"role": "user", "content": SEED_QUESTION}, {"role": "assistant", "content": SEED_SQL},
+                {"role": "user", "content": "only for kerala"}]
+    assert stub().invoke(messages).content == STUB_SQL_FALLBACK
+
+
+def test_complexify_prompt_matches_the_original_question():
+    messages = [
+        {"role": "system", "content": "You are an expert SQL agent."},
+        {"role": "system", "content": f"Original question: {SEED_QUESTION}\n"
+                                      f"Previous simple SQL query: SELECT 1\nResult: {OTHER_QUESTION}"},
+        {"role": "user", "content": "Please provide a more complex version of the above SQL query."},
+    ]
+    assert stub().invoke(messages).content == SEED_SQL
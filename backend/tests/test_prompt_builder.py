@@ -0,0 +1,80 @@
+import json
+import sqlite3
+
+import pytest
+from langchain_community.utilities import SQLDatabase
+
+from benchmarks.common import StubMessage, make_cpi_db, upload_db
+from functions import prompt_builder
+from functions.prompt_builder import assemble, build_prefix, prefix_hash
+from functions.schema_cache import SchemaCache
+
+
+def cached_prefix(path):
+    # A fresh SchemaCache each time: the bytes must not depend on what was cached before.
+    return build_prefix(SchemaCache().get_or_build(path, SQLDatabase.from_uri(f"sqlite:///{path}")))
+
+
+def as_bytes(messages):
+    return json.dumps(messages, sort_keys=True).encode()
+
+
+def test_prefix_is_byte_identical_across_loads_questions_and_histories(cpi_db):
+    prefix = cached_prefix(cpi_db)
+    assert as_bytes(cached_prefix(cpi_db)) == as_bytes(prefix)
+    history = [{"role": "user", "content": "inflation in 2024"}, {"role": "assistant", "content": "SELECT 1"},
+               {"role": "system", "content": "Previous SQL error: no such column: Yr"}]
+    hint = {"role": "system", "content": "Values mentioned in the question, as stored in the database:\n- ..."}
+    for question, turns, hints in (("inflation in 2024", [], []), ("and for 2023?", history[:2], [hint]),
+                                   ("inflation in 2024", history, [None, hint])):
+        messages = assemble(prefix, turns, hints, question)
+        assert as_bytes(messages[:len(prefix)]) == as_bytes(prefix)
+
+
+def test_prefix_hash_changes_with_the_prompt_version(cpi_db, monkeypatch):
+    prefix = cached_prefix(cpi_db)
+    before = prefix_hash(prefix)
+    monkeypatch.setattr(prompt_builder, "PROMPT_VERSION", prompt_builder.PROMPT_VERSION + 1)
+    assert prefix_hash(prefix) != before
+
+
+def test_prefix_changes_with_the_schema(cpi_db, tmp_path):
+    other = str(tmp_path / "other.db")
+    make_cpi_db(other)
+    conn = sqlite3.connect(other)
+    conn.execute('ALTER TABLE data ADD COLUMN "Weight" REAL')
+    conn.commit()
+    conn.close()
+    assert cached_prefix(other) != cached_prefix(cpi_db)
+    assert prefix_hash(cached_prefix(other)) != prefix_hash(cached_prefix(cpi_db))
+
+
+class RecordingLLM:
+    """Answers with `replies` in turn and keeps every prompt it was sent."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def invoke(self, messages, **kwargs):
+        self.prompts.append(messages)
+        return StubMessage(self.replies.pop(0))
+
+
+@pytest.mark.parametrize("filename", ["app.py", "agentic-app.py"])
+def test_apps_send_the_cached_prefix_on_every_call(stub_app, cpi_db, filename):
+    module = stub_app(filename, COMPLEXIFY="never", EXPLANATION="off")
+    database_id = upload_db(module, cpi_db)["database_id"]
+    valid = 'SELECT Year, AVG("Inflation (%)") FROM data GROUP BY Year'
+    # The first answer comes back empty, so the first question is retried once.
+    module.llm = RecordingLLM(["SELECT * FROM data WHERE Year = 1900", valid, valid])
+    client = module.app.test_client()
+    body = client.post("/api/ask", json={"database_id": database_id, "question": "inflation by year",
+                                         "history": []}).get_json()
+    client.post("/api/ask", json={"database_id": database_id, "question": "and only for kerala",
+                                  "history": body["history"]})
+
+    prefix = cached_prefix(cpi_db)
+    assert len(module.llm.prompts) == 3
+    for prompt in module.llm.prompts:
+        assert as_bytes(prompt[:len(prefix)]) == as_bytes(prefix)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from benchmarks.common import make_cpi_db, upload_db
+from functions.example_store import SEED_EXAMPLES
+from functions.llm_provider import hashed_embedding
+from functions.result_cache import ResultCache
+
+ANSWER = {"sql_query": "SELECT 1", "result": {"columns": ["1"], "data": [{"1": 1}]}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_miss_and_question_normalization():
+    cache = ResultCache()
+    assert cache.get("db", "Inflation by year?", []) is None
+    cache.put("db", "Inflation by year?", [], ANSWER)
+    assert cache.get("db", "  inflation   BY year ", []) == ANSWER
+    assert cache.get("other-db", "inflation by year", []) is None
+    assert cache.get("db", "inflation by year", [{"role": "user", "content": "earlier"}]) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = ResultCache(ttl_seconds=10, clock=clock)
+    cache.put("db", "q", [], ANSWER)
+    clock.now = 9.9
+    assert cache.get("db", "q", []) == ANSWER
+    clock.now = 10.0
+    assert cache.get("db", "q", []) is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.put("db", "a", [], ANSWER)
+    cache.put("db", "b", [], ANSWER)
+    cache.get("db", "a", [])
+    cache.put("db", "c", [], ANSWER)
+    assert cache.get("db", "b", []) is None
+    assert cache.get("db", "a", []) == ANSWER and cache.get("db", "c", []) == ANSWER
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_one_database_or_all():
+    cache = ResultCache()
+    cache.put("db1", "q", [], ANSWER)
+    cache.put("db2", "q", [], ANSWER)
+    cache.invalidate("db1")
+    assert cache.get("db1", "q", []) is None and cache.get("db2", "q", []) == ANSWER
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
+
+
+def test_semantic_match_with_an_offline_embedding():
+    cache = ResultCache(embed=hashed_embedding, similarity_threshold=0.8)
+    cache.put("db", "average inflation by year for kerala", [], ANSWER)
+    assert cache.get("db", "average inflation for kerala by year", []) == ANSWER
+    assert cache.get("db", "top states by food prices", []) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def ask(client, database_id, question):
+    return client.post("/api/ask", json={"database_id": database_id, "question": question,
+                                         "history": []}).get_json()
+
+
+def test_app_serves_repeats_and_forgets_released_databases(stub_app, cpi_db, tmp_path):
+    module = stub_app("app.py", MAX_DATABASES=1)
+    client = module.app.test_client()
+    question = SEED_EXAMPLES[0][0]
+    database_id = upload_db(module, cpi_db)["database_id"]
+    assert not ask(client, database_id, question)["cached"]
+    assert ask(client, database_id, question)["cached"]
+
+    # Uploading a different database evicts the first one and its cached answers.
+    other = str(tmp_path / "other.db")
+    make_cpi_db(other, years=range(2020, 2025))
+    upload_db(module, other)
+    assert module.result_cache.stats()["size"] == 0
+
+
+def test_async_lookup_does_not_block_the_event_loop(stub_app, cpi_db):
+    module = stub_app("app.py")
+    database_id = upload_db(module, cpi_db)["database_id"]
+
+    def slow_embed(text):
+        time.sleep(0.2)  # a network round trip
+        return hashed_embedding(text)
+    module.result_cache.embed = slow_embed
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        body, status = await module.ask_question_async({"database_id": database_id,
+                                                        "question": SEED_EXAMPLES[0][0], "history": []})
+        task.cancel()
+        return body, status, ticks
+
+    body, status, ticks = asyncio.run(run())
+    assert status == 200 and not body["cached"]
+    # A lookup and a store, 0.2s each, while the loop kept ticking.
+    assert ticks >= 20
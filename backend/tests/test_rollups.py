@@ -0,0 +1,45 @@
+import pytest
+
+from functions.rollups import ROLLUP_SCHEMA, RollupSet
+from functions.sqlite_engine import ReadOnlyEngine
+
+
+@pytest.fixture(scope="module")
+def rollups(cpi_db, tmp_path_factory):
+    rollups = RollupSet(str(tmp_path_factory.mktemp("rollups") / "rollups.db"))
+    assert rollups.load_or_build(cpi_db, "test")
+    return rollups
+
+
+@pytest.fixture(scope="module")
+def engines(cpi_db, rollups):
+    raw, attached = ReadOnlyEngine(cpi_db), ReadOnlyEngine(cpi_db, attach={ROLLUP_SCHEMA: rollups.path})
+    yield raw, attached
+    raw.close()
+    attached.close()
+
+
+@pytest.mark.parametrize("sql", [
+    'SELECT State, MAX("Index") AS peak, COUNT(*) FROM data WHERE Sector = \'Rural\' '
+    "GROUP BY State ORDER BY peak DESC LIMIT 5;",
+    'SELECT "Group", MIN("Inflation (%)"), MAX("Inflation (%)") FROM data WHERE State = \'Kerala\' GROUP BY "Group"',
+    'SELECT Year, COUNT("Inflation (%)") FROM data GROUP BY Year HAVING COUNT(*) > 10 ORDER BY Year',
+])
+def test_rewritten_results_are_identical(rollups, engines, sql):
+    raw, attached = engines
+    rewritten = rollups.rewrite(sql)
+
+    assert rewritten is not None and ROLLUP_SCHEMA in rewritten
+    assert attached.execute(rewritten) == raw.execute(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    'SELECT Year, AVG("Inflation (%)") FROM data GROUP BY Year',
+    'SELECT State, ROUND(AVG("Index"), 2) AS idx FROM data GROUP BY State ORDER BY idx DESC LIMIT 5',
+    'SELECT Year, SUM("Index") FROM data GROUP BY Year',
+    'SELECT Year, TOTAL("Index") FROM data GROUP BY Year',
+    'SELECT SubGroup, MAX("Index") FROM data GROUP BY SubGroup',
+    'SELECT State, "Index" FROM data WHERE Year = 2024',
+])
+def test_inexact_or_unsupported_queries_are_not_rewritten(rollups, sql):
+    assert rollups.rewrite(sql) is None
@@ -0,0 +1,58 @@
+import pytest
+
+from functions.sql_repair import SqlRepairer, first_statement
+from functions.sqlite_engine import ReadOnlyEngine
+
+
+@pytest.fixture(scope="module")
+def repairer(cpi_db):
+    engine = ReadOnlyEngine(cpi_db)
+    yield SqlRepairer(engine)
+    engine.close()
+
+
+@pytest.mark.parametrize("generated, statement", [
+    ('SELECT State, MAX("Index") FROM data GROUP BY State\n\nThis query returns the highest index per state.',
+     'SELECT State, MAX("Index") FROM data GROUP BY State'),
+    ('SELECT State, MAX("Index") FROM data GROUP BY State\nThis query returns the highest index per state.',
+     'SELECT State, MAX("Index") FROM data GROUP BY State'),
+    ("SELECT COUNT(*) FROM data\nExplanation: counts every row.", "SELECT COUNT(*) FROM data"),
+    ("Here is the query with the yearly filter:\nSELECT COUNT(*) FROM data WHERE Year = 2024",
+     "SELECT COUNT(*) FROM data WHERE Year = 2024"),
+    ("With this filter:\nSELECT COUNT(*) FROM data WHERE Year = 2024", "SELECT COUNT(*) FROM data WHERE Year = 2024"),
+    ("Query: SELECT COUNT(*) FROM data;", "SELECT COUNT(*) FROM data;"),
+    # Multi-line statements survive, including a CTE and an alias line.
+    ("WITH yearly AS (\n  SELECT Year, AVG(\"Index\") AS idx FROM data GROUP BY Year\n)\n"
+     "SELECT Year, idx\nFROM yearly\nORDER BY Year;\nDone.",
+     "WITH yearly AS (\n  SELECT Year, AVG(\"Index\") AS idx FROM data GROUP BY Year\n)\n"
+     "SELECT Year, idx\nFROM yearly\nORDER BY Year;"),
+    ("SELECT State\nFROM data d\nWHERE d.Year = 2024", "SELECT State\nFROM data d\nWHERE d.Year = 2024"),
+])
+def test_first_statement(generated, statement):
+    assert first_statement(generated) == statement
+
+
+@pytest.mark.parametrize("generated", [
+    'SELECT State, MAX("Index") FROM data GROUP BY State\n\nThis query returns the highest index per state.',
+    "Here is the query with the yearly filter:\nSELECT COUNT(*) FROM data WHERE Year = 2024",
+])
+def test_prose_around_the_query_is_repaired(repairer, generated):
+    repair = repairer.repair(generated)
+
+    assert repair["error"] is None
+    assert repair["avoided_retry"]
+    assert repair["fixes"] == ["extracted statement"]
+
+
+def test_compiling_sql_is_returned_untouched(repairer):
+    sql = "SELECT Year, AVG('Inflation (%)') FROM data GROUP BY Year;"
+
+    assert repairer.repair(sql) == {"sql": sql, "fixes": [], "error": None, "avoided_retry": False}
+
+
+def test_unfixable_sql_reports_the_original_error(repairer):
+    repair = repairer.repair("SELECT Population FROM data;")
+
+    assert repair["sql"] == "SELECT Population FROM data;"
+    assert repair["error"] == "no such column: Population"
+    assert not repair["avoided_retry"]
@@ -0,0 +1,38 @@
+import pytest
+
+from functions.sqlite_engine import QueryLimitExceeded, ReadOnlyEngine
+
+# The apps' default QUERY_MAX_SCAN_ROWS.
+MAX_SCAN_ROWS = 100_000_000
+
+
+@pytest.fixture
+def engine(cpi_db):
+    engine = ReadOnlyEngine(cpi_db, pool_size=2, max_scan_rows=MAX_SCAN_ROWS)
+    yield engine
+    engine.close()
+
+
+@pytest.mark.parametrize("query", [
+    'SELECT State, AVG("Inflation (%)") AS avg_inflation FROM data GROUP BY State '
+    'HAVING avg_inflation > (SELECT AVG("Inflation (%)") FROM data)',
+    'SELECT COUNT(*) FROM data WHERE State IN (SELECT State FROM data WHERE Year = 2024)',
+    'SELECT Year, Month FROM data WHERE Year = 2023 UNION ALL SELECT Year, Month FROM data WHERE Year = 2024',
+    'WITH a AS (SELECT State, AVG("Inflation (%)") AS i FROM data GROUP BY State), '
+    'b AS (SELECT State, MAX("Inflation (%)") AS m FROM data GROUP BY State) '
+    'SELECT a.State, i, m FROM a JOIN b ON a.State = b.State',
+])
+def test_scans_outside_one_join_loop_are_not_multiplied(engine, query):
+    _, rows, _ = engine.execute(query, max_rows=10)
+    assert rows
+
+
+def test_cross_join_of_full_scans_is_rejected(engine):
+    with pytest.raises(QueryLimitExceeded) as excinfo:
+        engine.execute("SELECT COUNT(*) FROM data a, data b")
+    assert excinfo.value.limit == "scan_rows"
+
+
+def test_cross_join_inside_a_subquery_is_rejected(engine):
+    with pytest.raises(QueryLimitExceeded):
+        engine.execute("SELECT Year FROM data WHERE Year IN (SELECT a.Year FROM data a, data b)")
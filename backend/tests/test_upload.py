@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+from benchmarks.common import upload_db
+
+
+def make_shop_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, city TEXT)")
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER, total REAL)")
+    conn.executemany("INSERT INTO customers VALUES (?, ?, ?)", [(i, f"customer {i}", "Pune") for i in range(10)])
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?)", [(i, i % 10, i * 1.5) for i in range(40)])
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.parametrize("filename", ["app.py", "agentic-app.py"])
+def test_upload_without_a_data_table(stub_app, tmp_path, filename):
+    module = stub_app(filename)
+    path = str(tmp_path / "shop.db")
+    make_shop_db(path)
+    database_id = upload_db(module, path)["database_id"]
+    sample = module.databases.get(database_id).schema["sample_data"]
+    assert sample.startswith("customers: [(0, 'customer 0', 'Pune')")
+    assert "\norders: [(0, 0, 0.0)" in sample
+
+
+@pytest.mark.parametrize("filename", ["app.py", "agentic-app.py"])
+def test_upload_without_tables_is_rejected(stub_app, tmp_path, filename):
+    module = stub_app(filename)
+    path = tmp_path / "empty.db"
+    sqlite3.connect(path).execute("PRAGMA user_version = 1").connection.close()
+    with open(path, "rb") as f:
+        response = module.app.test_client().post("/api/upload", data={"file": (f, "empty.db")},
+                                                 content_type="multipart/form-data")
+    assert response.status_code == 400
+    assert "no tables" in response.get_json()["error"]
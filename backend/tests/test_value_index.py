@@ -0,0 +1,37 @@
+import pytest
+
+from functions.value_index import ValueIndex
+
+
+@pytest.fixture(scope="module")
+def values(cpi_db):
+    return ValueIndex.from_database(cpi_db)
+
+
+def resolved(values, question):
+    return sorted(match["value"] for match in values.resolve(question))
+
+
+@pytest.mark.parametrize("question", [
+    "Show the trend of inflation over the years",
+    "what may cause higher prices",
+    "how did prices go up in 2024",
+    "prices in tn",
+])
+def test_ordinary_words_are_not_values(values, question):
+    assert resolved(values, question) == []
+
+
+@pytest.mark.parametrize("question, expected", [
+    # The few-shot examples in original.py
+    ("show data for andhra, tn, up in october 2024", ["Andhra Pradesh", "October", "Tamil Nadu", "Uttar Pradesh"]),
+    ("show results from oct, nov, dec 2024", ["December", "November", "October"]),
+    ("compare food and fuel inflation in combined sector",
+     ["Combined", "Food and Beverages", "Fuel and Light", "Fuel and Light"]),
+    ("prices in TN", ["Tamil Nadu"]),
+    ("inflation in may 2024", ["May"]),
+    ("May inflation by state", ["May"]),
+    ("oils and fats inflation", ["Oils and Fats"]),
+])
+def test_mentions_resolve_to_stored_values(values, question, expected):
+    assert resolved(values, question) == expected
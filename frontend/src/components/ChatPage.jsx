@@ -6,37 +6,83 @@ function ChatPage() {
     const [messages, setMessages] = useState([]);
     const [loading, setLoading] = useState(false);
   
+    // Parse a newline-delimited JSON response as it arrives.
+    const readNdjson = async (res, onEvent) => {
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+      }
+      if (buffer.trim()) onEvent(JSON.parse(buffer));
+    };
+
+    const updateResponse = (id, update) => {
+      setMessages(prev => prev.map(m => (m.id === id ? update(m) : m)));
+    };
+
     const handleSubmit = async (e) => {
       e.preventDefault();
       if (!inputMessage.trim() || loading) return;
   
       setLoading(true);
+      const question = inputMessage;
+      const responseId = Date.now();
       try {
-        const res = await fetch('http://localhost:5000/api/ask', {
+        const res = await fetch('http://localhost:5000/api/ask/stream', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ 
-            question: inputMessage,
+            database_id: sessionStorage.getItem('databaseId'),
+            question: question,
             history: messages.filter(m => m.type === 'user').map(m => m.content) 
           }),
         });
         
-        const data = await res.json();
-        if (!res.ok) throw new Error(data.error);
-        console.log(data.result);
-        setMessages(prev => [
-          ...prev,
-          {
-            type: 'user',
-            content: inputMessage,
-          },
-          {
-            type: 'system',
-            sql: data.sql_query,
-            result: data.result,
+        if (!res.ok) {
+          const data = await res.json();
+          throw new Error(data.error);
+        }
+
+        // Rows are rendered batch by batch as the server streams them.
+        await readNdjson(res, (event) => {
+          if (event.type === 'meta') {
+            setMessages(prev => [
+              ...prev,
+              {
+                type: 'user',
+                content: question,
+              },
+              {
+                type: 'system',
+                id: responseId,
+                sql: event.sql_query,
+                result: { columns: event.columns, data: [] },
+              }
+            ]);
+            setInputMessage('');
+          } else if (event.type === 'rows') {
+            updateResponse(responseId, m => ({
+              ...m,
+              result: { ...m.result, data: [...m.result.data, ...event.rows] },
+            }));
+          } else if (event.type === 'end') {
+            updateResponse(responseId, m => ({
+              ...m,
+              result: { ...m.result, truncated: event.truncated },
+            }));
+          } else if (event.type === 'error') {
+            updateResponse(responseId, m => ({
+              ...m,
+              result: { ...m.result, error: event.error },
+            }));
           }
-        ]);
-        setInputMessage('');
+        });
       } catch (err) {
         alert(err.message || 'Error processing question');
       } finally {
@@ -92,7 +138,12 @@ function ChatPage() {
                             </table>
                             ) : (
                             <div className="no-columns-warning">
-                                No column information available
+                                {message.result.error || 'No column information available'}
+                            </div>
+                        )}
+                        {message.result.truncated && (
+                            <div className="no-columns-warning">
+                                Showing the first {message.result.data.length} rows; the result was truncated.
                             </div>
                         )}
                         </div>
@@ -17,6 +17,8 @@ function UploadPage() {
         });
         const data = await res.json();
         if (res.ok) {
+          // Every upload gets its own database on the server; questions must reference it.
+          sessionStorage.setItem('databaseId', data.database_id);
           navigate('/chat');
         }
         alert(data.message || data.error);
@@ -33,7 +35,7 @@ function UploadPage() {
             <input 
               type="file" 
               onChange={(e) => setFile(e.target.files[0])} 
-              accept=".db" 
+              accept=".db,.csv,.tsv,.parquet" 
             />
           </div>
           <button type="submit" className="upload-button">
@@ -7,7 +7,6 @@ function ChatPage() {
   const [inputMessage, setInputMessage] = useState('');
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
-  const thinkingIntervalRef = useRef(null);
   const messageEndRef = useRef(null);
 
   // Scroll to bottom when messages change
@@ -26,6 +25,33 @@ function ChatPage() {
       }));
   };
 
+  // Parse a server-sent event stream as it arrives.
+  const readEvents = async (res, onEvent) => {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const blocks = buffer.split('\n\n');
+      buffer = blocks.pop();
+      blocks.forEach(block => {
+        const event = block.match(/^event: (.*)$/m);
+        const data = block.match(/^data: (.*)$/m);
+        if (event && data) onEvent(event[1], JSON.parse(data[1]));
+      });
+    }
+  };
+
+  // Show what the agent is doing in place of the previous progress message.
+  const showProgress = (content) => {
+    setMessages(prev => [
+      ...prev.filter(m => m.type !== 'thinking'),
+      { type: 'thinking', content, id: Date.now() }
+    ]);
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     if (!inputMessage.trim() || loading) return;
@@ -41,55 +67,53 @@ function ChatPage() {
     setInputMessage('');
 
     try {
-      // Start a simple "thinking" animation (only shows a generic message)
-      let thinkingStep = 0;
-      thinkingIntervalRef.current = setInterval(() => {
-        thinkingStep = (thinkingStep % 3) + 1;
-        setMessages(prev => {
-          // Remove any previous thinking message
-          const filtered = prev.filter(m => m.type !== 'thinking');
-          return [
-            ...filtered,
-            { type: 'thinking', content: `Analyzing${'.'.repeat(thinkingStep)}`, id: Date.now() }
-          ];
-        });
-      }, 500);
-
-      const res = await fetch('http://localhost:5000/api/ask', {
+      showProgress('Analyzing...');
+      const res = await fetch('http://localhost:5000/api/ask/events', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
+          database_id: sessionStorage.getItem('databaseId'),
           question: inputMessage,
           history: getConversationHistory()
         }),
       });
 
-      const data = await res.json();
-      if (!res.ok) throw new Error(data.error);
-
-      // Final answer received: remove thinking messages.
-      clearInterval(thinkingIntervalRef.current);
-      setMessages(prev => prev.filter(m => m.type !== 'thinking'));
-
-      // Create a system message that includes:
-      // - Generated SQL (to be rendered as Markdown)
-      // - Query result (if any)
-      // - Explanation (Markdown)
-      // - Intermediate reasoning details (hidden by default; toggled via button)
-      const newSystemMessage = {
-        type: 'system',
-        id: Date.now(),
-        sql: data.sql_query,
-        result: data.result,
-        explanation: data.explanation,
-        // Hide the detailed chain-of-thought by default.
-        reasoning: data.reasoning || [],
-        showDetails: false 
-      };
-
-      setMessages(prev => [...prev, newSystemMessage]);
+      if (!res.ok) {
+        const data = await res.json();
+        throw new Error(data.error);
+      }
+
+      // The answer replaces the progress messages as soon as the SQL result is
+      // final; the explanation is then filled in token by token.
+      // Intermediate reasoning stays hidden by default (toggled via button).
+      const responseId = Date.now();
+      let failure = null;
+      await readEvents(res, (event, data) => {
+        if (event === 'node' && data.reasoning.length > 0) {
+          showProgress(data.reasoning[data.reasoning.length - 1]);
+        } else if (event === 'answer') {
+          setMessages(prev => [
+            ...prev.filter(m => m.type !== 'thinking'),
+            {
+              type: 'system',
+              id: responseId,
+              sql: data.sql_query,
+              result: data.result,
+              explanation: '',
+              reasoning: data.reasoning || [],
+              showDetails: false
+            }
+          ]);
+        } else if (event === 'explanation') {
+          setMessages(prev => prev.map(msg =>
+            msg.id === responseId ? { ...msg, explanation: msg.explanation + data.delta } : msg
+          ));
+        } else if (event === 'error') {
+          failure = data.error;
+        }
+      });
+      if (failure) throw new Error(failure);
     } catch (err) {
-      clearInterval(thinkingIntervalRef.current);
       setMessages(prev => [
         ...prev.filter(m => m.type !== 'thinking'),
         { type: 'system', content: `Error: ${err.message}`, id: Date.now() }